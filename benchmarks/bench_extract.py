@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение разбора страниц новостей ЧелГУ: прежний путь через BeautifulSoup и find по классам
+против lxml с заранее скомпилированными XPath (parser/article_extractor.py), плюс пакетный
+разбор сохранённых страниц пулом процессов.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_extract [data/raw_html]
+
+Без аргументов разбираются сгенерированные страницы в разметке SharePoint сайта csu.ru:
+статья с навигацией, скриптами и подвалом вокруг контейнера WebPartWPQ1 и страница списка.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from parser.article_extractor import (
+    extract_news_fields, extract_news_fields_bs4, extract_news_links, extract_news_links_bs4,
+    reprocess_raw_html, save_raw_html,
+)
+
+REPEATS = 50
+BULK_PAGES = 400
+
+
+def _page_chrome(body: str) -> str:
+    menu = ''.join(f'<li><a href="/section{i}/Pages/default.aspx">Раздел сайта {i}</a>'
+                   f'<ul>{"".join(f"<li><a href=/s{i}/p{j}.aspx>Подраздел {j}</a></li>" for j in range(12))}</ul></li>'
+                   for i in range(25))
+    scripts = ''.join(f'<script type="text/javascript">var g_config{i} = {{"a": {i}, "b": "{"x" * 200}"}};</script>'
+                      for i in range(30))
+    footer = ''.join(f'<div class="footer-col"><p>Контакты, адреса и телефоны подразделений {i}</p></div>'
+                     for i in range(20))
+    return (
+        '<!DOCTYPE html><html><head><title>Новости ЧелГУ</title>'
+        f'<link rel="stylesheet" href="/style.css"/>{scripts}</head>'
+        f'<body><form><div class="s4-workspace"><nav><ul>{menu}</ul></nav>'
+        f'<div class="news-rowfield news-header">Заголовок в шапке</div>{body}'
+        f'<footer>{footer}</footer></div></form></body></html>'
+    )
+
+
+def build_article(i: int) -> str:
+    paragraphs = ''.join(f'<p>Абзац {j} новости {i}: в Челябинском государственном университете прошла '
+                         f'конференция, <b>студенты</b> и преподаватели обсудили <a href="#">итоги</a> года.</p>'
+                         for j in range(15))
+    body = (
+        f'<div id="WebPartWPQ1"><table><tbody><tr><td>Служебная строка</td></tr><tr><td>'
+        f'<div class="news-rowfield news-header">  Новость номер {i}  </div>'
+        f'<div class="news-rowfield news-date">12.12.2024</div>'
+        f'<div class="img-container"><span><img src="/PublishingImages/news{i}.jpg" alt=""/></span></div>'
+        f'<div class="news-rowfield p-leader"><p>Лид новости {i}.</p></div>'
+        f'<div class="news-rowfield p-content">{paragraphs}</div>'
+        f'</td></tr></tbody></table></div>'
+    )
+    return _page_chrome(body)
+
+
+def build_list_page() -> str:
+    items = ''.join(
+        f'<div class="nlist-full"><div class="nlist-img"><a href="/news/Pages/newsitem{i}.aspx"><img src="/i{i}.jpg"/></a></div>'
+        f'<div class="nlist-text"><a href="/news/Pages/newsitem{i}.aspx">Новость {i}</a><a href="/tags/t{i}">тег</a></div></div>'
+        for i in range(10)
+    )
+    return _page_chrome(items)
+
+
+def measure(name: str, func, repeats: int = REPEATS) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    elapsed = (time.perf_counter() - started) / repeats
+    print(f"  {name:<38} {elapsed * 1000:8.3f} мс")
+    return elapsed
+
+
+def run_pages(pages):
+    for label, html in pages:
+        print(f"{label} ({len(html.encode('utf-8')) / 1024:.0f} КБ)")
+        expected = extract_news_fields_bs4(html, label)
+        actual = extract_news_fields(html, label)
+        assert actual == expected, f"Результаты разбора различаются:\n{expected}\n{actual}"
+        bs4_time = measure("BeautifulSoup + find", lambda: extract_news_fields_bs4(html, label))
+        lxml_time = measure("lxml + скомпилированные XPath", lambda: extract_news_fields(html, label))
+        print(f"  ускорение x{bs4_time / lxml_time:.1f}\n")
+
+
+def run_list_page():
+    html = build_list_page()
+    print(f"Страница списка ({len(html.encode('utf-8')) / 1024:.0f} КБ)")
+    assert extract_news_links(html, '') == extract_news_links_bs4(html, '')
+    bs4_time = measure("BeautifulSoup find_all", lambda: extract_news_links_bs4(html, ''))
+    lxml_time = measure("lxml XPath", lambda: extract_news_links(html, ''))
+    print(f"  ускорение x{bs4_time / lxml_time:.1f}\n")
+
+
+def run_bulk(raw_dir: str):
+    count = len([name for name in os.listdir(raw_dir) if name.endswith('.html.gz')])
+    print(f"Пакетный разбор {count} сохранённых страниц")
+    for workers in (1, None):
+        started = time.perf_counter()
+        reprocess_raw_html(raw_dir, workers=workers)
+        elapsed = time.perf_counter() - started
+        label = "1 процесс" if workers == 1 else f"пул процессов ({os.cpu_count()})"
+        print(f"  {label:<38} {elapsed:8.2f} с, {count / elapsed:8.0f} стр/с")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        raw_dir = sys.argv[1]
+        run_bulk(raw_dir)
+    else:
+        run_pages([(f"Статья {i}", build_article(i)) for i in range(2)])
+        run_list_page()
+        raw_dir = tempfile.mkdtemp(prefix='bench_extract_')
+        try:
+            for i in range(BULK_PAGES):
+                save_raw_html(raw_dir, f'{i:06d}', f'https://www.csu.ru/news/Pages/newsitem{i}.aspx', build_article(i))
+            run_bulk(raw_dir)
+        finally:
+            shutil.rmtree(raw_dir)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение обычного декодирования с спекулятивным (черновая модель предлагает токены,
+основная проверяет их за один проход) на фиксированном наборе ответов чата и поисковых запросов.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_speculative --device cpu --draft Qwen/Qwen2.5-0.5B-Instruct
+
+Декодирование жадное, поэтому ответы обоих режимов должны совпадать токен в токен;
+для каждого набора печатаются токены/с, ускорение и доля принятых черновых токенов.
+С int8-квантизацией на CPU возможны редкие расхождения: масштаб активаций считается
+по всему проходу, а основная модель проверяет несколько токенов сразу (--no-int8 для точного сравнения).
+"""
+
+import argparse
+import dataclasses
+import logging
+import time
+
+from models.local_ml import SEARCH_QUERY_PARAMS, GenerationParams, MLModel, ModelConfig
+from models.message import ChatMessage
+
+QUESTIONS = [
+    "Какие документы нужны для поступления в ЧелГУ?",
+    "Когда начинается приёмная кампания в бакалавриат?",
+    "Есть ли в университете общежитие для иногородних студентов?",
+    "Какие направления подготовки есть на факультете информационных технологий?",
+    "Как записаться на подготовительные курсы к ЕГЭ?",
+]
+
+CONTEXT = (
+    "Челябинский государственный университет объявляет приём документов на программы бакалавриата, "
+    "специалитета и магистратуры. Подать заявление можно лично в приёмной комиссии или через Госуслуги. "
+    "Иногородним студентам предоставляется место в общежитии."
+)
+
+
+def greedy(params: GenerationParams, max_new_tokens: int) -> GenerationParams:
+    return dataclasses.replace(params, max_new_tokens=max_new_tokens, do_sample=False)
+
+
+def measure(name: str, ml_model: MLModel, prompts, params: GenerationParams, assisted: bool):
+    draft_model, draft_counter = ml_model.draft_model, ml_model.draft_counter
+    if not assisted:
+        ml_model.draft_model, ml_model.draft_counter = None, None
+    try:
+        before = draft_counter.stats()
+        outputs, tokens = [], 0
+        started = time.perf_counter()
+        for inputs in prompts:
+            token_ids = ml_model._generate_serial(inputs, params)
+            outputs.append(token_ids)
+            tokens += len(token_ids)
+        elapsed = time.perf_counter() - started
+        after = draft_counter.stats()
+    finally:
+        ml_model.draft_model, ml_model.draft_counter = draft_model, draft_counter
+
+    drafted = after["drafted"] - before["drafted"]
+    accepted = after["accepted"] - before["accepted"]
+    line = f"  {name:<16} {tokens:5d} токенов за {elapsed:7.2f} с   {tokens / elapsed:6.1f} токенов/с"
+    if assisted:
+        line += f"   принято {accepted}/{drafted} черновых ({accepted / max(drafted, 1):.0%})"
+    print(line)
+    return outputs, elapsed
+
+
+def run(label: str, ml_model: MLModel, prompts, params: GenerationParams):
+    print(f"{label}: {len(prompts)} промптов, до {params.max_new_tokens} новых токенов")
+    baseline, baseline_time = measure("обычное", ml_model, prompts, params, assisted=False)
+    speculative, speculative_time = measure("спекулятивное", ml_model, prompts, params, assisted=True)
+    same = sum(a == b for a, b in zip(baseline, speculative))
+    print(f"  ускорение x{baseline_time / speculative_time:.2f}, совпало ответов {same} из {len(prompts)}\n")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    arg_parser = argparse.ArgumentParser(description='Спекулятивное декодирование против обычного')
+    arg_parser.add_argument('--device', choices=['auto', 'cuda', 'cpu'], default='auto')
+    arg_parser.add_argument('--model', default=None, help='Основная модель вместо model_id/cpu_model_id из ModelConfig')
+    arg_parser.add_argument('--draft', default='Qwen/Qwen2.5-0.5B-Instruct')
+    arg_parser.add_argument('--assistant-tokens', type=int, default=5)
+    arg_parser.add_argument('--new-tokens', type=int, default=128)
+    arg_parser.add_argument('--no-int8', action='store_true', help='Не квантовать модели на CPU')
+    args = arg_parser.parse_args()
+
+    config = ModelConfig(
+        device=args.device,
+        draft_model_id=args.draft,
+        num_assistant_tokens=args.assistant_tokens,
+        startup_benchmark=False,
+        cpu_quantize_int8=not args.no_int8
+    )
+    if args.model:
+        config.model_id = config.cpu_model_id = args.model
+    ml_model = MLModel(config)
+    ml_model.initialize()
+    # Прогрев обеих моделей, чтобы первый замер не включал ленивую инициализацию
+    ml_model._generate_serial(ml_model._search_query_inputs(QUESTIONS[0]), greedy(SEARCH_QUERY_PARAMS, 8))
+
+    chat_prompts = [
+        ml_model._prepare_inputs([ChatMessage(role="user", content=question)], CONTEXT)
+        for question in QUESTIONS
+    ]
+    run("Ответы чата", ml_model, chat_prompts, greedy(ml_model.chat_params, args.new_tokens))
+
+    query_prompts = [ml_model._search_query_inputs(question) for question in QUESTIONS]
+    run("Поисковые запросы", ml_model, query_prompts, greedy(SEARCH_QUERY_PARAMS, SEARCH_QUERY_PARAMS.max_new_tokens))
+    ml_model.cleanup()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение прежнего разбора ответа Yandex XML (полное дерево ElementTree и обход //doc)
+с потоковым iter_parse_xml_data(limit=3), как его использует get_search_context.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_xml_parse [записанные_ответы.xml ...]
+
+Без аргументов разбираются сгенерированные ответы на 10, 50 и 100 документов
+в формате выдачи Яндекса (groupby=attr,,doc, по одному пассажу).
+"""
+
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from helpers.researchAPIv1 import _doc_to_result, iter_parse_xml_data
+
+REPEATS = 200
+LIMIT = 3
+
+
+def build_fixture(docs: int) -> str:
+    groups = []
+    for i in range(docs):
+        passage = ' '.join(['Челябинский государственный университет объявляет приём документов'] * 8)
+        groups.append(
+            f'<group><categ attr="d" name="csu.ru"/><doccount>1</doccount><relevance/>'
+            f'<doc id="{i:032x}"><relevance/><url>https://www.csu.ru/news/Pages/newsitem{i}.aspx</url>'
+            f'<domain>www.csu.ru</domain><title>Новость <hlword>ЧелГУ</hlword> номер {i}</title>'
+            f'<headline>Краткое содержание новости {i}</headline><modtime>20241213T102914</modtime>'
+            f'<size>{10000 + i}</size><charset>utf-8</charset>'
+            f'<passages><passage>{passage} <hlword>поступление</hlword></passage></passages>'
+            f'<properties><_PassagesType>0</_PassagesType><lang>ru</lang></properties>'
+            f'<mime-type>text/html</mime-type></doc></group>'
+        )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?><yandexsearch version="1.0"><request><query>ЧелГУ</query></request>'
+        '<response date="20241213T102914"><reqid>1</reqid><found priority="all">100000</found><results>'
+        '<grouping attr="d" mode="deep" groups-on-page="100" docs-in-group="1" curcateg="-1">'
+        f'{"".join(groups)}</grouping></results></response></yandexsearch>'
+    )
+
+
+def parse_full_tree(xml_string):
+    root = ET.fromstring(xml_string)
+    return [_doc_to_result(doc) for doc in root.findall('.//doc')]
+
+
+def measure(name: str, func, xml: str):
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        func(xml)
+    elapsed = (time.perf_counter() - started) / REPEATS
+
+    tracemalloc.start()
+    func(xml)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"  {name:<30} {elapsed * 1000:8.3f} мс   пик памяти {peak / 1024:8.1f} КБ")
+    return elapsed, peak
+
+
+def run(label: str, xml: str):
+    print(f"{label} ({len(xml.encode('utf-8')) / 1024:.0f} КБ)")
+    full_time, full_peak = measure("ElementTree целиком", parse_full_tree, xml)
+    measure("iter_parse_xml_data (все doc)", lambda data: list(iter_parse_xml_data(data)), xml)
+    stream_time, stream_peak = measure(
+        f"iter_parse_xml_data(limit={LIMIT})",
+        lambda data: list(iter_parse_xml_data(data, limit=LIMIT)),
+        xml
+    )
+    print(f"  ускорение x{full_time / stream_time:.1f}, памяти меньше в x{full_peak / max(stream_peak, 1):.1f}\n")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            with open(path, 'r', encoding='utf-8') as f:
+                run(path, f.read())
+    else:
+        for docs in (10, 50, 100):
+            run(f"{docs} документов", build_fixture(docs))
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from models.query_rewriter import normalize_message
+from retrieval.encoder import TextEncoder
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    expires_at: float
+    slot: int
+    nbytes: int
+
+
+@dataclass
+class AnswerLookup:
+    key: str
+    answer: Optional[str] = None
+    vector: Optional[np.ndarray] = None
+    similarity: float = 0.0
+
+
+def normalize_question(text: str) -> str:
+    """
+    Ключ точного совпадения: слова в нижнем регистре без пунктуации.
+    Вопросительные слова и "не" остаются: "Когда приём документов?" и "Где приём документов?" - разные вопросы
+    """
+    return normalize_message(text)
+
+
+class AnswerCache:
+    """
+    Кэш готовых ответов на первые вопросы диалога (без истории).
+    Сначала ищется точное совпадение нормализованного текста, затем ближайший по косинусу
+    эмбеддинг вопроса выше min_similarity. Записи живут ttl_seconds и сбрасываются целиком,
+    когда обновляются новости; при превышении лимита записей или памяти вытесняются давно не использованные.
+    """
+    def __init__(self, encoder: Optional[TextEncoder] = None, max_entries: int = 1024,
+                 max_bytes: int = 64 * 2**20, ttl_seconds: float = 3600, min_similarity: float = 0.95):
+        self.encoder = encoder
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        # Эмбеддинги вопросов лежат строками одной матрицы, слот освобождается вместе с записью
+        self._vectors: Optional[np.ndarray] = None
+        self._slot_keys: List[Optional[str]] = [None] * max_entries
+        self._occupied = np.zeros(max_entries, dtype=bool)
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._total_bytes = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    async def get(self, question: str) -> AnswerLookup:
+        lookup = AnswerLookup(key=normalize_question(question))
+        now = time.time()
+        entry = self._entries.get(lookup.key)
+        if entry is not None and entry.expires_at > now:
+            self._entries.move_to_end(lookup.key)
+            self.exact_hits += 1
+            lookup.answer, lookup.similarity = entry.answer, 1.0
+            return lookup
+        if entry is not None:
+            self._remove(lookup.key)
+
+        if self.encoder is not None:
+            try:
+                lookup.vector = (await asyncio.to_thread(self.encoder.encode_queries, [question]))[0]
+            except Exception as e:
+                logger.error(f"Ошибка при кодировании вопроса для кэша ответов: {str(e)}")
+        if lookup.vector is not None and self._vectors is not None and self._entries:
+            # Просроченные записи не участвуют в выборе: иначе лучшая из них заслоняет живую выше порога
+            scores = np.where(self._occupied & (self._expires_at > now), self._vectors @ lookup.vector, -1.0)
+            slot = int(np.argmax(scores))
+            key = self._slot_keys[slot]
+            entry = self._entries.get(key) if key is not None else None
+            if entry is not None and scores[slot] >= self.min_similarity:
+                self._entries.move_to_end(key)
+                self.semantic_hits += 1
+                lookup.answer, lookup.similarity = entry.answer, float(scores[slot])
+                logger.info(f"Ответ из кэша по похожему вопросу ({lookup.similarity:.3f}): {key}")
+                return lookup
+
+        self.misses += 1
+        return lookup
+
+    def put(self, lookup: AnswerLookup, answer: str):
+        if not lookup.key or not answer:
+            return
+        self._remove(lookup.key)
+        nbytes = len(answer.encode('utf-8'))
+        if nbytes > self.max_bytes:
+            return
+        while self._entries and (not self._free_slots or self._total_bytes + nbytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+        slot = self._free_slots.pop()
+        if lookup.vector is not None:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(lookup.vector)), dtype=np.float32)
+            self._vectors[slot] = lookup.vector
+        elif self._vectors is not None:
+            self._vectors[slot] = 0.0
+        self._slot_keys[slot] = lookup.key
+        self._occupied[slot] = True
+        expires_at = time.time() + self.ttl_seconds
+        self._expires_at[slot] = expires_at
+        self._entries[lookup.key] = CachedAnswer(answer, expires_at, slot, nbytes)
+        self._total_bytes += nbytes
+
+    def invalidate(self):
+        """Сбрасывает все ответы: обновились новости, на которых они основаны"""
+        if self._entries:
+            logger.info(f"Кэш ответов сброшен: {len(self._entries)} записей")
+        for key in list(self._entries):
+            self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._slot_keys[entry.slot] = None
+        self._occupied[entry.slot] = False
+        self._free_slots.append(entry.slot)
+        self._total_bytes -= entry.nbytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "memory_mb": round((self._total_bytes + (self._vectors.nbytes if self._vectors is not None else 0)) / 2**20, 2),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses
+        }
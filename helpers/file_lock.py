@@ -0,0 +1,45 @@
+import os
+from typing import IO, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def try_lock(lock_file: IO) -> bool:
+    """Неблокирующая эксклюзивная блокировка открытого файла, снимается при его закрытии или смерти процесса"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def wait_lock(lock_file: IO):
+    """Блокирующий вариант try_lock: ждёт, пока другой процесс снимет блокировку"""
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    else:
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def acquire_lock_file(path: str, blocking: bool = False) -> Optional[IO]:
+    """Открывает и блокирует файл; None - блокировку держит другой процесс (только без blocking)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    lock_file = open(path, 'a')
+    if blocking:
+        try:
+            wait_lock(lock_file)
+        except OSError:
+            lock_file.close()
+            raise
+        return lock_file
+    if try_lock(lock_file):
+        return lock_file
+    lock_file.close()
+    return None
@@ -0,0 +1,168 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from models.news_item import NewsItem, make_news_id
+from parser.data_handler import DataHandler
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_LENGTH = 300
+PAGE_CACHE_SIZE = 256
+
+MONTHS = {
+    'января': 1, 'февраля': 2, 'марта': 3, 'апреля': 4, 'мая': 5, 'июня': 6,
+    'июля': 7, 'августа': 8, 'сентября': 9, 'октября': 10, 'ноября': 11, 'декабря': 12,
+}
+
+
+def parse_news_date(text: str) -> date:
+    """Разбирает дату новости с сайта ЧелГУ, нераспознанные даты уходят в конец ленты"""
+    text = text.strip().lower()
+    match = re.search(r'(\d{1,2})\.(\d{1,2})\.(\d{4})', text)
+    if match:
+        day, month, year = map(int, match.groups())
+    else:
+        match = re.search(r'(\d{1,2})\s+([а-я]+)\s+(\d{4})', text)
+        if match and match.group(2) in MONTHS:
+            day, month, year = int(match.group(1)), MONTHS[match.group(2)], int(match.group(3))
+        else:
+            match = re.search(r'(\d{4})-(\d{2})-(\d{2})', text)
+            if not match:
+                return date.min
+            year, month, day = map(int, match.groups())
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return date.min
+
+
+def summarize(text: str, length: int = SUMMARY_LENGTH) -> str:
+    if len(text) <= length:
+        return text
+    cut = text.rfind(' ', 0, length)
+    return text[:cut if cut > 0 else length].rstrip(' ,.;:') + '…'
+
+
+@dataclass
+class NewsSnapshot:
+    # Новости отсортированы по дате от свежих к старым
+    items: List[NewsItem] = field(default_factory=list)
+    summaries: List[str] = field(default_factory=list)
+    by_id: Dict[str, int] = field(default_factory=dict)
+    # Ключи -date.toordinal() по возрастанию - индекс для выборки диапазона дат бинарным поиском
+    date_keys: List[int] = field(default_factory=list)
+    etag: str = '"empty"'
+    version: int = 0
+    pages: Dict[tuple, bytes] = field(default_factory=dict)
+
+    def date_range(self, date_from: Optional[date], date_to: Optional[date]) -> Tuple[int, int]:
+        start = bisect.bisect_left(self.date_keys, -date_to.toordinal()) if date_to else 0
+        end = bisect.bisect_right(self.date_keys, -date_from.toordinal()) if date_from else len(self.date_keys)
+        return start, max(start, end)
+
+
+class NewsStore:
+    """
+    Новости в памяти процесса с заранее сериализованными страницами ответа для /api/news.
+    Журнал перечитывается только при смене mtime/размера или по сигналу парсера.
+    """
+    def __init__(self, storage: Optional[DataHandler] = None, check_interval: float = 1.0):
+        self.storage = storage or DataHandler()
+        self.path = self.storage.path
+        self.check_interval = check_interval
+        self._snapshot = NewsSnapshot()
+        self._file_state: Optional[Tuple[int, int]] = None
+        self._last_check = 0.0
+        self._dirty = True
+        self._lock = asyncio.Lock()
+
+    def notify_updated(self):
+        """Сигнал от парсера: данные на диске обновились"""
+        self._dirty = True
+
+    async def get(self) -> NewsSnapshot:
+        if self._needs_reload():
+            async with self._lock:
+                if self._needs_reload(force_stat=True):
+                    self._snapshot = await asyncio.to_thread(self._load)
+        return self._snapshot
+
+    async def page(self, offset: int = 0, limit: int = 20, date_from: Optional[date] = None,
+                   date_to: Optional[date] = None, summary: bool = True) -> Tuple[bytes, str, int]:
+        """Возвращает тело ответа, ETag и общее количество новостей под фильтром"""
+        snapshot = await self.get()
+        start, end = snapshot.date_range(date_from, date_to)
+        key = (offset, limit, date_from, date_to, summary)
+        body = snapshot.pages.get(key)
+        if body is None:
+            page = []
+            for index in range(start + offset, min(start + offset + limit, end)):
+                item = snapshot.items[index]
+                if summary:
+                    item = item.model_copy(update={'description': snapshot.summaries[index]})
+                page.append(item.model_dump())
+            body = json.dumps(page, ensure_ascii=False).encode('utf-8')
+            if len(snapshot.pages) >= PAGE_CACHE_SIZE:
+                snapshot.pages.pop(next(iter(snapshot.pages)))
+            snapshot.pages[key] = body
+
+        etag = f'"{snapshot.etag}-{hashlib.sha1(repr(key).encode()).hexdigest()[:8]}"'
+        return body, etag, end - start
+
+    async def get_item(self, news_id: str) -> Optional[NewsItem]:
+        snapshot = await self.get()
+        index = snapshot.by_id.get(news_id)
+        return snapshot.items[index] if index is not None else None
+
+    def _needs_reload(self, force_stat: bool = False) -> bool:
+        now = time.monotonic()
+        if not self._dirty and not force_stat and now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+        return self._dirty or self._stat() != self._file_state
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> NewsSnapshot:
+        # Состояние фиксируем до чтения: если файл поменяется во время загрузки, перечитаем ещё раз
+        self._dirty = False
+        self._file_state = self._stat()
+        news_data = self.storage.load()
+
+        items = []
+        for item in news_data:
+            url = item.get('url')
+            items.append((parse_news_date(item['date']), NewsItem(
+                id=make_news_id(url or item['title']),
+                title=item['title'],
+                date=item['date'],
+                relate_image_link=item['relate_image'],
+                description=item.get('content', 'Описание отсутствует'),
+                url=url
+            )))
+        items.sort(key=lambda pair: pair[0], reverse=True)
+
+        snapshot = NewsSnapshot(
+            items=[item for _, item in items],
+            summaries=[summarize(item.description) for _, item in items],
+            by_id={item.id: index for index, (_, item) in enumerate(items)},
+            date_keys=[-published.toordinal() for published, _ in items],
+            etag=hashlib.sha1(repr(self._file_state).encode()).hexdigest()[:16],
+            version=self._snapshot.version + 1
+        )
+        logger.info(f"Загружено новостей: {len(items)}")
+        return snapshot
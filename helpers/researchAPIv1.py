@@ -2,6 +2,7 @@ import base64
 
 import xml.etree.ElementTree as ET
 from http.client import HTTPException
+from typing import Iterator, Optional
 
 import requests
 
@@ -22,40 +23,70 @@ default_params  = {
 }
 
 
-def parse_xml_data(xml_string):
-    try:
-        root = ET.fromstring(xml_string)
-        results = []
+def _doc_to_result(doc):
+    url = doc.find('url').text
+    title_element = doc.find('title')
+    title = ''.join(title_element.itertext()) if title_element is not None else None
+    headline_element = doc.find('headline')
+    headline_element = ''.join(headline_element.itertext()) if headline_element is not None else None
+    headline = headline_element if headline_element is not None else None
+
+    return {
+        'headline': headline,
+        'url': url,
+        'title': title,
+    }
+
 
-        for doc in root.findall('.//doc'):
-            url = doc.find('url').text
-            title_element = doc.find('title')
-            title = ''.join(title_element.itertext()) if title_element is not None else None
-            headline_element = doc.find('headline')
-            headline_element = ''.join(headline_element.itertext()) if headline_element is not None else None
-            headline = headline_element if headline_element is not None else None
+def iter_parse_xml_data(xml_string, limit: Optional[int] = None, chunk_size: int = 16384) -> Iterator[dict]:
+    """Разбирает ответ потоково и отдаёт документы по мере закрытия <doc>, останавливаясь после limit штук"""
+    if limit is not None and limit <= 0:
+        return
 
-            results.append({
-                'headline': headline,
-                'url': url,
-                'title': title,
-            })
+    # Нужны только закрытия элементов: <doc> и его <group> к этому моменту разобраны целиком
+    parser = ET.XMLPullParser(events=('end',))
+    count = 0
+    # Кормим парсер кусками: после limit документов остаток ответа даже не читается
+    for offset in range(0, len(xml_string), chunk_size):
+        parser.feed(xml_string[offset:offset + chunk_size])
+        for _, element in parser.read_events():
+            tag = element.tag
+            if tag == 'doc':
+                yield _doc_to_result(element)
+                # Разобранный документ больше не нужен: очищаем его самого, а не корень -
+                # открытые предки держат ссылки на законченные <doc>, и root.clear() их не освобождал
+                element.clear()
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+            elif tag == 'group':
+                element.clear()
+    parser.close()
 
-        return results
+
+def parse_xml_data(xml_string, limit: Optional[int] = None):
+    try:
+        if limit is not None:
+            return list(iter_parse_xml_data(xml_string, limit=limit))
+
+        # Нужны все документы - дерево целиком строится быстрее потокового разбора
+        root = ET.fromstring(xml_string)
+        return [_doc_to_result(doc) for doc in root.findall('.//doc')]
 
     except requests.exceptions.RequestException as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при запросе к Яндексу: {str(e)}")
 
 
-def fetch_yandex_search_results(query: str):
+def fetch_yandex_search_results(query: str, dump_path: Optional[str] = None):
     try:
         params = default_params.copy()
         params["query"] = query
         response = requests.get(url_api, params=params)
         response.raise_for_status()
 
-        with open('output.xml', 'w', encoding='utf-8') as file:
-            file.write(response.text)
+        if dump_path:
+            with open(dump_path, 'w', encoding='utf-8') as file:
+                file.write(response.text)
 
         return response.text
     except requests.exceptions.RequestException as e:
@@ -0,0 +1,124 @@
+import re
+from functools import lru_cache
+from typing import List
+
+# Реализация алгоритма Snowball для русского языка (snowballstem.org/algorithms/russian/stemmer.html)
+
+VOWELS = set("аеиоуыэюя")
+
+PERFECTIVE_GERUND_1 = ("вшись", "вши", "в")
+PERFECTIVE_GERUND_2 = ("ившись", "ывшись", "ивши", "ывши", "ив", "ыв")
+ADJECTIVE = (
+    "ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий", "ый", "ой", "ем", "им", "ым",
+    "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+)
+PARTICIPLE_1 = ("ем", "нн", "вш", "ющ", "щ")
+PARTICIPLE_2 = ("ивш", "ывш", "ующ")
+REFLEXIVE = ("ся", "сь")
+VERB_1 = ("ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны", "ть", "й", "л", "н")
+VERB_2 = (
+    "ейте", "уйте", "ила", "ыла", "ена", "ите", "или", "ыли", "ило", "ыло", "ено", "ует", "уют", "ены", "ить",
+    "ыть", "ишь", "ей", "уй", "ил", "ыл", "им", "ым", "ен", "ят", "ит", "ыт", "ую", "ю",
+)
+NOUN = (
+    "иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ие", "ье", "еи", "ии", "ей", "ой", "ий", "ям",
+    "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья", "а", "е", "и", "й", "о", "у", "ы", "ь", "ю", "я",
+)
+SUPERLATIVE = ("ейше", "ейш")
+DERIVATIONAL = ("ость", "ост")
+
+WORD_RE = re.compile(r"[а-яёa-z0-9]+")
+
+
+def _by_length(endings):
+    return tuple(sorted(endings, key=len, reverse=True))
+
+
+PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2 = _by_length(PERFECTIVE_GERUND_1), _by_length(PERFECTIVE_GERUND_2)
+ADJECTIVE, PARTICIPLE_1, PARTICIPLE_2 = _by_length(ADJECTIVE), _by_length(PARTICIPLE_1), _by_length(PARTICIPLE_2)
+VERB_1, VERB_2, NOUN = _by_length(VERB_1), _by_length(VERB_2), _by_length(NOUN)
+
+
+def _regions(word: str):
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r1, r2
+
+
+def _strip(word: str, start: int, endings, preceded_by_a: bool = False):
+    """Отрезает самое длинное окончание из endings, целиком лежащее в области с позиции start"""
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            stem = word[:-len(ending)]
+            if preceded_by_a:
+                if len(stem) - 1 >= start and stem[-1] in "ая":
+                    return stem
+                continue
+            return stem
+    return None
+
+
+def _strip_group(word: str, start: int, group_1, group_2):
+    stem_1 = _strip(word, start, group_1, preceded_by_a=True)
+    stem_2 = _strip(word, start, group_2)
+    # Из двух групп выигрывает более длинное окончание, то есть более короткая основа
+    candidates = [stem for stem in (stem_1, stem_2) if stem is not None]
+    return min(candidates, key=len) if candidates else None
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    word = word.lower().replace("ё", "е")
+    if len(word) < 3 or not any(char in VOWELS for char in word):
+        return word
+    rv, _, r2 = _regions(word)
+
+    # Шаг 1
+    result = _strip_group(word, rv, PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2)
+    if result is None:
+        word = _strip(word, rv, REFLEXIVE) or word
+        result = _strip(word, rv, ADJECTIVE)
+        if result is not None:
+            result = _strip_group(result, rv, PARTICIPLE_1, PARTICIPLE_2) or result
+        else:
+            result = _strip_group(word, rv, VERB_1, VERB_2)
+            if result is None:
+                result = _strip(word, rv, NOUN)
+    word = result if result is not None else word
+
+    # Шаг 2
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    word = _strip(word, r2, DERIVATIONAL) or word
+
+    # Шаг 4
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        word = word[:-1]
+    else:
+        stripped = _strip(word, rv, SUPERLATIVE)
+        if stripped is not None:
+            word = stripped[:-1] if stripped.endswith("нн") else stripped
+        elif word.endswith("ь") and len(word) - 1 >= rv:
+            word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD_RE.findall(text.lower())
+
+
+def stem_text(text: str) -> List[str]:
+    return [stem(token) for token in tokenize(text)]
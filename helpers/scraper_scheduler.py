@@ -0,0 +1,114 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ScraperConfig:
+    enabled: bool = False
+    # 0 - один обход при старте без повторов
+    interval_minutes: float = 0.0
+    max_pages: Optional[int] = 5
+    fetch_mode: str = 'http'
+    browsers: int = 1
+    full_crawl: bool = False
+
+
+class ScraperScheduler:
+    """
+    Запускает парсер новостей (parser/scraper_worker.py) отдельным процессом по расписанию.
+    Обходы не пересекаются: следующий начинается только после завершения предыдущего, а файловая
+    блокировка в процессе парсера защищает от параллельного обхода из другого экземпляра API.
+    Итог процесс присылает строкой в stdout, после чего API перечитывает новости и дополняет индексы.
+    """
+    def __init__(self, config: Optional[ScraperConfig] = None,
+                 on_update: Optional[Callable[[], Awaitable[None]]] = None):
+        self.config = config or ScraperConfig()
+        self.on_update = on_update
+        self.last_result: Optional[dict] = None
+        self.runs = 0
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._next_run: Optional[float] = None
+
+    async def run_forever(self):
+        while True:
+            try:
+                result = await self.run_once()
+            except Exception as e:
+                # Процесс не запустился (нет интерпретатора, модуля, файловых дескрипторов): фоновая задача
+                # не должна умирать молча, следующий обход пойдёт по расписанию
+                logger.exception(f"Не удалось запустить парсер новостей: {str(e)}")
+                self._process = None
+                self.runs += 1
+                result = {'status': 'error', 'error': f"не удалось запустить парсер: {str(e)}"}
+                self.last_result = {**result, 'finished_at': time.time()}
+            if result['status'] == 'done' and result.get('added') and self.on_update is not None:
+                try:
+                    await self.on_update()
+                except Exception as e:
+                    logger.error(f"Ошибка при обновлении новостей после парсинга: {str(e)}")
+            if self.config.interval_minutes <= 0:
+                return
+            self._next_run = time.time() + self.config.interval_minutes * 60
+            await asyncio.sleep(self.config.interval_minutes * 60)
+
+    async def run_once(self) -> dict:
+        # Отдельный интерпретатор: разбор страниц не делит GIL с обработкой запросов,
+        # а процесс не наследует модель и соединения API
+        command = [
+            sys.executable, '-m', 'parser.scraper_worker', '--report',
+            '--pages', str(self.config.max_pages),
+            '--fetch-mode', self.config.fetch_mode,
+            '--browsers', str(self.config.browsers),
+        ]
+        if self.config.full_crawl:
+            command.append('--full-crawl')
+
+        logger.info(f"Запуск парсера новостей (страниц: {self.config.max_pages})")
+        self._next_run = None
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE)
+        # При отмене задачи ссылка остаётся, чтобы stop() мог завершить процесс
+        self._process = process
+        output, _ = await process.communicate()
+        returncode = process.returncode
+        self._process = None
+
+        try:
+            result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            result = {'status': 'error', 'error': f"процесс парсера завершился с кодом {returncode}"}
+        self.runs += 1
+        self.last_result = {**result, 'finished_at': time.time()}
+        if result['status'] == 'done':
+            logger.info(f"Парсинг завершён за {result['seconds']} с, новых новостей: {result['added']}")
+        elif result['status'] == 'skipped':
+            logger.info("Парсинг пропущен: обход уже идёт в другом процессе")
+        else:
+            logger.error(f"Ошибка при парсинге: {result['error']}")
+        return result
+
+    async def stop(self):
+        process = self._process
+        if process is not None and process.returncode is None:
+            logger.info("Остановка процесса парсера")
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), timeout=10)
+            except asyncio.TimeoutError:
+                process.kill()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.config.enabled,
+            "interval_minutes": self.config.interval_minutes,
+            "running": self._process is not None,
+            "runs": self.runs,
+            "last_result": self.last_result,
+            "next_run": self._next_run,
+        }
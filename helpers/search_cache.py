@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from helpers.search_client import YandexSearchClient
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    query = query.lower().replace("ё", "е")
+    return " ".join(re.findall(r"\w+", query))
+
+
+class SearchCache:
+    """
+    Кэш результатов поиска поверх YandexSearchClient.
+    Одинаковые запросы в полёте объединяются в один поход к Яндексу,
+    просроченная запись отдаётся сразу и обновляется в фоне, пока не станет слишком старой.
+    """
+    def __init__(self, client: YandexSearchClient, ttl_seconds: float = 3600, stale_seconds: float = 24 * 3600,
+                 max_size: int = 512, persist_path: Optional[str] = None):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_size = max_size
+        self.persist_path = persist_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def search(self, query: str, timeout: Optional[float] = None, limit: Optional[int] = None) -> List[dict]:
+        # Урезанная выдача хранится отдельно от полной, чтобы /search не получил только топ-3
+        key = normalize_query(query) if limit is None else f"{normalize_query(query)}#{limit}"
+        entry = self._entries.get(key)
+        if entry is not None:
+            results, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl_seconds:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return results
+            if age < self.ttl_seconds + self.stale_seconds:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self._start_refresh(key, query, limit=limit)
+                return results
+
+        self.misses += 1
+        task = self._start_refresh(key, query, timeout, limit)
+        # shield: отмена одного клиента не должна обрывать запрос для остальных ожидающих
+        return await asyncio.shield(task)
+
+    def _start_refresh(self, key: str, query: str, timeout: Optional[float] = None,
+                       limit: Optional[int] = None) -> asyncio.Task:
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        task = asyncio.create_task(self._refresh(key, query, timeout, limit))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda finished: self._on_refresh_done(key, finished))
+        return task
+
+    async def _refresh(self, key: str, query: str, timeout: Optional[float], limit: Optional[int]) -> List[dict]:
+        results = await self.client.search(query, timeout=timeout, limit=limit)
+        self._entries[key] = (results, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return results
+
+    def _on_refresh_done(self, key: str, task: asyncio.Task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Не удалось обновить результаты поиска для '{key}': {task.exception()}")
+
+    def invalidate(self):
+        self._entries.clear()
+
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Не удалось прочитать кэш поиска {self.persist_path}: {str(e)}")
+            return
+
+        now = time.time()
+        for key, entry in data.items():
+            if now - entry['fetched_at'] < self.ttl_seconds + self.stale_seconds:
+                self._entries[key] = (entry['results'], entry['fetched_at'])
+        logger.info(f"Загружено {len(self._entries)} запросов в кэш поиска")
+
+    def save(self):
+        if not self.persist_path:
+            return
+        os.makedirs(os.path.dirname(self.persist_path) or '.', exist_ok=True)
+        data = {key: {'results': results, 'fetched_at': fetched_at} for key, (results, fetched_at) in self._entries.items()}
+        # С --workers кэш сохраняет каждый процесс: у каждого свой временный файл, побеждает последний os.replace
+        directory, name = os.path.split(self.persist_path)
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory or '.', prefix=f"{name}.",
+                                         suffix='.tmp', delete=False) as f:
+            tmp_path = f.name
+            try:
+                json.dump(data, f, ensure_ascii=False)
+            except BaseException:
+                f.close()
+                os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, self.persist_path)
+
+    async def close(self):
+        for task in list(self._in_flight.values()):
+            task.cancel()
+        await asyncio.to_thread(self.save)
+        await self.client.close()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight)
+        }
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+import httpx
+
+from helpers.researchAPIv1 import default_params, parse_xml_data, url_api
+
+logger = logging.getLogger(__name__)
+
+
+class SearchError(Exception):
+    pass
+
+
+class YandexSearchClient:
+    """
+    Асинхронный клиент Yandex Search XML.
+    Держит общий пул keep-alive соединений и ограничивает число одновременных запросов.
+    """
+    def __init__(self, base_url: str = url_api, params: Optional[dict] = None, timeout: float = 5.0,
+                 max_connections: int = 10, max_concurrency: int = 8, dump_path: Optional[str] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url
+        self.params = params or default_params
+        self.timeout = httpx.Timeout(timeout, connect=min(timeout, 3.0))
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.max_concurrency = max_concurrency
+        # Сырой ответ сохраняется на диск только для отладки
+        self.dump_path = dump_path
+        # Свой транспорт (прокси, httpx.MockTransport в тестах), по умолчанию - обычный пул соединений
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, transport=self.transport)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def fetch(self, query: str, timeout: Optional[float] = None) -> str:
+        client = self._get_client()
+        params = self.params.copy()
+        params["query"] = query
+        try:
+            async with self._semaphore:
+                response = await client.get(
+                    self.base_url,
+                    params=params,
+                    timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+                )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise SearchError(f"Ошибка при запросе к Яндексу: {str(e)}") from e
+
+        if self.dump_path:
+            await asyncio.to_thread(self._dump, response.text)
+        return response.text
+
+    async def search(self, query: str, timeout: Optional[float] = None, limit: Optional[int] = None) -> List[dict]:
+        xml = await self.fetch(query, timeout=timeout)
+        return parse_xml_data(xml, limit=limit)
+
+    def _dump(self, text: str):
+        with open(self.dump_path, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("Пул соединений поиска закрыт")
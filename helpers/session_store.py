@@ -0,0 +1,366 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+import msgpack
+
+from models.message import ChatHistoryForModel, ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+def trim_history(messages: List[ChatMessage], max_length: int) -> List[ChatMessage]:
+    """Обрезает историю до max_length сообщений с начала и возвращает удалённые"""
+    excess = len(messages) - max_length
+    if excess <= 0:
+        return []
+    # История не должна начинаться с ответа ассистента без вопроса
+    while excess < len(messages) and messages[excess].role == "assistant":
+        excess += 1
+    removed = messages[:excess]
+    del messages[:excess]
+    return removed
+
+
+class SessionStore(ABC):
+    """
+    Общий интерфейс хранилища историй диалогов по session_id.
+    Сессии истекают через max_age без активности, при превышении лимита сессий или объёма текста
+    вытесняются давно не активные, история каждой сессии обрезается до max_history_length сообщений.
+    """
+    def __init__(self, max_age: timedelta = timedelta(hours=24), max_history_length: int = 10,
+                 max_sessions: int = 10000, max_total_chars: int = 50_000_000,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.max_age = max_age
+        self.max_history_length = max_history_length
+        self.max_sessions = max_sessions
+        self.max_total_chars = max_total_chars
+        self.on_evict = on_evict
+        self.expired = 0
+        self.evicted = 0
+
+    @abstractmethod
+    def get_or_create(self, session_id: Optional[str]) -> ChatHistoryForModel:
+        ...
+
+    @abstractmethod
+    def append(self, history: ChatHistoryForModel, *messages: ChatMessage):
+        """Добавляет реплики в историю сессии и обрезает её до max_history_length"""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[ChatHistoryForModel]:
+        ...
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Удаляет истёкшие сессии и возвращает их количество"""
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+    def close(self):
+        pass
+
+    async def run_sweeper(self, interval_seconds: float = 60.0):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.info(f"Очищено {removed} неактивных сессий")
+            except Exception as e:
+                logger.error(f"Ошибка при очистке сессий: {str(e)}")
+
+    @staticmethod
+    def _new_session_id(session_id: Optional[str]) -> str:
+        if session_id:
+            return session_id
+        session_id = str(uuid.uuid4())
+        logger.info(f"Создание новой сессии: {session_id}")
+        return session_id
+
+    def _notify_evicted(self, session_id: str):
+        if self.on_evict is not None:
+            self.on_evict(session_id)
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Истории в памяти процесса, упорядоченные по последней активности.
+    Устаревшие сессии лежат в начале OrderedDict, поэтому фоновая очистка снимает их с головы
+    и останавливается на первой живой.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sessions: "OrderedDict[str, ChatHistoryForModel]" = OrderedDict()
+        self._chars: dict = {}
+        self._total_chars = 0
+
+    def get_or_create(self, session_id: Optional[str]) -> ChatHistoryForModel:
+        session_id = self._new_session_id(session_id)
+        history = self._sessions.get(session_id)
+        if history is None or self._is_expired(history, datetime.now()):
+            if history is not None:
+                self._remove(session_id)
+                self.expired += 1
+            history = ChatHistoryForModel(messages=[], session_id=session_id)
+            self._sessions[session_id] = history
+            self._chars[session_id] = 0
+            self._evict()
+        self._touch(history)
+        return history
+
+    def append(self, history: ChatHistoryForModel, *messages: ChatMessage):
+        session_id = history.session_id
+        if session_id not in self._sessions:
+            # Сессию вытеснили, пока шла генерация - возвращаем её с ответом
+            self._sessions[session_id] = history
+            self._chars[session_id] = sum(len(message.content) for message in history.messages)
+            self._total_chars += self._chars[session_id]
+
+        history.messages.extend(messages)
+        removed = trim_history(history.messages, self.max_history_length)
+        delta = sum(len(message.content) for message in messages) - sum(len(message.content) for message in removed)
+        self._chars[session_id] += delta
+        self._total_chars += delta
+        self._touch(history)
+        self._evict()
+
+    def get(self, session_id: str) -> Optional[ChatHistoryForModel]:
+        history = self._sessions.get(session_id)
+        if history is None or self._is_expired(history, datetime.now()):
+            return None
+        return history
+
+    def sweep(self) -> int:
+        now = datetime.now()
+        removed = 0
+        while self._sessions:
+            session_id, history = next(iter(self._sessions.items()))
+            if not self._is_expired(history, now):
+                break
+            self._remove(session_id)
+            removed += 1
+        self.expired += removed
+        return removed
+
+    def _touch(self, history: ChatHistoryForModel):
+        history.update_activity()
+        self._sessions.move_to_end(history.session_id)
+
+    def _is_expired(self, history: ChatHistoryForModel, now: datetime) -> bool:
+        return now - history.last_activity > self.max_age
+
+    def _evict(self):
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions
+                                           or self._total_chars > self.max_total_chars):
+            session_id = next(iter(self._sessions))
+            self._remove(session_id)
+            self.evicted += 1
+            logger.info(f"Сессия {session_id} вытеснена по лимиту хранилища")
+
+    def _remove(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._total_chars -= self._chars.pop(session_id, 0)
+        self._notify_evicted(session_id)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "total_chars": self._total_chars,
+            "expired": self.expired,
+            "evicted": self.evicted
+        }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Истории в общей базе SQLite (WAL), чтобы сессию видел любой рабочий процесс uvicorn.
+    Реплики хранятся компактным msgpack-списком пар [роль, текст], дописывание идёт
+    в транзакции BEGIN IMMEDIATE, поэтому ответы из разных процессов не затирают друг друга.
+    """
+    # Не INSERT OR REPLACE: удаление при REPLACE не запускает триггеры, и счётчики разошлись бы
+    _UPSERT = """
+        INSERT INTO sessions (session_id, last_activity, chars, messages) VALUES (?, ?, ?, ?)
+        ON CONFLICT (session_id) DO UPDATE SET
+            last_activity = excluded.last_activity, chars = excluded.chars, messages = excluded.messages
+    """
+
+    def __init__(self, path: str = 'data/sessions.db', **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    last_activity REAL NOT NULL,
+                    chars INTEGER NOT NULL,
+                    messages BLOB NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_activity ON sessions (last_activity)")
+            # Число сессий и объём текста ведут триггеры: проверка лимитов на каждой записи не сканирует таблицу
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    sessions INTEGER NOT NULL,
+                    chars INTEGER NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                INSERT OR IGNORE INTO session_totals (id, sessions, chars)
+                SELECT 0, COUNT(*), COALESCE(SUM(chars), 0) FROM sessions
+            """)
+            self._conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS sessions_insert AFTER INSERT ON sessions BEGIN
+                    UPDATE session_totals SET sessions = sessions + 1, chars = chars + NEW.chars WHERE id = 0;
+                END
+            """)
+            self._conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS sessions_delete AFTER DELETE ON sessions BEGIN
+                    UPDATE session_totals SET sessions = sessions - 1, chars = chars - OLD.chars WHERE id = 0;
+                END
+            """)
+            self._conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS sessions_update AFTER UPDATE OF chars ON sessions BEGIN
+                    UPDATE session_totals SET chars = chars - OLD.chars + NEW.chars WHERE id = 0;
+                END
+            """)
+
+    def get_or_create(self, session_id: Optional[str]) -> ChatHistoryForModel:
+        session_id = self._new_session_id(session_id)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT last_activity, messages FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            alive = row is not None and now - row[0] <= self.max_age.total_seconds()
+            if alive:
+                messages = self._unpack(row[1])
+                self._conn.execute("UPDATE sessions SET last_activity = ? WHERE session_id = ?", (now, session_id))
+            else:
+                messages = []
+                self._conn.execute(self._UPSERT, (session_id, now, 0, self._pack([])))
+        if not alive:
+            if row is not None:
+                self.expired += 1
+                self._notify_evicted(session_id)
+            self._evict()
+        return ChatHistoryForModel(messages=messages, session_id=session_id, last_activity=datetime.fromtimestamp(now))
+
+    def append(self, history: ChatHistoryForModel, *messages: ChatMessage):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT messages FROM sessions WHERE session_id = ?", (history.session_id,)
+            ).fetchone()
+            # Берём сохранённую историю: её мог дополнить другой процесс. Если сессию вытеснили - копию из запроса
+            stored = self._unpack(row[0]) if row is not None else list(history.messages)
+            stored.extend(messages)
+            trim_history(stored, self.max_history_length)
+            self._conn.execute(
+                self._UPSERT,
+                (history.session_id, now, sum(len(message.content) for message in stored), self._pack(stored))
+            )
+        history.messages = stored
+        history.last_activity = datetime.fromtimestamp(now)
+        self._evict()
+
+    def get(self, session_id: str) -> Optional[ChatHistoryForModel]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_activity, messages FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None or time.time() - row[0] > self.max_age.total_seconds():
+            return None
+        return ChatHistoryForModel(messages=self._unpack(row[1]), session_id=session_id,
+                                   last_activity=datetime.fromtimestamp(row[0]))
+
+    def sweep(self) -> int:
+        deadline = time.time() - self.max_age.total_seconds()
+        with self._lock, self._conn:
+            expired = [row[0] for row in self._conn.execute(
+                "DELETE FROM sessions WHERE last_activity < ? RETURNING session_id", (deadline,)
+            )]
+        for session_id in expired:
+            self._notify_evicted(session_id)
+        self.expired += len(expired)
+        return len(expired)
+
+    def _evict(self):
+        with self._lock, self._conn:
+            count, total_chars = self._totals()
+            if count <= self.max_sessions and total_chars <= self.max_total_chars:
+                return
+            evicted = []
+            # Самую свежую сессию не трогаем - это та, с которой сейчас идёт работа
+            for session_id, chars in self._conn.execute(
+                "SELECT session_id, chars FROM sessions ORDER BY last_activity LIMIT ?", (max(0, count - 1),)
+            ).fetchall():
+                if count <= self.max_sessions and total_chars <= self.max_total_chars:
+                    break
+                evicted.append(session_id)
+                count -= 1
+                total_chars -= chars
+            self._conn.executemany("DELETE FROM sessions WHERE session_id = ?", [(session_id,) for session_id in evicted])
+        for session_id in evicted:
+            self._notify_evicted(session_id)
+            logger.info(f"Сессия {session_id} вытеснена по лимиту хранилища")
+        self.evicted += len(evicted)
+
+    @staticmethod
+    def _pack(messages: List[ChatMessage]) -> bytes:
+        return msgpack.packb([(message.role, message.content) for message in messages], use_bin_type=True)
+
+    @staticmethod
+    def _unpack(data: bytes) -> List[ChatMessage]:
+        return [ChatMessage(role=role, content=content) for role, content in msgpack.unpackb(data, raw=False)]
+
+    def _totals(self):
+        return self._conn.execute("SELECT sessions, chars FROM session_totals WHERE id = 0").fetchone()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._totals()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total_chars = self._totals()
+        return {
+            "backend": "sqlite",
+            "sessions": count,
+            "total_chars": total_chars,
+            "expired": self.expired,
+            "evicted": self.evicted
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_store(backend: str = "memory", **kwargs) -> SessionStore:
+    if backend == "sqlite":
+        return SQLiteSessionStore(**kwargs)
+    if backend == "memory":
+        return MemorySessionStore(**kwargs)
+    raise ValueError(f"Неизвестное хранилище сессий: {backend}")
@@ -1,29 +1,43 @@
 import json
 import argparse
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, List, Optional
-import uuid
+from typing import List, Optional
 from contextlib import asynccontextmanager
 import logging
-from datetime import datetime, timedelta
+import os
+from datetime import date, timedelta
 
-from fastapi import FastAPI, Query, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from typing import Dict, List
-from datetime import datetime
 
-from helpers.researchAPIv1 import fetch_yandex_search_results, parse_xml_data
-from models.news_item import NewsItem
+from helpers.file_lock import acquire_lock_file
+from helpers.news_store import NewsStore
+from helpers.scraper_scheduler import ScraperScheduler
+from helpers.session_store import create_session_store
+from helpers.search_cache import SearchCache
+from helpers.search_client import YandexSearchClient
+from models.news_item import NewsItem, NewsSearchResult
 from models.search import SearchResult
-from parser.news_parser import NewsParser
-from models.message import Message, ChatMessage, ChatHistory, ChatHistoryForModel
+from parser.news_db import NewsDatabase
+from retrieval.bm25 import BM25Index
+from retrieval.dense import DenseIndex
+from models.message import Message, ChatMessage
 from models.local_ml import MLModel
+from models.remote_ml import RemoteMLModel
 
 # Константы
 MAX_HISTORY_LENGTH = 10
 MAX_SESSION_AGE = timedelta(hours=24)
+MAX_SESSIONS = 10000
+# Суммарный объём текста всех историй в символах
+MAX_SESSION_STORE_CHARS = 50_000_000
+SESSION_SWEEP_INTERVAL_S = 60
+SESSION_DB_PATH = 'data/sessions.db'
+# Индексы и парсер ведёт процесс, захвативший эту блокировку, остальные рабочие процессы только читают
+INDEX_WRITER_LOCK = 'data/index_writer.lock'
+# Аргументы запуска для рабочих процессов uvicorn, которые импортируют main заново
+APP_ARGS_ENV = 'CSU_CHAT_ARGS'
 
 # Настройка логирования
 logging.basicConfig(
@@ -32,14 +46,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-ml_model = MLModel()
+search_cache = SearchCache(YandexSearchClient(), persist_path='data/search_cache.json')
+news_index = BM25Index()
+dense_index = DenseIndex()
+ml_model = MLModel(search_client=search_cache, local_index=news_index, dense_index=dense_index)
+news_store = NewsStore()
+news_db = NewsDatabase()
 
-def load_news_data():
-    try:
-        with open('data/news_data.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+def make_session_store(backend: str = "memory"):
+    options = {'path': SESSION_DB_PATH} if backend == "sqlite" else {}
+    return create_session_store(
+        backend,
+        max_age=MAX_SESSION_AGE,
+        max_history_length=MAX_HISTORY_LENGTH,
+        max_sessions=MAX_SESSIONS,
+        max_total_chars=MAX_SESSION_STORE_CHARS,
+        on_evict=ml_model.drop_session,
+        **options
+    )
+
+session_store = make_session_store()
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Запуск FastAPI сервера с опцией парсинга новостей')
@@ -47,7 +73,32 @@ def parse_arguments():
     parser.add_argument('--pages', type=str, 
                        default='5', 
                        help='Количество страниц для парсинга (по умолчанию 5), None для бесконечного парсинга')    
+    parser.add_argument('--fetch-mode', choices=['http', 'browser'], default='http',
+                       help='Как скачивать статьи: http - параллельными запросами, browser - вкладками Chrome')
+    parser.add_argument('--browsers', type=int, default=1,
+                       help='Число headless Chrome для параллельного обхода страниц списка (1 - последовательный обход)')
+    parser.add_argument('--parse-interval', type=float, default=0,
+                       help='Повторять парсинг каждые N минут в фоновом процессе (0 - только при старте)')
+    parser.add_argument('--full-crawl', action='store_true',
+                       help='Обойти все страницы заново, не пропуская уже сохранённые новости')
+    parser.add_argument('--no-dense-index', action='store_true',
+                       help='Отключить семантический поиск по новостям (векторный индекс и энкодер)')
+    parser.add_argument('--session-backend', choices=['memory', 'sqlite'], default='memory',
+                       help='Где хранить истории диалогов: memory - в процессе, sqlite - общая база для нескольких процессов')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Число рабочих процессов uvicorn (больше 1 - только с --inference-socket и общим хранилищем сессий sqlite)')
+    parser.add_argument('--inference-socket', type=str, default=None,
+                       help='Генерировать ответы через сервер инференса на этом Unix-сокете '
+                            '(python -m models.inference_server), а не загружать модель в процесс API')
+    parser.add_argument('--device', choices=['auto', 'cuda', 'cpu'], default='auto',
+                       help='Устройство для модели: auto (CUDA при наличии), cuda или cpu с int8-квантизацией')
+    parser.add_argument('--draft-model', type=str, default=None,
+                       help='Черновая модель для спекулятивного декодирования, например Qwen/Qwen2.5-0.5B-Instruct '
+                            '(генерация без батчинга)')
     args = parser.parse_args()
+    if args.workers > 1 and not args.inference_socket:
+        # Без общего сервера инференса каждый рабочий процесс загрузил бы свою копию модели
+        parser.error("--workers больше 1 требует --inference-socket (python -m models.inference_server)")
     
     if args.pages.lower() == 'none':
         args.pages = None
@@ -59,127 +110,208 @@ def parse_arguments():
     
     return args
 
+def sync_news_indexes():
+    """Дозаполняет полнотекстовый архив и индекс BM25 новостями из журнала, уже проиндексированные пропускаются"""
+    news_data = news_store.storage.load()
+    added = news_db.add(news_data)
+    if news_index.add(news_data):
+        news_index.save()
+    logger.info(f"Новостей в полнотекстовом архиве: {news_db.count()}, добавлено: {added}, в индексе BM25: {len(news_index)}")
+
+def sync_dense_index():
+    """Кодирует новые статьи энкодером - на CPU это долго, поэтому вызывается в фоне"""
+    if ml_model.dense_index is None:
+        return
+    try:
+        ml_model.dense_index.add(news_store.storage.load())
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении векторного индекса: {str(e)}")
+
+async def reload_news():
+    """Вызывается по сигналу процесса парсера: журнал на диске дополнился"""
+    news_store.notify_updated()
+    if ml_model.answer_cache is not None:
+        ml_model.answer_cache.invalidate()
+    await asyncio.to_thread(sync_news_indexes)
+    await asyncio.to_thread(sync_dense_index)
+
+# Парсер работает в отдельном процессе, индексы пишет только процесс API
+scraper = ScraperScheduler(on_update=reload_news)
+
+def apply_arguments(args):
+    """Переносит аргументы запуска в настройки; с --workers вызывается в каждом рабочем процессе"""
+    global ml_model, session_store
+    if args.workers > 1 and not args.inference_socket:
+        logger.warning(f"Запущено {args.workers} рабочих процессов без --inference-socket: "
+                       "каждый загрузит свою копию модели")
+    if args.inference_socket:
+        ml_model = RemoteMLModel(socket_path=args.inference_socket, search_client=search_cache,
+                                 local_index=news_index, dense_index=dense_index)
+    ml_model.config.device = args.device
+    ml_model.config.draft_model_id = args.draft_model
+    if args.no_dense_index:
+        ml_model.dense_index = None
+        if ml_model.answer_cache is not None:
+            ml_model.answer_cache.encoder = None
+    scraper.config.enabled = args.parse
+    scraper.config.interval_minutes = args.parse_interval
+    scraper.config.max_pages = args.pages
+    scraper.config.fetch_mode = args.fetch_mode
+    scraper.config.browsers = args.browsers
+    scraper.config.full_crawl = args.full_crawl
+
+    backend = args.session_backend
+    if args.workers > 1 and backend == "memory":
+        logger.warning("Сессии в памяти не видны другим рабочим процессам, используется хранилище sqlite")
+        backend = "sqlite"
+    session_store = make_session_store(backend)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     try:
+        await asyncio.to_thread(search_cache.load)
+        app.state.index_writer = acquire_lock_file(INDEX_WRITER_LOCK)
+        is_writer = app.state.index_writer is not None
+        if not is_writer:
+            logger.info("Индексы ведёт другой рабочий процесс, этот только читает их")
+        news_index.read_only = not is_writer
+        await asyncio.to_thread(news_index.load)
+        if is_writer:
+            await asyncio.to_thread(sync_news_indexes)
+        if ml_model.dense_index is not None:
+            await asyncio.to_thread(ml_model.dense_index.load)
+            if is_writer:
+                # Индекс отображён в память и уже отвечает, новые статьи докодируются в фоне
+                app.state.dense_sync = asyncio.create_task(asyncio.to_thread(sync_dense_index))
         await asyncio.to_thread(ml_model.initialize)
+        app.state.session_sweeper = asyncio.create_task(session_store.run_sweeper(SESSION_SWEEP_INTERVAL_S))
+        if scraper.config.enabled and is_writer:
+            app.state.scraper = asyncio.create_task(scraper.run_forever())
         yield
     finally:
+        if getattr(app.state, 'session_sweeper', None) is not None:
+            app.state.session_sweeper.cancel()
+        if getattr(app.state, 'scraper', None) is not None:
+            app.state.scraper.cancel()
+        await scraper.stop()
         ml_model.cleanup()
+        await search_cache.close()
+        news_db.close()
+        session_store.close()
+        if getattr(app.state, 'index_writer', None) is not None:
+            app.state.index_writer.close()
 
 
 app = FastAPI(lifespan=lifespan)
 
-async def generate_response_with_timeout(messages: List[ChatMessage]) -> str:
-    try:
-        response = await asyncio.to_thread(ml_model.generate_response, messages)
-        return response
-        
-    except Exception as e:
-        logger.error(f"Ошибка при генерации ответа: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-chat_histories: Dict[str, ChatHistory] = {} 
-model_histories: Dict[str, ChatHistoryForModel] = {} 
-
-async def cleanup_old_sessions():
-    current_time = datetime.now()
-    expired_sessions = [
-        session_id for session_id, history in chat_histories.items()
-        if (current_time - history.last_activity) > MAX_SESSION_AGE
-    ]
-    for session_id in expired_sessions:
-        del chat_histories[session_id]
-    logger.info(f"Очищено {len(expired_sessions)} неактивных сессий")
-
-async def run_parser_async():
-    with ThreadPoolExecutor() as executor:
-        loop = asyncio.get_event_loop()
-        try:
-            await loop.run_in_executor(executor, run_parser)
-        except Exception as e:
-            print(f"Ошибка при парсинге: {str(e)}")
-
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 @app.get("/api/news", response_model=List[NewsItem])
-async def get_news():
-    news_data = load_news_data()
-    news_list = []
-    
-    for item in news_data:
-        news_list.append(NewsItem(
-            title=item['title'],
-            date=item['date'],
-            relate_image_link=item['relate_image'],
-            description=item.get('content', 'Описание отсутствует')
-        ))
-    return news_list
+async def get_news(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    summary: bool = True
+):
+    body, etag, total = await news_store.page(offset, limit, date_from, date_to, summary)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Total-Count": str(total)}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/news/search", response_model=List[NewsSearchResult])
+async def search_news(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50)):
+    return await asyncio.to_thread(news_db.search, q, limit)
+
+@app.get("/api/news/{news_id}", response_model=NewsItem)
+async def get_news_item(news_id: str):
+    item = await news_store.get_item(news_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Новость не найдена")
+    return item
 
 @app.get("/search", response_model=list[SearchResult])
 async def search(query: str = Query(...)):
     try:
-        xml = fetch_yandex_search_results(query)
-        results = parse_xml_data(xml)
+        results = await search_cache.search(query)
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Произошла непредвиденная ошибка: {str(e)}")
 
+@app.get("/api/stats")
+async def get_stats():
+    return {"model": await ml_model.collect_stats(), "search_cache": search_cache.stats(), "scraper": scraper.stats(),
+            "sessions": session_store.stats()}
+
 @app.get("/")
 def index():
     return HTMLResponse(content=open("index.html", "r", encoding="utf-8").read())
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.post("/chat")
 async def chat(message: Message, session_id: Optional[str] = None):
     try:
-        await cleanup_old_sessions()
-        
-        if not session_id:
-            session_id = str(uuid.uuid4())
-            logger.info(f"Создание новой сессии: {session_id}")
-            history = ChatHistoryForModel(messages=[], session_id=session_id)
-            model_histories[session_id] = history
-        else:
-            history = model_histories.get(session_id)
-            if not history:
-                history = ChatHistoryForModel(messages=[], session_id=session_id)
-                model_histories[session_id] = history
-        
+        history = session_store.get_or_create(session_id)
         logger.info(f"Количество сообщений в истории: {len(history.messages)}")
-        history.update_activity()
         
         user_message = ChatMessage(role="user", content=message.text)
-        history.messages.append(user_message)
-        print(history.messages)
-        response = await ml_model.generate_response(history.messages)
+        messages = history.messages + [user_message]
+        response = await ml_model.generate_response(messages, session_id=history.session_id)
         assistant_message = ChatMessage(role="assistant", content=response)
-        history.messages.append(assistant_message)
+        session_store.append(history, user_message, assistant_message)
         return {
             "response": response,
-            "session_id": session_id
+            "session_id": history.session_id
         }
         
     except Exception as e:
         logger.error(f"Ошибка в чате: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def chat_stream(message: Message, session_id: Optional[str] = None):
+    history = session_store.get_or_create(session_id)
+    user_message = ChatMessage(role="user", content=message.text)
+
+    async def event_stream():
+        # Сообщение пользователя попадает в историю только вместе с ответом,
+        # чтобы оборванный стрим не оставлял в сессии вопрос без ответа
+        messages = history.messages + [user_message]
+        chunks = []
+        yield sse_event("session", {"session_id": history.session_id})
+        try:
+            async for chunk in ml_model.stream_response(messages, session_id=history.session_id):
+                chunks.append(chunk)
+                yield sse_event("token", {"text": chunk})
+        except Exception as e:
+            logger.error(f"Ошибка в потоковом чате: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+            return
+
+        response = "".join(chunks)
+        session_store.append(history, user_message, ChatMessage(role="assistant", content=response))
+        yield sse_event("done", {"session_id": history.session_id})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+if os.environ.get(APP_ARGS_ENV) and __name__ != "__main__":
+    apply_arguments(argparse.Namespace(**json.loads(os.environ[APP_ARGS_ENV])))
+
 if __name__ == "__main__":
     args = parse_arguments()
-    
-    def run_parser():
-        if args.parse:
-            print(f"Запуск парсера новостей (страниц: {args.pages})...")
-            parser = NewsParser(max_pages=args.pages)
-            try:
-                parser.parse_news()
-            except Exception as e:
-                print(f"Ошибка при парсинге: {str(e)}")
-            finally:
-                parser.driver.quit()
-    
 
-    with ThreadPoolExecutor() as executor:
-        parser_future = executor.submit(run_parser)
-        
-        import uvicorn
-        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import uvicorn
+    if args.workers > 1:
+        os.environ[APP_ARGS_ENV] = json.dumps(vars(args))
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=args.workers)
+    else:
+        apply_arguments(args)
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,204 @@
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+
+from models.message import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PromptReport:
+    prompt_tokens: int
+    kept_messages: int
+    dropped_messages: int
+    context_truncated: bool
+
+
+class ChatContextWindow:
+    """
+    Укладывает системный промпт, поисковый контекст и свежие реплики диалога в бюджет токенов.
+    Длина каждой реплики считается токенизатором один раз и кэшируется по сессии, старые реплики
+    отбрасываются целыми парами вопрос-ответ, контекст поиска обрезается, если не влезает даже последний вопрос.
+    """
+    def __init__(self, tokenizer, budget: int, max_sessions: int = 10000):
+        self.tokenizer = tokenizer
+        self.budget = budget
+        self.max_sessions = max_sessions
+        self._counts: "OrderedDict[str, Dict[Tuple[str, str], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Служебные токены шаблона на одну реплику (роль, разделители) - свои для каждой роли
+        # (шаблоны вроде Qwen сами подставляют системный промпт, если его нет, поэтому он есть и в пробе)
+        self._probe = [{"role": "system", "content": "x"}]
+        self._probe_tokens = len(tokenizer.apply_chat_template(self._probe))
+        self._role_overheads = {"system": max(0, self._probe_tokens - self._encode_length("x"))}
+        for role in ("user", "assistant"):
+            self._message_overhead(role)
+        # Приглашение ассистента в конце промпта
+        self._generation_overhead = max(0, len(tokenizer.apply_chat_template(self._probe, add_generation_prompt=True))
+                                        - self._probe_tokens)
+        self._system_cache: Dict[str, int] = {}
+        self._question_cache: Dict[str, int] = {}
+        self.requests = 0
+        self.total_prompt_tokens = 0
+        self.max_prompt_tokens = 0
+        self.dropped_messages = 0
+        self.truncated_contexts = 0
+        self.estimate_misses = 0
+
+    def build(self, messages: List[ChatMessage], system_prompt: str, search_context: str,
+              question_prompt: Callable[[str, str], str],
+              session_id: Optional[str] = None) -> Tuple[torch.Tensor, PromptReport]:
+        """
+        Контекст поиска подставляется только в последний вопрос (question_prompt(вопрос, контекст)):
+        системный промпт и прошлые реплики от хода к ходу не меняются, и KV-кэш сессии переиспользует их.
+        """
+        counts = self._session_counts(session_id, messages)
+        history, last = messages[:-1], messages[-1]
+        last_tokens = counts[(last.role, last.content)]
+
+        # Системный промпт не меняется - считаем его один раз
+        base_tokens = self._system_cache.get(system_prompt)
+        if base_tokens is None:
+            base_tokens = self._encode_length(system_prompt) + self._role_overheads["system"] + self._generation_overhead
+            self._system_cache = {system_prompt: base_tokens}
+
+        context_truncated = False
+        context_ids = self.tokenizer.encode(search_context, add_special_tokens=False) if search_context else []
+        if context_ids:
+            # Обвязка контекста в вопросе (заголовок, переводы строк) тоже не меняется
+            wrapper = question_prompt("x", "y")
+            wrapper_tokens = self._question_cache.get(wrapper)
+            if wrapper_tokens is None:
+                wrapper_tokens = max(0, self._encode_length(wrapper) - self._encode_length("x y"))
+                self._question_cache = {wrapper: wrapper_tokens}
+            last_tokens += wrapper_tokens
+        allowed = self.budget - base_tokens - last_tokens
+        if len(context_ids) > allowed:
+            search_context = self.tokenizer.decode(context_ids[:max(0, allowed)]) if allowed > 0 else ""
+            context_ids = context_ids[:max(0, allowed)]
+            context_truncated = True
+        used = base_tokens + len(context_ids) + last_tokens
+
+        # Добавляем реплики от свежих к старым целыми ходами, пока они влезают в бюджет
+        start = len(history)
+        while start > 0:
+            turn_start = self._turn_start(history, start)
+            cost = sum(counts[(message.role, message.content)] for message in history[turn_start:start])
+            if used + cost > self.budget:
+                break
+            used += cost
+            start = turn_start
+
+        system_message = ChatMessage(role="system", content=system_prompt)
+        question = ChatMessage(role=last.role, content=question_prompt(last.content, search_context))
+        # Полный шаблон применяется один раз - это и проверка оценки, и готовый промпт
+        inputs = self._apply_template([system_message] + history[start:] + [question])
+        excess = inputs.shape[1] - self.budget
+        if excess > 0:
+            # Оценка по репликам разошлась с шаблоном (токены склеились на границах): убираем лишнее
+            # по уже посчитанным длинам одной поправкой - сначала старые ходы, затем хвост контекста
+            with self._lock:
+                self.estimate_misses += 1
+            kept_start = start
+            while excess > 0 and start < len(history):
+                end = self._turn_end(history, start)
+                excess -= sum(counts[(message.role, message.content)] for message in history[start:end])
+                start = end
+            trimmed_context = excess > 0 and bool(context_ids)
+            if trimmed_context:
+                context_ids = context_ids[:max(0, len(context_ids) - excess)]
+                context_truncated = True
+                question = ChatMessage(role=last.role, content=question_prompt(last.content, self.tokenizer.decode(context_ids)))
+            if start != kept_start or trimmed_context:
+                inputs = self._apply_template([system_message] + history[start:] + [question])
+
+        report = PromptReport(
+            prompt_tokens=inputs.shape[1],
+            kept_messages=len(history) - start + 1,
+            dropped_messages=start,
+            context_truncated=context_truncated
+        )
+        self._record(report)
+        return inputs, report
+
+    def drop_session(self, session_id: str):
+        with self._lock:
+            self._counts.pop(session_id, None)
+
+    def _session_counts(self, session_id: Optional[str], messages: List[ChatMessage]) -> Dict[Tuple[str, str], int]:
+        with self._lock:
+            cached = self._counts.get(session_id, {}) if session_id else {}
+        # Храним только реплики текущей истории: обрезанные из неё счётчики больше не понадобятся
+        counts = {}
+        for message in messages:
+            key = (message.role, message.content)
+            if key in counts:
+                continue
+            counts[key] = cached[key] if key in cached else self._encode_length(message.content) + self._message_overhead(message.role)
+        if session_id:
+            with self._lock:
+                self._counts[session_id] = counts
+                self._counts.move_to_end(session_id)
+                while len(self._counts) > self.max_sessions:
+                    self._counts.popitem(last=False)
+        return counts
+
+    @staticmethod
+    def _turn_start(history: List[ChatMessage], end: int) -> int:
+        """Начало хода, который заканчивается перед end: ответ ассистента уходит вместе с вопросом"""
+        start = end - 1
+        while start > 0 and history[start].role != "user":
+            start -= 1
+        return start
+
+    @staticmethod
+    def _turn_end(history: List[ChatMessage], start: int) -> int:
+        end = start + 1
+        while end < len(history) and history[end].role != "user":
+            end += 1
+        return end
+
+    def _message_overhead(self, role: str) -> int:
+        overhead = self._role_overheads.get(role)
+        if overhead is None:
+            with_message = len(self.tokenizer.apply_chat_template(self._probe + [{"role": role, "content": "x"}]))
+            overhead = max(0, with_message - self._probe_tokens - self._encode_length("x"))
+            self._role_overheads[role] = overhead
+        return overhead
+
+    def _encode_length(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def _apply_template(self, messages: List[ChatMessage]) -> torch.Tensor:
+        return self.tokenizer.apply_chat_template(messages, add_generation_prompt=True, return_tensors="pt")
+
+    def _record(self, report: PromptReport):
+        with self._lock:
+            self.requests += 1
+            self.total_prompt_tokens += report.prompt_tokens
+            self.max_prompt_tokens = max(self.max_prompt_tokens, report.prompt_tokens)
+            self.dropped_messages += report.dropped_messages
+            self.truncated_contexts += report.context_truncated
+        if report.prompt_tokens > self.budget:
+            logger.warning(f"Последний вопрос не помещается в бюджет промпта: {report.prompt_tokens} > {self.budget}")
+        logger.info(f"Промпт: {report.prompt_tokens} токенов из {self.budget}, реплик истории: "
+                    f"{report.kept_messages - 1}, отброшено: {report.dropped_messages}"
+                    + (", контекст поиска обрезан" if report.context_truncated else ""))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "requests": self.requests,
+                "avg_prompt_tokens": round(self.total_prompt_tokens / self.requests, 1) if self.requests else 0,
+                "max_prompt_tokens": self.max_prompt_tokens,
+                "dropped_messages": self.dropped_messages,
+                "truncated_contexts": self.truncated_contexts,
+                "estimate_misses": self.estimate_misses,
+                "sessions": len(self._counts)
+            }
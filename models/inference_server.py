@@ -0,0 +1,151 @@
+"""
+Сервер инференса: модель загружается один раз в отдельном процессе, рабочие процессы API
+обращаются к нему через Unix-сокет (models/remote_ml.py).
+
+Запуск из корня проекта:
+    python -m models.inference_server --socket data/inference.sock --device auto
+
+Протокол: кадры msgpack с 4-байтовой длиной (big-endian), один запрос на соединение.
+Запрос - {"op": ..., ...}, ответ - {"type": "result", ...}, а в режиме stream поток
+{"type": "token", "text": ...}, завершённый {"type": "done"}; при ошибке {"type": "error", "error": ...}.
+Закрытие соединения клиентом останавливает генерацию.
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+import struct
+from typing import List, Optional
+
+import msgpack
+
+from models.message import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = 'data/inference.sock'
+MAX_FRAME_BYTES = 16 * 2**20
+_HEADER = struct.Struct('>I')
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[dict]:
+    """Читает кадр; None - соединение закрыто"""
+    try:
+        header = await reader.readexactly(_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"Слишком большой кадр: {length} байт")
+    return msgpack.unpackb(await reader.readexactly(length), raw=False)
+
+
+async def write_frame(writer: asyncio.StreamWriter, frame: dict):
+    payload = msgpack.packb(frame, use_bin_type=True)
+    writer.write(_HEADER.pack(len(payload)) + payload)
+    await writer.drain()
+
+
+def pack_messages(messages: List[ChatMessage]) -> list:
+    return [(message.role, message.content) for message in messages]
+
+
+def unpack_messages(messages: list) -> List[ChatMessage]:
+    return [ChatMessage(role=role, content=content) for role, content in messages]
+
+
+class InferenceServer:
+    """Принимает запросы генерации от процессов API и передаёт их общему MLModel с батчингом и KV-кэшем"""
+    def __init__(self, ml_model, socket_path: str = DEFAULT_SOCKET_PATH):
+        self.ml_model = ml_model
+        self.socket_path = socket_path
+        self.requests = 0
+        self.active = 0
+
+    async def serve(self):
+        os.makedirs(os.path.dirname(self.socket_path) or '.', exist_ok=True)
+        if os.path.exists(self.socket_path):
+            # Сокет от прошлого запуска, который завершился без очистки
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        logger.info(f"Сервер инференса слушает {self.socket_path}")
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.socket_path)
+            self.ml_model.cleanup()
+            logger.info("Сервер инференса остановлен")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.requests += 1
+        self.active += 1
+        try:
+            request = await read_frame(reader)
+            if request is not None:
+                await self._dispatch(request, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # Клиент отключился - генерация остановлена закрытием стрима
+            pass
+        except Exception as e:
+            logger.error(f"Ошибка при обработке запроса к серверу инференса: {str(e)}")
+            with contextlib.suppress(ConnectionError):
+                await write_frame(writer, {"type": "error", "error": str(e)})
+        finally:
+            self.active -= 1
+            writer.close()
+
+    async def _dispatch(self, request: dict, writer: asyncio.StreamWriter):
+        op = request.get("op")
+        if op == "generate":
+            text = await self.ml_model.generate_reply(
+                unpack_messages(request["messages"]), request.get("search_context", ""),
+                session_id=request.get("session_id")
+            )
+            await write_frame(writer, {"type": "result", "text": text})
+        elif op == "stream":
+            stream = self.ml_model.stream_reply(
+                unpack_messages(request["messages"]), request.get("search_context", ""),
+                session_id=request.get("session_id")
+            )
+            async with contextlib.aclosing(stream):
+                async for chunk in stream:
+                    await write_frame(writer, {"type": "token", "text": chunk})
+            await write_frame(writer, {"type": "done"})
+        elif op == "search_query":
+            text = await self.ml_model.generate_search_query(request["message"])
+            await write_frame(writer, {"type": "result", "text": text})
+        elif op == "drop_session":
+            self.ml_model.drop_session(request["session_id"])
+            await write_frame(writer, {"type": "result"})
+        elif op == "stats":
+            stats = self.ml_model.stats()
+            stats["server"] = {"requests": self.requests, "active": self.active - 1}
+            await write_frame(writer, {"type": "result", "stats": stats})
+        else:
+            raise ValueError(f"Неизвестная операция: {op}")
+
+
+if __name__ == '__main__':
+    from models.local_ml import MLModel
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    arg_parser = argparse.ArgumentParser(description='Сервер инференса для процессов API')
+    arg_parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH)
+    arg_parser.add_argument('--device', choices=['auto', 'cuda', 'cpu'], default='auto')
+    arg_parser.add_argument('--draft-model', default=None)
+    args = arg_parser.parse_args()
+
+    # Поиск контекста остаётся в API: серверу нужны только модель, батчинг и кэши
+    model = MLModel()
+    model.config.device = args.device
+    model.config.draft_model_id = args.draft_model
+    model.initialize()
+    asyncio.run(InferenceServer(model, args.socket).serve())
@@ -0,0 +1,100 @@
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedPrefix:
+    token_ids: torch.Tensor
+    past: tuple
+    nbytes: int
+
+
+class SessionKVCache:
+    """
+    KV-кэш уже обработанной части диалога по session_id.
+    Хранит past_key_values (в legacy-формате кортежей) вместе с токенами, из которых он получен,
+    вытесняет давно не использованные сессии по лимиту памяти и количества.
+    """
+    def __init__(self, max_bytes: int, max_sessions: int = 64):
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self._entries: "OrderedDict[str, CachedPrefix]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+
+    def match(self, session_id: str, input_ids: torch.Tensor) -> Tuple[int, Optional[tuple]]:
+        """Возвращает длину общего префикса и обрезанный под неё кэш"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return 0, None
+            self._entries.move_to_end(session_id)
+
+        cached_ids = entry.token_ids
+        length = min(len(cached_ids), len(input_ids) - 1)
+        if length <= 0:
+            self.misses += 1
+            return 0, None
+        mismatch = (cached_ids[:length] != input_ids[:length].to(cached_ids.device)).nonzero()
+        prefix = int(mismatch[0]) if len(mismatch) else length
+        if prefix == 0:
+            self.misses += 1
+            return 0, None
+
+        self.hits += 1
+        self.reused_tokens += prefix
+        past = tuple((key[:, :, :prefix], value[:, :, :prefix]) for key, value in entry.past)
+        return prefix, past
+
+    def put(self, session_id: str, token_ids: torch.Tensor, past: tuple):
+        nbytes = sum(key.numel() * key.element_size() + value.numel() * value.element_size() for key, value in past)
+        if nbytes > self.max_bytes:
+            self.drop(session_id)
+            return
+
+        entry = CachedPrefix(token_ids=token_ids.detach().cpu(), past=past, nbytes=nbytes)
+        with self._lock:
+            previous = self._entries.pop(session_id, None)
+            if previous is not None:
+                self._total_bytes -= previous.nbytes
+            self._entries[session_id] = entry
+            self._total_bytes += nbytes
+            self._evict()
+
+    def drop(self, session_id: str):
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._total_bytes -= entry.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def _evict(self):
+        while self._entries and (self._total_bytes > self.max_bytes or len(self._entries) > self.max_sessions):
+            session_id, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.nbytes
+            logger.info(f"KV-кэш сессии {session_id} вытеснен ({entry.nbytes / 2**20:.1f} МБ)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "memory_mb": round(self._total_bytes / 2**20, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "reused_tokens": self.reused_tokens
+            }
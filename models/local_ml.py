@@ -1,11 +1,39 @@
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+import torch.nn.functional as F
+from transformers import (
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    DynamicCache,
+    LogitsProcessorList,
+    NoRepeatNGramLogitsProcessor,
+    RepetitionPenaltyLogitsProcessor,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TemperatureLogitsWarper,
+    TextIteratorStreamer,
+    TopPLogitsWarper,
+)
+from models.context_window import ChatContextWindow
+from models.kv_cache import SessionKVCache
 from models.message import ChatMessage
-from typing import List, Optional
+from models.query_rewriter import STOP_WORDS, QueryRewriter, normalize_message
+from typing import AsyncIterator, List, Optional
+import asyncio
+import concurrent.futures
+import inspect
 import logging
 import gc
-from dataclasses import dataclass
-from helpers.researchAPIv1 import fetch_yandex_search_results, parse_xml_data
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from helpers.answer_cache import AnswerCache
+from helpers.search_cache import SearchCache
+from helpers.search_client import YandexSearchClient
+from helpers.news_store import summarize
+from retrieval.bm25 import BM25Index
+from retrieval.dense import DenseIndex
 
 logger = logging.getLogger(__name__)
 
@@ -15,44 +43,634 @@ class ModelConfig:
     top_p: float = 0.9
     max_tokens: int = 1024
     context_window: int = 2048
+    # Бюджет токенов промпта (системный промпт, контекст поиска, история), по умолчанию context_window - max_tokens
+    prompt_budget: Optional[int] = None
     model_id: str = "mistralai/Mistral-7B-Instruct-v0.3"
+    # "auto" - CUDA при наличии, иначе CPU
+    device: str = "auto"
+    # На CPU по умолчанию берём модель поменьше и квантуем линейные слои в int8
+    cpu_model_id: Optional[str] = "Qwen/Qwen2.5-1.5B-Instruct"
+    cpu_quantize_int8: bool = True
+    cpu_num_threads: Optional[int] = None
+    startup_benchmark: bool = True
+    # Планировщик собирает одновременные запросы в общий цикл декодирования
+    batching_enabled: bool = True
+    max_batch_size: int = 8
+    max_batch_wait_ms: float = 10.0
+    # Кэш префикса диалога по сессиям, 0 - отключён
+    kv_cache_max_mb: int = 2048
+    kv_cache_max_sessions: int = 64
+    # Спекулятивное декодирование: черновая модель предлагает num_assistant_tokens токенов, основная
+    # проверяет их за один проход. Для CPU-модели Qwen2.5-1.5B подходит Qwen/Qwen2.5-0.5B-Instruct.
+    # Генерация идёт по одному запросу, без батчинга и кэша префикса сессий
+    draft_model_id: Optional[str] = None
+    num_assistant_tokens: int = 5
+    # Кэш поисковых запросов, сгенерированных LLM
+    query_cache_size: int = 1024
+    query_cache_ttl_s: float = 6 * 3600
+    # Источник контекста: "local_first" - веб-поиск только если в локальном индексе нашлось мало,
+    # "merge" - локальные и веб-результаты вперемешку, "web" - только Яндекс
+    context_mode: str = "local_first"
+    context_results: int = 3
+    local_min_score: float = 4.0
+    # Порог косинуса для семантического поиска (для multilingual-e5 сходство редко ниже 0.7)
+    dense_min_score: float = 0.8
+    # Кэш ответов на первые вопросы диалога, 0 - отключён. TTL не дольше кэша веб-поиска,
+    # порог косинуса для похожих вопросов высокий: e5 даёт 0.85+ и для разных вопросов на одну тему
+    answer_cache_size: int = 1024
+    answer_cache_max_mb: int = 64
+    answer_cache_ttl_s: float = 3600
+    answer_cache_min_similarity: float = 0.95
+
+
+@dataclass
+class GenerationParams:
+    max_new_tokens: int
+    temperature: float
+    top_p: float
+    repetition_penalty: float = 1.2
+    no_repeat_ngram_size: int = 3
+    do_sample: bool = True
+
+    def logits_processors(self) -> LogitsProcessorList:
+        processors = LogitsProcessorList()
+        if self.repetition_penalty != 1.0:
+            processors.append(RepetitionPenaltyLogitsProcessor(self.repetition_penalty))
+        if self.no_repeat_ngram_size > 0:
+            processors.append(NoRepeatNGramLogitsProcessor(self.no_repeat_ngram_size))
+        if self.do_sample:
+            processors.append(TemperatureLogitsWarper(self.temperature))
+            processors.append(TopPLogitsWarper(self.top_p))
+        return processors
+
+    def generate_kwargs(self) -> dict:
+        return dict(
+            max_new_tokens=self.max_new_tokens,
+            temperature=self.temperature,
+            top_p=self.top_p,
+            do_sample=self.do_sample,
+            repetition_penalty=self.repetition_penalty,
+            no_repeat_ngram_size=self.no_repeat_ngram_size,
+            use_cache=True
+        )
+
+
+# Ключ кэша префикса для генерации поисковых запросов: системный промпт у них общий
+SEARCH_QUERY_CACHE_KEY = "__search_query__"
+
+# Параметры генерации поискового запроса: коротко и почти детерминированно
+SEARCH_QUERY_PARAMS = GenerationParams(
+    max_new_tokens=30,
+    temperature=0.1,
+    top_p=0.9,
+    repetition_penalty=1.2,
+    no_repeat_ngram_size=2
+)
+
+
+class CancelCriteria(StoppingCriteria):
+    """Останавливает генерацию, если клиент отключился от стрима"""
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.event.is_set()
+
+
+class DraftAcceptanceCounter:
+    """
+    Статистика спекулятивного декодирования по forward-хукам: каждый проход основной модели
+    подтверждает часть черновых токенов и добавляет один свой, каждый проход черновой - один черновой токен.
+    Счётчики проходов ведутся по потокам, поэтому одновременные генерации не смешиваются.
+    """
+    def __init__(self, model, draft_model):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        model.register_forward_hook(lambda *_: self._count("target_calls"))
+        draft_model.register_forward_hook(lambda *_: self._count("draft_calls"))
+        self.generations = 0
+        self.new_tokens = 0
+        self.drafted = 0
+        self.accepted = 0
+
+    def _count(self, name: str):
+        setattr(self._local, name, getattr(self._local, name, 0) + 1)
+
+    def begin(self):
+        self._local.target_calls = 0
+        self._local.draft_calls = 0
+
+    def finish(self, new_tokens: int):
+        drafted = self._local.draft_calls
+        accepted = min(drafted, max(0, new_tokens - self._local.target_calls))
+        with self._lock:
+            self.generations += 1
+            self.new_tokens += new_tokens
+            self.drafted += drafted
+            self.accepted += accepted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "generations": self.generations,
+                "new_tokens": self.new_tokens,
+                "drafted": self.drafted,
+                "accepted": self.accepted,
+                "acceptance_rate": round(self.accepted / self.drafted, 3) if self.drafted else None
+            }
+
+
+@dataclass
+class GenerationRequest:
+    input_ids: torch.Tensor
+    params: GenerationParams
+    future: concurrent.futures.Future
+    streamer: Optional[TextIteratorStreamer] = None
+    cancelled: Optional[threading.Event] = None
+    session_id: Optional[str] = None
+    sequence: Optional[torch.Tensor] = None
+    processors: Optional[LogitsProcessorList] = None
+    generated: List[int] = field(default_factory=list)
+    started_at: float = 0.0
+
+
+class InferenceScheduler:
+    """
+    Непрерывный батчинг: все активные запросы декодируются одним forward-проходом за шаг.
+    Новые запросы проходят prefill по отдельности и вливаются в батч между шагами,
+    завершившиеся сразу покидают батч и отдают результат.
+    """
+    def __init__(self, model, tokenizer, max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 kv_cache: Optional[SessionKVCache] = None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.kv_cache = kv_cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.device = model.device
+
+        eos = model.generation_config.eos_token_id
+        eos = eos if isinstance(eos, list) else [eos]
+        self.eos_token_ids = {token for token in eos + [tokenizer.eos_token_id] if token is not None}
+        self._logits_to_keep = 'num_logits_to_keep' in inspect.signature(model.forward).parameters
+
+        self._queue: "queue.Queue[Optional[GenerationRequest]]" = queue.Queue()
+        self._active: List[GenerationRequest] = []
+        self._past = None
+        self._attention_mask: Optional[torch.Tensor] = None
+        self._next_tokens: Optional[torch.Tensor] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(f"Планировщик генерации запущен (батч до {self.max_batch_size}, ожидание {self.max_wait * 1000:.0f} мс)")
+
+    def stop(self):
+        self._stop.set()
+        self._queue.put(None)
+        if self._thread:
+            self._thread.join(timeout=10)
+        self._fail_active(RuntimeError("Планировщик генерации остановлен"))
+
+    def submit(self, input_ids: torch.Tensor, params: GenerationParams,
+               streamer: Optional[TextIteratorStreamer] = None,
+               cancelled: Optional[threading.Event] = None,
+               session_id: Optional[str] = None) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        self._queue.put(GenerationRequest(
+            input_ids=input_ids,
+            params=params,
+            future=future,
+            streamer=streamer,
+            cancelled=cancelled,
+            session_id=session_id
+        ))
+        return future
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._admit_pending()
+                if self._active:
+                    self._decode_step()
+            except Exception as e:
+                logger.error(f"Ошибка в цикле планировщика: {str(e)}")
+                self._fail_active(e)
+
+    def _collect_pending(self) -> List[GenerationRequest]:
+        capacity = self.max_batch_size - len(self._active)
+        pending = []
+        if capacity <= 0:
+            return pending
+
+        if not self._active:
+            # Простаиваем: ждём первый запрос и даём соседям max_wait, чтобы попасть в тот же батч
+            try:
+                pending.append(self._queue.get(timeout=0.5))
+            except queue.Empty:
+                return pending
+            deadline = time.monotonic() + self.max_wait
+            while len(pending) < capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        else:
+            # Батч уже крутится - забираем только то, что успело прийти, не задерживая шаг
+            while len(pending) < capacity:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+        return [request for request in pending if request is not None]
+
+    def _admit_pending(self):
+        for request in self._collect_pending():
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            try:
+                self._prefill(request)
+            except Exception as e:
+                logger.error(f"Ошибка при prefill запроса: {str(e)}")
+                self._finish(request, error=e)
+
+    @torch.no_grad()
+    def _prefill(self, request: GenerationRequest):
+        request.started_at = time.perf_counter()
+        input_ids = request.input_ids.to(self.device)
+        request.sequence = input_ids
+        request.processors = request.params.logits_processors()
+        if request.streamer:
+            request.streamer.put(request.input_ids.cpu())
+
+        # Уже обработанную часть диалога берём из кэша сессии и досчитываем только новый хвост
+        prefix_length, past = 0, None
+        if self.kv_cache is not None and request.session_id:
+            prefix_length, past = self.kv_cache.match(request.session_id, input_ids[0])
+        length = input_ids.shape[1]
+
+        kwargs = {'num_logits_to_keep': 1} if self._logits_to_keep else {}
+        outputs = self.model(
+            input_ids=input_ids[:, prefix_length:],
+            attention_mask=torch.ones_like(input_ids),
+            position_ids=torch.arange(prefix_length, length, device=self.device).unsqueeze(0),
+            past_key_values=DynamicCache.from_legacy_cache(past) if past else None,
+            use_cache=True,
+            **kwargs
+        )
+        if prefix_length:
+            logger.info(f"Prefill: переиспользовано {prefix_length} из {length} токенов промпта")
+        past = self._to_legacy(outputs.past_key_values)
+        token = self._sample(request, outputs.logits[:, -1, :])
+        if self._append_token(request, token):
+            self._save_session_cache(request, past)
+            self._finish(request)
+            return
+        self._merge(request, past, token)
+
+    @torch.no_grad()
+    def _decode_step(self):
+        attention_mask = F.pad(self._attention_mask, (0, 1), value=1)
+        position_ids = attention_mask.sum(dim=-1, keepdim=True) - 1
+        outputs = self.model(
+            input_ids=self._next_tokens,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=DynamicCache.from_legacy_cache(self._past),
+            use_cache=True
+        )
+        self._past = self._to_legacy(outputs.past_key_values)
+        self._attention_mask = attention_mask
+
+        logits = outputs.logits[:, -1, :]
+        keep, next_tokens = [], []
+        for row, request in enumerate(self._active):
+            token = self._sample(request, logits[row:row + 1])
+            if self._append_token(request, token):
+                self._save_session_cache(request, self._past, row)
+                self._finish(request)
+            else:
+                keep.append(row)
+                next_tokens.append(token)
+
+        if len(keep) < len(self._active):
+            self._select_rows(keep)
+        if self._active:
+            self._next_tokens = torch.tensor(next_tokens, device=self.device).view(-1, 1)
+
+    def _sample(self, request: GenerationRequest, logits: torch.Tensor) -> int:
+        scores = request.processors(request.sequence, logits.float())
+        if request.params.do_sample:
+            probs = torch.softmax(scores, dim=-1)
+            return int(torch.multinomial(probs, num_samples=1)[0, 0])
+        return int(torch.argmax(scores, dim=-1)[0])
+
+    def _append_token(self, request: GenerationRequest, token: int) -> bool:
+        """Добавляет токен к запросу и сообщает, завершена ли его генерация"""
+        request.generated.append(token)
+        token_tensor = torch.tensor([[token]], device=self.device)
+        request.sequence = torch.cat([request.sequence, token_tensor], dim=-1)
+        if request.streamer:
+            request.streamer.put(token_tensor.cpu())
+        return (
+            token in self.eos_token_ids
+            or len(request.generated) >= request.params.max_new_tokens
+            or (request.cancelled is not None and request.cancelled.is_set())
+        )
+
+    def _merge(self, request: GenerationRequest, past, token: int):
+        length = request.sequence.shape[1] - 1
+        attention_mask = torch.ones((1, length), dtype=torch.long, device=self.device)
+        next_token = torch.tensor([[token]], device=self.device)
+
+        if not self._active:
+            self._past, self._attention_mask, self._next_tokens = past, attention_mask, next_token
+        else:
+            # Выравниваем длины кэшей паддингом слева, паддинг закрыт маской внимания
+            current = self._attention_mask.shape[1]
+            if length < current:
+                past = self._pad_past(past, current - length)
+                attention_mask = F.pad(attention_mask, (current - length, 0), value=0)
+            elif length > current:
+                self._past = self._pad_past(self._past, length - current)
+                self._attention_mask = F.pad(self._attention_mask, (length - current, 0), value=0)
+
+            self._past = tuple(
+                (torch.cat([key, new_key]), torch.cat([value, new_value]))
+                for (key, value), (new_key, new_value) in zip(self._past, past)
+            )
+            self._attention_mask = torch.cat([self._attention_mask, attention_mask])
+            self._next_tokens = torch.cat([self._next_tokens, next_token])
+
+        self._active.append(request)
+
+    def _select_rows(self, rows: List[int]):
+        self._active = [self._active[row] for row in rows]
+        if not self._active:
+            self._past, self._attention_mask, self._next_tokens = None, None, None
+            return
+
+        index = torch.tensor(rows, device=self.device)
+        attention_mask = self._attention_mask.index_select(0, index)
+        # После ухода длинного запроса слева остаются колонки, где у всех паддинг
+        start = int(attention_mask.any(dim=0).nonzero()[0])
+        self._attention_mask = attention_mask[:, start:]
+        self._past = tuple(
+            (key.index_select(0, index)[:, :, start:], value.index_select(0, index)[:, :, start:])
+            for key, value in self._past
+        )
+
+    def _save_session_cache(self, request: GenerationRequest, past, row: int = 0):
+        if self.kv_cache is None or not request.session_id:
+            return
+        # Последний сгенерированный токен ещё не прошёл через модель, его KV в кэше нет
+        length = request.sequence.shape[1] - 1
+        row_past = tuple(
+            (key[row:row + 1, :, -length:].clone(), value[row:row + 1, :, -length:].clone())
+            for key, value in past
+        )
+        self.kv_cache.put(request.session_id, request.sequence[0, :length], row_past)
+
+    def _finish(self, request: GenerationRequest, error: Optional[Exception] = None):
+        if not request.future.done():
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                elapsed = time.perf_counter() - request.started_at
+                logger.info(
+                    f"Генерация завершена: {len(request.generated)} токенов за {elapsed:.2f} с, "
+                    f"активных запросов в батче: {len(self._active)}"
+                )
+                request.future.set_result(request.generated)
+        # Стример закрываем после future: читатель стрима сразу проверяет её на ошибку
+        if request.streamer:
+            request.streamer.end()
+
+    def _fail_active(self, error: Exception):
+        for request in self._active:
+            self._finish(request, error=error)
+        self._active = []
+        self._past, self._attention_mask, self._next_tokens = None, None, None
+
+    @staticmethod
+    def _pad_past(past, pad: int):
+        return tuple(
+            (F.pad(key, (0, 0, pad, 0)), F.pad(value, (0, 0, pad, 0)))
+            for key, value in past
+        )
+
+    @staticmethod
+    def _to_legacy(past):
+        return past.to_legacy_cache() if hasattr(past, 'to_legacy_cache') else past
+
 
 class MLModel:
-    def __init__(self, config: Optional[ModelConfig] = None):
+    def __init__(self, config: Optional[ModelConfig] = None, search_client: Optional[SearchCache] = None,
+                 local_index: Optional[BM25Index] = None, dense_index: Optional[DenseIndex] = None):
         self.config = config or ModelConfig()
+        self.search_client = search_client or SearchCache(YandexSearchClient())
+        self.local_index = local_index
+        self.dense_index = dense_index
         self.model: Optional[AutoModelForCausalLM] = None
         self.tokenizer: Optional[AutoTokenizer] = None
+        self.draft_model: Optional[AutoModelForCausalLM] = None
+        self.draft_tokenizer: Optional[AutoTokenizer] = None
+        self.draft_counter: Optional[DraftAcceptanceCounter] = None
+        self.scheduler: Optional[InferenceScheduler] = None
+        self.kv_cache: Optional[SessionKVCache] = None
+        self.context_window: Optional[ChatContextWindow] = None
+        self.query_rewriter = QueryRewriter(
+            self.generate_search_query,
+            cache_size=self.config.query_cache_size,
+            ttl_seconds=self.config.query_cache_ttl_s
+        )
+        self.answer_cache = AnswerCache(
+            encoder=dense_index.encoder if dense_index is not None else None,
+            max_entries=self.config.answer_cache_size,
+            max_bytes=self.config.answer_cache_max_mb * 2**20,
+            ttl_seconds=self.config.answer_cache_ttl_s,
+            min_similarity=self.config.answer_cache_min_similarity
+        ) if self.config.answer_cache_size > 0 else None
         self._is_initialized = False
         self.chat_template = None
         
     def initialize(self):
         try:
-            if not torch.cuda.is_available():
-                raise RuntimeError("CUDA недоступна")
-            
-            self.tokenizer = AutoTokenizer.from_pretrained(self.config.model_id)
+            device = self._resolve_device()
+            model_id = self._resolve_model_id(device)
+
+            self.tokenizer = AutoTokenizer.from_pretrained(model_id)
             if self.tokenizer.pad_token_id is None:
                 self.tokenizer.pad_token_id = self.tokenizer.eos_token_id
             
             self.chat_template = self.tokenizer.chat_template
+            self.context_window = ChatContextWindow(self.tokenizer, budget=self._prompt_budget())
                 
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.config.model_id,
-                torch_dtype=torch.bfloat16,
-                device_map="auto"
-            )
+            if device == "cuda":
+                self.model = AutoModelForCausalLM.from_pretrained(
+                    model_id,
+                    torch_dtype=torch.bfloat16,
+                    device_map="auto"
+                )
+            else:
+                self.model = self._load_cpu_model(model_id)
+
+            self._report_footprint(model_id, device)
+            if self.config.draft_model_id:
+                self._load_draft_model(device)
+            if self.config.startup_benchmark:
+                self._benchmark_decode()
+            self._start_scheduler()
             self._is_initialized = True
             logger.info("Модель успешно загружена")
         except Exception as e:
             logger.error(f"Ошибка при инициализации модели: {str(e)}")
             raise
 
-    async def generate_search_query(self, user_message: str) -> str:
-        """Генерирует поисковый запрос на основе сообщения пользователя"""
+    def _prompt_budget(self) -> int:
+        if self.config.prompt_budget is not None:
+            return self.config.prompt_budget
+        return max(256, self.config.context_window - self.config.max_tokens)
+
+    def _resolve_device(self) -> str:
+        device = self.config.device
+        if device == "auto":
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            if device == "cpu":
+                logger.warning("CUDA недоступна, модель будет запущена на CPU")
+        elif device == "cuda" and not torch.cuda.is_available():
+            raise RuntimeError("CUDA недоступна")
+        return device
+
+    def _resolve_model_id(self, device: str) -> str:
+        if device == "cpu" and self.config.cpu_model_id:
+            return self.config.cpu_model_id
+        return self.config.model_id
+
+    def _load_cpu_model(self, model_id: str):
+        if self.config.cpu_num_threads:
+            torch.set_num_threads(self.config.cpu_num_threads)
+        logger.info(f"Загрузка модели {model_id} на CPU, потоков torch: {torch.get_num_threads()}")
+
+        model = AutoModelForCausalLM.from_pretrained(
+            model_id,
+            torch_dtype=torch.float32,
+            low_cpu_mem_usage=True
+        )
+        model.eval()
+        if self.config.cpu_quantize_int8:
+            # Динамическая квантизация: веса Linear хранятся в int8, активации квантуются на лету
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            logger.info("Линейные слои квантованы в int8")
+        return model
+
+    def _load_draft_model(self, device: str):
+        draft_id = self.config.draft_model_id
+        if device == "cuda":
+            draft_model = AutoModelForCausalLM.from_pretrained(draft_id, torch_dtype=torch.bfloat16)
+            draft_model = draft_model.to(self.model.device).eval()
+        else:
+            draft_model = self._load_cpu_model(draft_id)
+
+        draft_tokenizer = AutoTokenizer.from_pretrained(draft_id)
+        if draft_tokenizer.get_vocab() != self.tokenizer.get_vocab():
+            # transformers перекодирует черновые токены через текст, это медленнее, но работает
+            logger.warning(f"Словарь черновой модели {draft_id} отличается от основной, "
+                           "токены будут сопоставляться через текст")
+            self.draft_tokenizer = draft_tokenizer
+
+        draft_model.generation_config.num_assistant_tokens = self.config.num_assistant_tokens
+        self.draft_model = draft_model
+        self.draft_counter = DraftAcceptanceCounter(self.model, draft_model)
+        logger.info(f"Спекулятивное декодирование: черновая модель {draft_id}, "
+                    f"{self.config.num_assistant_tokens} токенов за шаг")
+
+    def _report_footprint(self, model_id: str, device: str):
+        weights_bytes = 0
+        for value in self.model.state_dict().values():
+            # У квантованных слоёв упакованные параметры лежат кортежем (вес, смещение)
+            tensors = value if isinstance(value, tuple) else (value,)
+            for tensor in tensors:
+                if isinstance(tensor, torch.Tensor):
+                    weights_bytes += tensor.numel() * tensor.element_size()
+
+        message = f"Модель {model_id} ({device}): веса {weights_bytes / 2**20:.0f} МБ"
         try:
-            system_prompt = ChatMessage(
-                role="system",
-                content="""You are a public relations manager at Chelyabinsk State University. 
+            import psutil
+            rss = psutil.Process(os.getpid()).memory_info().rss
+            message += f", RSS процесса {rss / 2**20:.0f} МБ"
+        except ImportError:
+            pass
+        if device == "cuda":
+            message += f", выделено CUDA {torch.cuda.memory_allocated() / 2**20:.0f} МБ"
+        logger.info(message)
+
+    def _benchmark_decode(self, new_tokens: int = 32):
+        """Короткий прогрев с замером скорости декодирования"""
+        inputs = self.tokenizer.apply_chat_template(
+            [ChatMessage(role="user", content="Расскажите о Челябинском государственном университете")],
+            add_generation_prompt=True,
+            return_tensors="pt"
+        )
+        params = GenerationParams(
+            max_new_tokens=new_tokens,
+            temperature=1.0,
+            top_p=1.0,
+            repetition_penalty=1.0,
+            no_repeat_ngram_size=0,
+            do_sample=False
+        )
+        started = time.perf_counter()
+        token_ids = self._generate_serial(inputs, params)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Прогрев: {len(token_ids)} токенов за {elapsed:.2f} с ({len(token_ids) / elapsed:.1f} токенов/с)")
+
+    def _start_scheduler(self):
+        if self.draft_model is not None:
+            # Проверка черновых токенов идёт по одной последовательности и со своим кэшем черновой модели
+            logger.info("Черновая модель загружена: батчинг и кэш префикса сессий отключены")
+            return
+        if self.config.kv_cache_max_mb > 0:
+            self.kv_cache = SessionKVCache(
+                max_bytes=self.config.kv_cache_max_mb * 2**20,
+                max_sessions=self.config.kv_cache_max_sessions
+            )
+        if not self.config.batching_enabled:
+            return
+        self.scheduler = InferenceScheduler(
+            self.model,
+            self.tokenizer,
+            max_batch_size=self.config.max_batch_size,
+            max_wait_ms=self.config.max_batch_wait_ms,
+            kv_cache=self.kv_cache
+        )
+        self.scheduler.start()
+
+    @property
+    def chat_params(self) -> GenerationParams:
+        return GenerationParams(
+            max_new_tokens=self.config.max_tokens,
+            temperature=self.config.temperature,
+            top_p=self.config.top_p
+        )
+
+    async def generate_search_query(self, user_message: str) -> str:
+        """Генерирует поисковый запрос на основе сообщения пользователя, ошибки генерации пробрасываются"""
+        inputs = self._search_query_inputs(user_message)
+        query = await self._generate(inputs, SEARCH_QUERY_PARAMS, session_id=SEARCH_QUERY_CACHE_KEY)
+        logger.info(f"Сгенерированный поисковый запрос: {query}")
+        return query.strip()
+
+    def _search_query_inputs(self, user_message: str) -> torch.Tensor:
+        system_prompt = ChatMessage(
+            role="system",
+            content="""You are a public relations manager at Chelyabinsk State University. 
                 Your task is: 
                 1. Answer questions about the university and its programs 
                 2. Use mainly Russian language 
@@ -68,130 +686,315 @@ class MLModel:
                 - Use the official communication style
                 - Include relevant links when available
                 - Do not repeat the same information"""
-            )
-            user_prompt = ChatMessage(
-                role="user",
-                content=f"Сформулируйте поисковый запрос для вопроса: {user_message}"
-            )
-            
-            inputs = self.tokenizer.apply_chat_template(
-                [system_prompt, user_prompt],
-                add_generation_prompt=True,
-                return_tensors="pt"
-            )
-            input_length = inputs.shape[1]
-            
-            attention_mask = torch.ones_like(inputs)
-            inputs = inputs.to(self.model.device)
-            attention_mask = attention_mask.to(self.model.device)
-
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    inputs,
-                    attention_mask=attention_mask,
-                    max_new_tokens=30,  # Ограничиваем длину запроса
-                    temperature=0.1,    # Делаем генерацию более детерминированной
-                    top_p=0.9,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.pad_token_id,
-                    repetition_penalty=1.2,
-                    no_repeat_ngram_size=2,
-                    use_cache=True
-                )
-            
-            query = self.tokenizer.decode(outputs[0][input_length:], skip_special_tokens=True)
-            logger.info(f"Сгенерированный поисковый запрос: {query}")
-            
-            return query.strip()
-            
-        except Exception as e:
-            logger.error(f"Ошибка при генерации поискового запроса: {str(e)}")
-            return f"ЧелГУ {user_message[:50]}" 
+        )
+        user_prompt = ChatMessage(
+            role="user",
+            content=f"Сформулируйте поисковый запрос для вопроса: {user_message}"
+        )
+        
+        inputs = self.tokenizer.apply_chat_template(
+            [system_prompt, user_prompt],
+            add_generation_prompt=True,
+            return_tensors="pt"
+        )
+        return inputs
 
     async def get_search_context(self, user_message: str) -> str:
+        limit = self.config.context_results
+        local_results = []
+        if self.config.context_mode != "web":
+            local_results = await self._search_local(user_message, limit)
+
+        web_results = []
+        if self.config.context_mode == "merge" or len(local_results) < limit:
+            web_results = await self._search_web(user_message, limit)
+
+        if self.config.context_mode == "merge":
+            # Чередуем источники, чтобы в контекст попали лучшие результаты обоих
+            merged = [result for pair in zip(local_results, web_results) for result in pair]
+            shorter = min(len(local_results), len(web_results))
+            results = merged + local_results[shorter:] + web_results[shorter:]
+        else:
+            results = local_results + web_results
+
+        context = ""
+        seen_urls = set()
+        for result in results:
+            # Очищаем URL от пробелов и лишних символов
+            clean_url = result['url'].strip().replace(" ", "")
+            if clean_url in seen_urls:
+                continue
+            seen_urls.add(clean_url)
+            context += f"- {result['title']}\n  Ссылка: {clean_url}\n"
+            if result.get('text'):
+                context += f"  Фрагмент: {summarize(result['text'])}\n"
+            elif result.get('headline'):
+                context += f"  Краткое содержание: {result['headline']}\n"
+            if len(seen_urls) >= limit:
+                break
+
+        return "Релевантные источники:\n" + context if context else ""
+
+    async def _search_local(self, user_message: str, limit: int) -> List[dict]:
+        # Вопросительные слова не несут смысла для BM25 и только размывают оценку
+        query = " ".join(word for word in normalize_message(user_message).split() if word not in STOP_WORDS)
+        sources = []
+        if self.local_index is not None:
+            sources.append(("BM25", self.local_index.search, query, self.config.local_min_score))
+        if self.dense_index is not None:
+            sources.append(("векторный", self.dense_index.search, user_message, self.config.dense_min_score))
+        if not sources:
+            return []
+
+        found = await asyncio.gather(
+            *(asyncio.to_thread(search, text, limit) for _, search, text, _ in sources),
+            return_exceptions=True
+        )
+
+        # Шкалы оценок у источников несравнимы, поэтому объединяем по рангам (reciprocal rank fusion)
+        fused = {}
+        for (name, _, _, min_score), results in zip(sources, found):
+            if isinstance(results, Exception):
+                logger.error(f"Ошибка локального поиска ({name}): {str(results)}")
+                continue
+            results = [result for result in results if result['score'] >= min_score]
+            logger.info(f"Локальный поиск ({name}): {len(results)} результатов")
+            for rank, result in enumerate(results):
+                entry = fused.setdefault(result['url'], [0.0, result])
+                entry[0] += 1.0 / (60 + rank)
+        return [result for _, result in sorted(fused.values(), key=lambda entry: -entry[0])][:limit]
+
+    async def _search_web(self, user_message: str, limit: int) -> List[dict]:
         try:
-            search_query = await self.generate_search_query(user_message)
-            xml = fetch_yandex_search_results(search_query)
-            results = parse_xml_data(xml)
-            
-            context = "Релевантные источники:\n"
-            for result in results[:3]:
-                # Очищаем URL от пробелов и лишних символов
-                clean_url = result['url'].strip().replace(" ", "")
-                context += f"- {result['title']}\n  Ссылка: {clean_url}\n"
-                if result['headline']:
-                    context += f"  Краткое содержание: {result['headline']}\n"
-            
-            return context
+            search_query = await self.query_rewriter.rewrite(user_message)
+            return await self.search_client.search(search_query, limit=limit)
         except Exception as e:
             logger.error(f"Ошибка при получении контекста поиска: {str(e)}")
-            return ""
+            return []
 
-    async def generate_response(self, messages: List[ChatMessage]) -> str:
+    async def generate_response(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> str:
         if not self._is_initialized:
             logger.error("Попытка использовать неинициализированную модель")
             raise RuntimeError("Модель не инициализирована")
 
         try:
             user_message = messages[-1].content
+            lookup = await self._cached_answer(messages)
+            if lookup is not None and lookup.answer is not None:
+                return lookup.answer
+
             search_context = await self.get_search_context(user_message)
             logger.info(f"Получен поисковый контекст: {search_context}")
-            
-            system_message = ChatMessage(
-                role="system",
-                content=f"""Вы - менеджер по связям с общественностью Челябинского государственного университета. 
-                
-                Используйте следующую информацию при ответе:
-                {search_context}
-                
-                Формат ответа:
-                1. Дайте краткий и информативный ответ на вопрос пользователя
-                2. Не включайте ссылки в ответ, они будут добавлены автоматически
-                3. Используйте только достоверную информацию из контекста"""
-            )
-            
-            messages_with_context = [system_message] + messages
-            
-            inputs = self.tokenizer.apply_chat_template(
-                messages_with_context,
-                add_generation_prompt=True,
-                return_tensors="pt"
-            )
-            
-            input_length = inputs.shape[1]
-            attention_mask = torch.ones_like(inputs)
-            inputs = inputs.to(self.model.device)
-            attention_mask = attention_mask.to(self.model.device)
-
-            with torch.no_grad():
-                logger.info("Начало генерации")
-                outputs = self.model.generate(
-                    inputs,
-                    attention_mask=attention_mask,
-                    max_new_tokens=self.config.max_tokens,
-                    temperature=self.config.temperature,
-                    top_p=self.config.top_p,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.pad_token_id,
-                    repetition_penalty=1.2,
-                    no_repeat_ngram_size=3,
-                    use_cache=True
-                )
-                logger.info("Генерация завершена")
-            
-            response = self.tokenizer.decode(outputs[0][input_length:], skip_special_tokens=True)
+
+            logger.info("Начало генерации")
+            response = await self.generate_reply(messages, search_context, session_id=session_id)
+            logger.info("Генерация завершена")
             
             # Добавляем релевантные источники к ответу
             final_response = f"{response.strip()}\n{search_context}"
             print(f'Что должен видеть пользователь: {final_response}')
+            # Пустой ответ модели в кэш не кладём, иначе он будет возвращаться на тот же вопрос весь TTL
+            if lookup is not None and response.strip():
+                self.answer_cache.put(lookup, final_response)
             return final_response
                 
         except Exception as e:
             logger.error(f"Ошибка при генерации ответа: {str(e)}")
             raise
+
+    async def stream_response(self, messages: List[ChatMessage], session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Отдаёт ответ по частям по мере генерации токенов, ссылки из контекста идут последним фрагментом"""
+        if not self._is_initialized:
+            logger.error("Попытка использовать неинициализированную модель")
+            raise RuntimeError("Модель не инициализирована")
+
+        user_message = messages[-1].content
+        lookup = await self._cached_answer(messages)
+        if lookup is not None and lookup.answer is not None:
+            yield lookup.answer
+            return
+
+        search_context = await self.get_search_context(user_message)
+        logger.info(f"Получен поисковый контекст: {search_context}")
+
+        logger.info("Начало потоковой генерации")
+        chunks = []
+        async for chunk in self.stream_reply(messages, search_context, session_id=session_id):
+            chunks.append(chunk)
+            yield chunk
+        logger.info("Потоковая генерация завершена")
+        yield f"\n{search_context}"
+        # Сюда доходим только без ошибки генерации: она поднимается из stream_reply
+        answer = "".join(chunks)
+        if lookup is not None and answer.strip():
+            self.answer_cache.put(lookup, f"{answer}\n{search_context}")
+
+    async def _cached_answer(self, messages: List[ChatMessage]):
+        """Кэш ответов только для первого вопроса: с историей ответ зависит от предыдущих реплик"""
+        if self.answer_cache is None or len(messages) != 1:
+            return None
+        lookup = await self.answer_cache.get(messages[0].content)
+        if lookup.answer is not None:
+            logger.info(f"Ответ из кэша (сходство {lookup.similarity:.3f})")
+        return lookup
+
+    async def generate_reply(self, messages: List[ChatMessage], search_context: str,
+                             session_id: Optional[str] = None) -> str:
+        """Ответ модели на диалог с готовым поисковым контекстом, без ссылок на источники"""
+        inputs = self._prepare_inputs(messages, search_context, session_id=session_id)
+        return await self._generate(inputs, self.chat_params, session_id=session_id)
+
+    async def stream_reply(self, messages: List[ChatMessage], search_context: str,
+                           session_id: Optional[str] = None) -> AsyncIterator[str]:
+        inputs = self._prepare_inputs(messages, search_context, session_id=session_id)
+        async for chunk in self._stream(inputs, self.chat_params, session_id=session_id):
+            yield chunk
+
+    async def _generate(self, inputs: torch.Tensor, params: GenerationParams,
+                        session_id: Optional[str] = None) -> str:
+        if self.scheduler:
+            token_ids = await asyncio.wrap_future(self.scheduler.submit(inputs, params, session_id=session_id))
+        else:
+            token_ids = await asyncio.to_thread(self._generate_serial, inputs, params, session_id=session_id)
+        return self.tokenizer.decode(token_ids, skip_special_tokens=True)
+
+    async def _stream(self, inputs: torch.Tensor, params: GenerationParams,
+                      session_id: Optional[str] = None) -> AsyncIterator[str]:
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        cancelled = threading.Event()
+
+        if self.scheduler:
+            future = self.scheduler.submit(inputs, params, streamer=streamer, cancelled=cancelled,
+                                           session_id=session_id)
+        else:
+            future = concurrent.futures.Future()
+
+            def run_generation():
+                try:
+                    future.set_result(self._generate_serial(inputs, params, streamer=streamer,
+                                                            cancelled=cancelled, session_id=session_id))
+                except Exception as e:
+                    logger.error(f"Ошибка при потоковой генерации: {str(e)}")
+                    future.set_exception(e)
+                    streamer.end()
+
+            threading.Thread(target=run_generation, daemon=True).start()
+
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, streamer, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+            # Стример закрывается и при ошибке генерации - оборванный ответ не должен выглядеть завершённым
+            await asyncio.wrap_future(future)
+        finally:
+            # Клиент мог отключиться посреди ответа - не держим GPU впустую
+            cancelled.set()
+
+    def _generate_serial(self, inputs: torch.Tensor, params: GenerationParams,
+                         streamer: Optional[TextIteratorStreamer] = None,
+                         cancelled: Optional[threading.Event] = None,
+                         session_id: Optional[str] = None) -> List[int]:
+        input_length = inputs.shape[1]
+        attention_mask = torch.ones_like(inputs).to(self.model.device)
+        inputs = inputs.to(self.model.device)
+        stopping_criteria = StoppingCriteriaList([CancelCriteria(cancelled)]) if cancelled else None
+
+        past = None
+        if self.kv_cache is not None and session_id:
+            prefix_length, past = self.kv_cache.match(session_id, inputs[0])
+            if prefix_length:
+                logger.info(f"Prefill: переиспользовано {prefix_length} из {input_length} токенов промпта")
+
+        assisted = {}
+        if self.draft_model is not None:
+            assisted["assistant_model"] = self.draft_model
+            if self.draft_tokenizer is not None:
+                assisted.update(tokenizer=self.tokenizer, assistant_tokenizer=self.draft_tokenizer)
+            self.draft_counter.begin()
+
+        with torch.no_grad():
+            outputs = self.model.generate(
+                inputs,
+                attention_mask=attention_mask,
+                pad_token_id=self.tokenizer.pad_token_id,
+                streamer=streamer,
+                stopping_criteria=stopping_criteria,
+                past_key_values=DynamicCache.from_legacy_cache(past) if past else None,
+                return_dict_in_generate=True,
+                **assisted,
+                **params.generate_kwargs()
+            )
+
+        sequence = outputs.sequences[0]
+        if self.draft_counter is not None:
+            self.draft_counter.finish(len(sequence) - input_length)
+        if self.kv_cache is not None and session_id and outputs.past_key_values is not None:
+            past = InferenceScheduler._to_legacy(outputs.past_key_values)
+            cached_length = past[0][0].shape[2]
+            self.kv_cache.put(session_id, sequence[:cached_length], past)
+        return sequence[input_length:].tolist()
+
+    @staticmethod
+    def _system_prompt() -> str:
+        return """Вы - менеджер по связям с общественностью Челябинского государственного университета. 
+            
+            Формат ответа:
+            1. Дайте краткий и информативный ответ на вопрос пользователя
+            2. Не включайте ссылки в ответ, они будут добавлены автоматически
+            3. Используйте только достоверную информацию, приложенную к вопросу"""
+
+    @staticmethod
+    def _question_prompt(question: str, search_context: str) -> str:
+        # Контекст идёт после вопроса: в следующих ходах вопрос останется в истории уже без него,
+        # и общий префикс для KV-кэша дойдёт до конца вопроса
+        if not search_context:
+            return question
+        return f"""{question}
+
+            Используйте следующую информацию при ответе:
+            {search_context}"""
+
+    def _prepare_inputs(self, messages: List[ChatMessage], search_context: str,
+                        session_id: Optional[str] = None) -> torch.Tensor:
+        # Старые реплики отбрасываются, чтобы prefill не рос с длиной сессии и не выходил за окно модели
+        inputs, _ = self.context_window.build(messages, self._system_prompt(), search_context,
+                                              self._question_prompt, session_id=session_id)
+        return inputs
         
+    def stats(self) -> dict:
+        return {
+            "query_rewriter": self.query_rewriter.stats(),
+            "local_index": self.local_index.stats() if self.local_index is not None else None,
+            "dense_index": self.dense_index.stats() if self.dense_index is not None else None,
+            "kv_cache": self.kv_cache.stats() if self.kv_cache else None,
+            "answer_cache": self.answer_cache.stats() if self.answer_cache else None,
+            "context_window": self.context_window.stats() if self.context_window else None,
+            "speculative": self.draft_counter.stats() if self.draft_counter else None
+        }
+
+    async def collect_stats(self) -> dict:
+        return self.stats()
+
+    def drop_session(self, session_id: str):
+        if self.kv_cache:
+            self.kv_cache.drop(session_id)
+        if self.context_window:
+            self.context_window.drop_session(session_id)
+
     def cleanup(self):
         try:
+            if self.scheduler:
+                self.scheduler.stop()
+                self.scheduler = None
+            if self.kv_cache:
+                self.kv_cache.clear()
+            if self.draft_model is not None:
+                self.draft_model.cpu()
+                self.draft_model = None
+                self.draft_counter = None
             if self.model:
                 self.model.cpu()
                 del self.model
@@ -202,4 +1005,4 @@ class MLModel:
             gc.collect()
             logger.info("Ресурсы модели успешно очищены")
         except Exception as e:
-            logger.error(f"Ошибка при очистке ресурсов модели: {str(e)}")
\ No newline at end of file
+            logger.error(f"Ошибка при очистке ресурсов модели: {str(e)}")
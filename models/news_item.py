@@ -1,10 +1,27 @@
-from typing import List
+import hashlib
+from typing import List, Optional
 
 from pydantic import BaseModel
 
 
 class NewsItem(BaseModel):
+    id: str = ""
     title: str
     date: str
     relate_image_link: str
-    description: str
\ No newline at end of file
+    description: str
+    url: Optional[str] = None
+
+
+class NewsSearchResult(BaseModel):
+    id: str
+    title: str
+    date: Optional[str] = None
+    url: str
+    snippet: str
+    score: float
+
+
+def make_news_id(key: str) -> str:
+    """Стабильный идентификатор новости по её URL (или заголовку, если URL нет)"""
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
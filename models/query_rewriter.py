@@ -0,0 +1,123 @@
+import logging
+import re
+from typing import Awaitable, Callable, Tuple
+
+from helpers.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Вопросительные и служебные слова, которые не несут смысла для поисковика
+STOP_WORDS = {
+    "а", "и", "в", "во", "на", "по", "о", "об", "у", "с", "со", "к", "ко", "за", "из", "от", "до", "для", "при",
+    "ли", "же", "бы", "не", "ни", "то", "это", "так", "там", "тут", "вот", "ну", "уже", "еще", "ещё",
+    "как", "где", "когда", "куда", "откуда", "что", "чем", "чего", "какой", "какая", "какое", "какие",
+    "каких", "каким", "сколько", "почему", "зачем", "кто", "кого", "кому", "можно", "нужно", "надо",
+    "подскажите", "скажите", "расскажите", "пожалуйста", "здравствуйте", "привет",
+    "хочу", "хотел", "хотела", "узнать", "интересует", "мне", "меня", "я", "мы", "вы", "вас", "нам",
+    "есть", "был", "была", "будет", "быть", "ваш", "ваше", "ваши", "вашем", "ваша",
+}
+
+# Слова, которые отсылают к предыдущим репликам - без контекста диалога правилами не разобрать
+CONTEXT_WORDS = {"он", "она", "оно", "они", "его", "её", "ее", "их", "этот", "эта", "эти", "этом", "туда", "тогда", "такой"}
+
+# Темы, по которым типичные вопросы хорошо превращаются в запрос набором ключевых слов
+TOPIC_STEMS = (
+    "поступ", "абитуриент", "приемн", "приёмн", "экзамен", "егэ", "балл", "общежит", "факультет", "институт",
+    "кафедр", "специальн", "направлен", "программ", "магистрат", "бакалавр", "аспирант", "стипенд", "обучен",
+    "стоимост", "платн", "бюджет", "расписан", "сессия", "ректор", "адрес", "контакт", "телефон", "новост",
+    "олимпиад", "конференц", "колледж", "филиал", "библиотек", "практик", "военн",
+)
+
+UNIVERSITY_MARKERS = ("челгу", "чгу", "университет", "вуз")
+
+WORD_RE = re.compile(r"[a-zа-яё0-9]+(?:-[a-zа-яё0-9]+)*")
+
+
+def normalize_message(text: str) -> str:
+    return " ".join(WORD_RE.findall(text.lower().replace("ё", "е")))
+
+
+class QueryRewriter:
+    """
+    Превращает сообщение пользователя в поисковый запрос.
+    Типичные вопросы разбираются правилами, остальное уходит в LLM,
+    а её ответы кэшируются по нормализованному тексту сообщения. Если LLM не ответила,
+    возвращается запасной запрос из начала сообщения - он в кэш не попадает.
+    """
+    def __init__(self, llm_rewrite: Callable[[str], Awaitable[str]],
+                 cache_size: int = 1024, ttl_seconds: float = 6 * 3600, min_confidence: float = 0.6):
+        self.llm_rewrite = llm_rewrite
+        self.cache = TTLCache(max_size=cache_size, ttl_seconds=ttl_seconds)
+        self.min_confidence = min_confidence
+        self.rule_hits = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.llm_errors = 0
+
+    async def rewrite(self, user_message: str) -> str:
+        query, confidence = self.rule_based(user_message)
+        if confidence >= self.min_confidence:
+            self.rule_hits += 1
+            logger.info(f"Поисковый запрос по правилам ({confidence:.2f}): {query}")
+            return query
+
+        key = normalize_message(user_message)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            logger.info(f"Поисковый запрос из кэша: {cached}")
+            return cached
+
+        self.cache_misses += 1
+        try:
+            query = (await self.llm_rewrite(user_message)).strip()
+        except Exception as e:
+            # Запасной запрос не кэшируем: сбой LLM временный, следующий такой же вопрос попробует снова
+            self.llm_errors += 1
+            logger.error(f"Ошибка при генерации поискового запроса: {str(e)}")
+            return self.fallback_query(user_message)
+        if not query:
+            return self.fallback_query(user_message)
+        self.cache.set(key, query)
+        return query
+
+    @staticmethod
+    def fallback_query(user_message: str) -> str:
+        return f"ЧелГУ {user_message[:50]}"
+
+    @staticmethod
+    def rule_based(user_message: str) -> Tuple[str, float]:
+        """Возвращает запрос из ключевых слов и уверенность в том, что его хватит для поиска"""
+        words = normalize_message(user_message).split()
+        if not words or len(words) > 20:
+            return "", 0.0
+
+        keywords = [word for word in words if word not in STOP_WORDS and len(word) > 1]
+        if not keywords or any(word in CONTEXT_WORDS for word in words):
+            return "", 0.0
+
+        mentions_university = any(word.startswith(UNIVERSITY_MARKERS) for word in keywords)
+        topics = sum(1 for word in keywords if word.startswith(TOPIC_STEMS))
+
+        confidence = 0.3
+        if topics:
+            confidence += 0.4
+        if 1 <= len(keywords) <= 6:
+            confidence += 0.2
+        elif len(keywords) > 10:
+            confidence -= 0.3
+        if mentions_university:
+            confidence += 0.1
+
+        keywords = [word for word in keywords if not word.startswith(UNIVERSITY_MARKERS)]
+        query = " ".join(["ЧелГУ"] + keywords)
+        return query, min(confidence, 1.0)
+
+    def stats(self) -> dict:
+        return {
+            "rule_hits": self.rule_hits,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "llm_errors": self.llm_errors,
+            "cached_queries": len(self.cache)
+        }
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from typing import AsyncIterator, List, Optional
+
+from models.inference_server import DEFAULT_SOCKET_PATH, pack_messages, read_frame, write_frame
+from models.local_ml import MLModel
+from models.message import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteMLModel(MLModel):
+    """
+    MLModel без весов в процессе: поиск контекста идёт локально, генерация - на сервере
+    инференса (models/inference_server.py) через Unix-сокет. Процесс API стартует за секунды,
+    несколько рабочих процессов делят одну модель, батчинг и KV-кэш сессий на сервере.
+    """
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, connect_timeout: float = 5.0, **kwargs):
+        super().__init__(**kwargs)
+        self.socket_path = socket_path
+        self.connect_timeout = connect_timeout
+        self._background = set()
+
+    def initialize(self):
+        # Сервер может подняться позже API: запросы просто будут ждать соединения до таймаута
+        self._is_initialized = True
+        logger.info(f"Генерация через сервер инференса {self.socket_path}")
+
+    async def generate_reply(self, messages: List[ChatMessage], search_context: str,
+                             session_id: Optional[str] = None) -> str:
+        response = await self._call({
+            "op": "generate",
+            "messages": pack_messages(messages),
+            "search_context": search_context,
+            "session_id": session_id
+        })
+        return response["text"]
+
+    async def stream_reply(self, messages: List[ChatMessage], search_context: str,
+                           session_id: Optional[str] = None) -> AsyncIterator[str]:
+        reader, writer = await self._connect()
+        try:
+            await write_frame(writer, {
+                "op": "stream",
+                "messages": pack_messages(messages),
+                "search_context": search_context,
+                "session_id": session_id
+            })
+            while True:
+                frame = await read_frame(reader)
+                if frame is None:
+                    raise RuntimeError("Сервер инференса закрыл соединение")
+                if frame["type"] == "token":
+                    yield frame["text"]
+                elif frame["type"] == "done":
+                    return
+                else:
+                    raise RuntimeError(frame.get("error", "Ошибка сервера инференса"))
+        finally:
+            # Если клиент SSE отключился, закрытие сокета останавливает генерацию на сервере
+            writer.close()
+
+    async def generate_search_query(self, user_message: str) -> str:
+        response = await self._call({"op": "search_query", "message": user_message})
+        return response["text"]
+
+    def drop_session(self, session_id: str):
+        # Вызывается синхронно из хранилища сессий в цикле событий - отправляем без ожидания
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._drop_remote(session_id))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _drop_remote(self, session_id: str):
+        try:
+            await self._call({"op": "drop_session", "session_id": session_id})
+        except Exception as e:
+            logger.warning(f"Не удалось освободить сессию {session_id} на сервере инференса: {str(e)}")
+
+    async def collect_stats(self) -> dict:
+        stats = self.stats()
+        try:
+            stats["inference_server"] = (await self._call({"op": "stats"}))["stats"]
+        except Exception as e:
+            stats["inference_server"] = {"error": str(e)}
+        return stats
+
+    def stats(self) -> dict:
+        return {
+            "query_rewriter": self.query_rewriter.stats(),
+            "local_index": self.local_index.stats() if self.local_index is not None else None,
+            "dense_index": self.dense_index.stats() if self.dense_index is not None else None,
+            "answer_cache": self.answer_cache.stats() if self.answer_cache else None,
+            "inference_server": self.socket_path
+        }
+
+    def cleanup(self):
+        self._is_initialized = False
+
+    async def _connect(self):
+        try:
+            return await asyncio.wait_for(asyncio.open_unix_connection(self.socket_path), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise RuntimeError(f"Сервер инференса недоступен ({self.socket_path}): {str(e)}")
+
+    async def _call(self, request: dict) -> dict:
+        reader, writer = await self._connect()
+        try:
+            await write_frame(writer, request)
+            response = await read_frame(reader)
+        finally:
+            writer.close()
+        if response is None:
+            raise RuntimeError("Сервер инференса закрыл соединение")
+        if response["type"] == "error":
+            raise RuntimeError(response["error"])
+        return response
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
+
+# Контейнер статьи на странице newsitem*.aspx (вебчасть SharePoint)
+ARTICLE_CONTAINER_ID = 'WebPartWPQ1'
+RAW_HTML_SOURCE_PREFIX = '<!-- source: '
+
+# XPath компилируются один раз на процесс. Для классов из двух слов BeautifulSoup сравнивает атрибут
+# class целиком, для одного слова ищет его среди классов - условия ниже повторяют это поведение
+_CONTAINER = etree.XPath(f'//*[@id="{ARTICLE_CONTAINER_ID}"]')
+_TITLE = etree.XPath('(.//div[normalize-space(@class)="news-rowfield news-header"])[1]')
+_DATE = etree.XPath('(.//div[normalize-space(@class)="news-rowfield news-date"])[1]')
+_LEADER = etree.XPath('(.//div[normalize-space(@class)="news-rowfield p-leader"])[1]')
+_CONTENT = etree.XPath('(.//div[normalize-space(@class)="news-rowfield p-content"])[1]')
+_IMAGE = etree.XPath('((.//div[contains(concat(" ", normalize-space(@class), " "), " img-container ")])[1]//img)[1]')
+_LIST_ITEMS = etree.XPath('//div[contains(concat(" ", normalize-space(@class), " "), " nlist-full ")]')
+_ITEM_LINKS = etree.XPath('.//a/@href')
+
+
+def _text(nodes):
+    return nodes[0].text_content().strip() if nodes else None
+
+
+def _parse(html_content):
+    try:
+        return lxml_html.fromstring(html_content)
+    except ValueError:
+        # Строка с объявлением кодировки в <?xml ...?> принимается только байтами
+        return lxml_html.fromstring(html_content.encode('utf-8'))
+
+
+def extract_news_fields(html_content, link):
+    """
+    Извлекает поля новости из HTML: подойдёт и innerHTML контейнера из Selenium,
+    и страница целиком, скачанная по HTTP. Разбор lxml и заранее скомпилированные XPath.
+    """
+    document = _parse(html_content)
+    containers = _CONTAINER(document)
+    root = containers[0] if containers else document
+
+    # Извлекаем заголовок и дату
+    title = _text(_TITLE(root))
+    title_text = title if title is not None else "Заголовок не найден"
+    date = _text(_DATE(root))
+    date_text = date if date is not None else "Дата не найдена"
+
+    # Извлекаем текст новости
+    leader = _text(_LEADER(root))
+    content = _text(_CONTENT(root))
+    content_text = leader if leader is not None else "Текст новости не найден "
+    content_text += content if content is not None else "Текст новости не найден"
+
+    # Извлекаем ссылку на изображение
+    images = _IMAGE(root)
+    relate_image_text = images[0].get('src', "Изображение не найдено") if images else "Изображение не найдено"
+
+    return {
+        'title': title_text,
+        'date': date_text,
+        'relate_image': relate_image_text,
+        'content': content_text,
+        'url': link
+    }
+
+
+def extract_news_links(page_source, base_url):
+    """Ссылки на статьи со страницы списка новостей"""
+    document = _parse(page_source)
+    return [
+        base_url + href
+        for item in _LIST_ITEMS(document)
+        for href in _ITEM_LINKS(item)
+        if 'newsitem' in href
+    ]
+
+
+def extract_news_fields_bs4(html_content, link):
+    """Прежний разбор через BeautifulSoup - эталон для сравнения в benchmarks/bench_extract.py"""
+    soup = BeautifulSoup(html_content, 'lxml')
+    root = soup.find(id=ARTICLE_CONTAINER_ID) or soup
+
+    title = root.find('div', class_='news-rowfield news-header')
+    title_text = title.text.strip() if title else "Заголовок не найден"
+    date = root.find('div', class_='news-rowfield news-date')
+    date_text = date.text.strip() if date else "Дата не найдена"
+
+    content = root.find('div', class_='news-rowfield p-leader')
+    content2 = root.find('div', class_='news-rowfield p-content')
+    content_text = content.text.strip() if content else "Текст новости не найден "
+    content_text += content2.text.strip() if content2 else "Текст новости не найден"
+
+    relate_image = root.find('div', class_='img-container')
+    relate_image_text = relate_image.find('img')['src'] if relate_image and relate_image.find('img') else "Изображение не найдено"
+
+    return {
+        'title': title_text,
+        'date': date_text,
+        'relate_image': relate_image_text,
+        'content': content_text,
+        'url': link
+    }
+
+
+def extract_news_links_bs4(page_source, base_url):
+    soup = BeautifulSoup(page_source, 'lxml')
+    news_links = []
+    for item in soup.find_all('div', class_='nlist-full'):
+        for link in item.find_all('a'):
+            relative_link = link.get('href')
+            if relative_link and 'newsitem' in relative_link:
+                news_links.append(base_url + relative_link)
+    return news_links
+
+
+def save_raw_html(raw_dir, news_id, link, html_content):
+    """Сохраняет исходную страницу статьи, чтобы её можно было разобрать заново без повторного скачивания"""
+    os.makedirs(raw_dir, exist_ok=True)
+    with gzip.open(os.path.join(raw_dir, f'{news_id}.html.gz'), 'wt', encoding='utf-8') as f:
+        f.write(f'{RAW_HTML_SOURCE_PREFIX}{link} -->\n')
+        f.write(html_content)
+
+
+def _extract_raw_file(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        first_line = f.readline()
+        html_content = f.read()
+    link = first_line[len(RAW_HTML_SOURCE_PREFIX):].strip().removesuffix('-->').strip()
+    return extract_news_fields(html_content, link)
+
+
+def reprocess_raw_html(raw_dir, workers=None):
+    """Разбирает все сохранённые страницы заново, раскладывая файлы по процессам"""
+    paths = sorted(glob.glob(os.path.join(raw_dir, '*.html.gz')))
+    if len(paths) < 64 or workers == 1:
+        return [_extract_raw_file(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Крупные порции: передача пути и результата между процессами дороже разбора маленькой страницы
+        chunksize = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 4))
+        return list(executor.map(_extract_raw_file, paths, chunksize=chunksize))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Повторный разбор сохранённых страниц новостей')
+    arg_parser.add_argument('raw_dir', nargs='?', default='data/raw_html')
+    arg_parser.add_argument('--workers', type=int, default=None)
+    arg_parser.add_argument('--output', default='data/news_reprocessed.jsonl')
+    args = arg_parser.parse_args()
+
+    started = time.perf_counter()
+    news_data = reprocess_raw_html(args.raw_dir, workers=args.workers)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for news in news_data:
+            f.write(json.dumps(news, ensure_ascii=False) + '\n')
+    print(f"Разобрано страниц: {len(news_data)} за {time.perf_counter() - started:.2f} с, результат в {args.output}")
@@ -2,9 +2,16 @@
 
 from selenium.webdriver.chrome.options import Options
 
+# Картинки, шрифты и стили не нужны для разбора HTML, а грузятся дольше самой страницы
+BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.bmp',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.css',
+]
+
 class BrowserConfig:
     @staticmethod
-    def get_chrome_options():
+    def get_chrome_options(block_resources=True):
         chrome_options = Options()
         
         # GPU settings
@@ -32,4 +39,23 @@ class BrowserConfig:
         # Headless mode
         chrome_options.add_argument('--headless')
         
-        return chrome_options 
\ No newline at end of file
+        if block_resources:
+            chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+            chrome_options.add_experimental_option('prefs', {
+                'profile.managed_default_content_settings.images': 2,
+                'profile.managed_default_content_settings.fonts': 2,
+                'profile.managed_default_content_settings.stylesheets': 2,
+            })
+            # Не ждём загрузки всех ресурсов: для разбора достаточно готового DOM
+            chrome_options.page_load_strategy = 'eager'
+        
+        return chrome_options
+
+    @staticmethod
+    def block_resources(driver):
+        """Блокирует загрузку картинок, шрифтов и CSS через DevTools - настройки профиля Chrome соблюдает не для всех типов"""
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+        except Exception as e:
+            print(f"Не удалось включить блокировку ресурсов: {str(e)}")
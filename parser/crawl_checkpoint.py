@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import time
+
+
+class CrawlCheckpoint:
+    """
+    Точка продолжения обхода архива: последняя полностью сохранённая страница списка.
+    Пишется после каждой страницы и удаляется, когда обход доходит до конца.
+    Пагинация SharePoint работает на JavaScript, поэтому сразу открыть нужную страницу нельзя:
+    продолженный обход листает список с первой страницы, но уже сохранённые статьи не скачивает.
+    """
+    def __init__(self, path='data/crawl_checkpoint.json'):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def save(self, page):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'page': page, 'updated_at': time.time()}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,37 +1,204 @@
-# -*- coding: utf-8 -*-
+ # -*- coding: utf-8 -*-
 
+import contextlib
 import json
 import os
+import threading
+
+from helpers.file_lock import acquire_lock_file
+
 
 class DataHandler:
+    """
+    Хранилище новостей в виде append-only журнала JSONL с индексом URL.
+    Новые записи дописываются в конец файла, дубликаты отсекаются по индексу за O(1),
+    перезапись файла (миграция, компактизация) делается через временный файл и os.replace.
+    Журнал читают несколько процессов (API, рабочие uvicorn), а пишет процесс парсера: запись,
+    обрезка недописанной строки и компактизация идут только под файловой блокировкой писателя.
+    Читатели файл не меняют и пропускают недописанную последнюю строку.
+    """
+    def __init__(self, data_dir='data', filename='news_data.jsonl', legacy_filename='news_data.json'):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, filename)
+        self.legacy_path = os.path.join(data_dir, legacy_filename)
+        self.lock_path = f"{self.path}.lock"
+        self._urls = None
+        # Сколько байт журнала уже учтено в индексе URL и у какого файла (после компактизации он новый)
+        self._offset = 0
+        self._file_id = None
+        self._duplicates = 0
+        self._lock = threading.Lock()
+
+    def save(self, news_data):
+        """Дописывает новости, которых ещё нет в хранилище, и возвращает количество добавленных"""
+        with self._lock, self._writer():
+            self._repair_tail()
+            self._refresh()
+            if self._duplicates:
+                # Дубликаты могли появиться от параллельных записей - журнал стоит уплотнить
+                self._compact_records(self.read_records(self.path))
+            new_records = []
+            for news in news_data:
+                if news['url'] not in self._urls:
+                    self._urls.add(news['url'])
+                    new_records.append(news)
+
+            if new_records:
+                lines = ''.join(json.dumps(news, ensure_ascii=False) + '\n' for news in new_records)
+                with open(self.path, 'ab') as f:
+                    f.write(lines.encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._offset = f.tell()
+
+        print(f"Добавлено новостей: {len(new_records)}, всего в {self.path}: {len(self._urls)}")
+        return len(new_records)
+
+    def load(self):
+        with self._lock:
+            self._ensure_ready()
+            return self.read_records(self.path)
+
+    def known_urls(self):
+        with self._lock:
+            self._ensure_ready()
+            self._refresh()
+            return set(self._urls)
+
+    def compact(self):
+        """Переписывает журнал без дубликатов и битых строк"""
+        with self._lock, self._writer():
+            self._repair_tail()
+            self._compact_records(self.read_records(self.path))
+
+    @contextlib.contextmanager
+    def _writer(self):
+        """Эксклюзивная блокировка писателя журнала, общая для всех процессов"""
+        lock_file = acquire_lock_file(self.lock_path, blocking=True)
+        try:
+            self._ensure_ready(locked=True)
+            yield
+        finally:
+            lock_file.close()
+
+    def _compact_records(self, records):
+        unique = {}
+        for news in records:
+            unique.setdefault(news['url'], news)
+        self._write_atomic(list(unique.values()))
+        self._urls = set(unique)
+        self._duplicates = 0
+        stat = os.stat(self.path)
+        self._offset, self._file_id = stat.st_size, (stat.st_dev, stat.st_ino)
+
     @staticmethod
-    def save_to_json(news_data, filename='news_data.json'):
-        os.makedirs('data', exist_ok=True)
-        file_path = os.path.join('data', filename)
-        
-        existing_data = DataHandler._read_existing_data(file_path)
-        updated_data = DataHandler._update_news_data(existing_data, news_data)
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(updated_data, f, ensure_ascii=False, indent=4)
-        
-        print(f"Данные успешно сохранены в {file_path}")
-    
+    def read_records(path):
+        if not os.path.exists(path):
+            return []
+
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Недописанная строка от прерванной или ещё идущей записи
+                    continue
+        return records
+
+    def _ensure_ready(self, locked=False):
+        if self._urls is not None:
+            return
+        os.makedirs(self.data_dir, exist_ok=True)
+        if not os.path.exists(self.path) and os.path.exists(self.legacy_path):
+            if locked:
+                self._migrate_legacy()
+            else:
+                # Миграцию делает тот, кто первым взял блокировку писателя, остальные прочитают результат
+                with self._writer():
+                    pass
+            return
+        self._urls = set()
+        self._refresh()
+
+    def _refresh(self):
+        """Добавляет в индекс URL строки, дописанные с прошлого чтения, в том числе другими процессами"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        file_id = (stat.st_dev, stat.st_ino)
+        if file_id != self._file_id or stat.st_size < self._offset:
+            # Журнал переписан компактизацией - перечитываем с начала
+            self._urls, self._offset, self._file_id, self._duplicates = set(), 0, file_id, 0
+        if stat.st_size == self._offset:
+            return
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Последняя строка ещё дописывается - учтём её при следующем чтении
+                    break
+                self._offset += len(line)
+                try:
+                    url = json.loads(line)['url']
+                except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+                    continue
+                if url in self._urls:
+                    self._duplicates += 1
+                self._urls.add(url)
+
+    def _migrate_legacy(self):
+        legacy_data = self._read_existing_data(self.legacy_path)
+        self._compact_records(legacy_data)
+        print(f"Архив {self.legacy_path} перенесён в {self.path}: {len(self._urls)} новостей")
+
+    def _repair_tail(self):
+        """Отрезает недописанную последнюю строку, чтобы следующая запись начиналась с новой строки (только писатель)"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+
+            position = size
+            while position > 0:
+                step = min(4096, position)
+                position -= step
+                f.seek(position)
+                chunk = f.read(step)
+                newline = chunk.rfind(b'\n')
+                if newline != -1:
+                    f.truncate(position + newline + 1)
+                    return
+            f.truncate(0)
+
+    def _write_atomic(self, records):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for news in records:
+                f.write(json.dumps(news, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
     @staticmethod
     def _read_existing_data(file_path):
         if not os.path.exists(file_path):
             return []
-            
+
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 return data if isinstance(data, list) else []
         except json.JSONDecodeError:
             return []
-    
-    @staticmethod
-    def _update_news_data(existing_data, news_data):
-        for news in news_data:
-            if not any(existing['url'] == news['url'] for existing in existing_data):
-                existing_data.append(news)
-        return existing_data 
\ No newline at end of file
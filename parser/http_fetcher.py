@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import sys
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from models.news_item import make_news_id
+from parser.article_extractor import extract_news_fields, save_raw_html
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (compatible; CSUNewsBot/1.0)',
+    'Accept': 'text/html,application/xhtml+xml',
+    'Accept-Language': 'ru-RU,ru;q=0.9',
+}
+
+
+class HostRateLimiter:
+    """Не чаще одного запроса к хосту в min_interval секунд"""
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_time = {}
+        self._locks = {}
+
+    async def wait(self, host):
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            delay = self._next_time.get(host, now) - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_time[host] = max(now, self._next_time.get(host, now)) + self.min_interval
+
+
+class ArticleFetcher:
+    """
+    Скачивает страницы новостей обычными HTTP-запросами вместо вкладок Chrome:
+    страницы статей статические, JavaScript для них не нужен.
+    Общий пул соединений ограничен max_connections, к одному хосту - не чаще раза в per_host_interval секунд.
+    """
+    def __init__(self, max_connections=4, per_host_interval=0.5, timeout=15.0, retries=2, raw_html_dir=None,
+                 transport=None):
+        self.max_connections = max_connections
+        self.per_host_interval = per_host_interval
+        self.timeout = timeout
+        self.retries = retries
+        # Исходные страницы можно сохранять для повторного разбора: python -m parser.article_extractor
+        self.raw_html_dir = raw_html_dir
+        # Свой транспорт httpx (например, MockTransport в тестах), по умолчанию - обычный пул соединений
+        self.transport = transport
+
+    def fetch_articles(self, links):
+        """Синхронная обёртка для парсера, который работает вне event loop"""
+        return asyncio.run(self.fetch_all(links))
+
+    async def fetch_all(self, links):
+        limiter = HostRateLimiter(self.per_host_interval)
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        semaphore = asyncio.Semaphore(self.max_connections)
+        async with httpx.AsyncClient(headers=DEFAULT_HEADERS, timeout=self.timeout, limits=limits,
+                                     follow_redirects=True, transport=self.transport) as client:
+            results = await asyncio.gather(*(self._fetch_one(client, semaphore, limiter, link) for link in links))
+        # Порядок как у ссылок на странице, недоступные статьи пропускаются
+        return [news for news in results if news is not None]
+
+    async def _fetch_one(self, client, semaphore, limiter, link):
+        host = urlsplit(link).netloc
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.per_host_interval * 2 ** attempt)
+            async with semaphore:
+                await limiter.wait(host)
+                try:
+                    response = await client.get(link)
+                except httpx.HTTPError as e:
+                    error = str(e)
+                    continue
+            # На 429 и 5xx пробуем ещё раз, остальные ошибки окончательные
+            if response.status_code == 429 or response.status_code >= 500:
+                error = f"HTTP {response.status_code}"
+                continue
+            if response.is_error:
+                error = f"HTTP {response.status_code}"
+                break
+            # Разбор HTML - работа для CPU, не держим на ней event loop
+            return await asyncio.to_thread(self._process_page, response.text, link)
+
+        print(f"Ошибка при получении текста новости {link}: {error}")
+        return None
+
+    def _process_page(self, html_content, link):
+        if self.raw_html_dir:
+            save_raw_html(self.raw_html_dir, make_news_id(link), link, html_content)
+        return extract_news_fields(html_content, link)
+
+
+if __name__ == '__main__':
+    # Проверка на локальном зеркале сохранённых страниц:
+    #   python -m http.server 8080 --directory saved_pages
+    #   python -m parser.http_fetcher http://localhost:8080/newsitem1.aspx ...
+    started = time.perf_counter()
+    news = ArticleFetcher().fetch_articles(sys.argv[1:])
+    print(json.dumps(news, ensure_ascii=False, indent=2))
+    print(f"Скачано статей: {len(news)} из {len(sys.argv) - 1} за {time.perf_counter() - started:.2f} с")
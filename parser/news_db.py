@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+import threading
+
+from helpers.russian_stemmer import WORD_RE, stem, stem_text
+from models.news_item import make_news_id
+
+SNIPPET_WORDS = 30
+
+
+class NewsDatabase:
+    """
+    Архив новостей в SQLite с полнотекстовым индексом FTS5.
+    В индекс кладутся основы слов (стеммер Snowball), поэтому запрос находит словоформы:
+    "поступление" совпадает с "поступления" и "поступлении".
+    Пишет в архив только процесс API (sync_news_indexes в main.py), парсер дописывает лишь журнал JSONL.
+    """
+    def __init__(self, path='data/news.db'):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS news (
+                    id INTEGER PRIMARY KEY,
+                    news_id TEXT NOT NULL,
+                    url TEXT NOT NULL UNIQUE,
+                    title TEXT NOT NULL,
+                    date TEXT,
+                    relate_image TEXT,
+                    content TEXT
+                )
+            """)
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS news_fts USING fts5(title, content, tokenize='unicode61')"
+            )
+
+    def add(self, news_data):
+        """Добавляет новости, которых ещё нет в архиве, и возвращает их количество"""
+        added = 0
+        with self._lock, self._conn:
+            for news in news_data:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO news (news_id, url, title, date, relate_image, content) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (make_news_id(news['url']), news['url'], news['title'], news.get('date'),
+                     news.get('relate_image'), news.get('content', ''))
+                )
+                if cursor.rowcount:
+                    self._conn.execute(
+                        "INSERT INTO news_fts (rowid, title, content) VALUES (?, ?, ?)",
+                        (cursor.lastrowid, ' '.join(stem_text(news['title'])),
+                         ' '.join(stem_text(news.get('content', ''))))
+                    )
+                    added += 1
+        return added
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM news").fetchone()[0]
+
+    def search(self, query, limit=10):
+        stems = list(dict.fromkeys(stem_text(query)))
+        if not stems:
+            return []
+
+        # Сначала ищем документы со всеми словами запроса, если таких нет - с любым из них
+        rows = self._match(' AND '.join(f'"{term}"' for term in stems), limit)
+        if not rows and len(stems) > 1:
+            rows = self._match(' OR '.join(f'"{term}"' for term in stems), limit)
+
+        return [
+            {
+                'id': row['news_id'],
+                'title': row['title'],
+                'date': row['date'],
+                'url': row['url'],
+                'snippet': self._snippet(row['content'] or row['title'], set(stems)),
+                'score': round(-row['score'], 4)
+            }
+            for row in rows
+        ]
+
+    def _match(self, expression, limit):
+        with self._lock:
+            return self._conn.execute(
+                """
+                SELECT news.news_id, news.title, news.date, news.url, news.content,
+                       bm25(news_fts, 5.0, 1.0) AS score
+                FROM news_fts JOIN news ON news.id = news_fts.rowid
+                WHERE news_fts MATCH ?
+                ORDER BY score
+                LIMIT ?
+                """,
+                (expression, limit)
+            ).fetchall()
+
+    @staticmethod
+    def _snippet(text, stems):
+        words = list(WORD_RE.finditer(text.lower()))
+        if not words:
+            return text[:200]
+        # Окно вокруг первого слова, совпавшего с запросом
+        hit = next((i for i, match in enumerate(words) if stem(match.group()) in stems), 0)
+        first = max(0, hit - SNIPPET_WORDS // 3)
+        last = min(len(words), first + SNIPPET_WORDS) - 1
+        snippet = text[words[first].start():words[last].end()]
+        return ('…' if first > 0 else '') + snippet + ('…' if last < len(words) - 1 else '')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
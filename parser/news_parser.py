@@ -4,19 +4,68 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
+from selenium.common.exceptions import NoSuchElementException
 from tqdm import tqdm
 import time
 
+from parser.article_extractor import extract_news_fields, extract_news_links
 from parser.browser_config import BrowserConfig
+from parser.crawl_checkpoint import CrawlCheckpoint
 from parser.data_handler import DataHandler
+from parser.http_fetcher import ArticleFetcher
+
+def fetch_news_with_browser(driver, news_links):
+    # Сохраняем handle основной вкладки
+    main_window = driver.current_window_handle
+    page_news_data = []
+    
+    for link in tqdm(news_links):
+        try:
+            driver.execute_script("window.open('');")
+            driver.switch_to.window(driver.window_handles[-1])
+            driver.get(link)
+            time.sleep(2)
+            
+            news_xpath = '//*[@id="WebPartWPQ1"]/table/tbody/tr[2]/td'
+            
+            wait = WebDriverWait(driver, 10)
+            news_container = wait.until(
+                EC.presence_of_element_located((By.XPATH, news_xpath))
+            )
+        
+            html_content = news_container.get_attribute('innerHTML')
+            page_news_data.append(extract_news_fields(html_content, link))
+            
+        except Exception as e:
+            print(f"Ошибка при получении текста новости: {str(e)}")
+            continue
+        finally:
+            driver.close()
+            driver.switch_to.window(main_window)
+            time.sleep(1)
+    
+    return page_news_data
+
 
 class NewsParser:
-    def __init__(self, max_pages=5):
-        self.url = 'https://www.csu.ru/news/'
+    def __init__(self, max_pages=5, fetch_mode='http', base_url='https://www.csu.ru', incremental=True):
+        # base_url можно направить на локальное зеркало сохранённых страниц
+        self.base_url = base_url.rstrip('/')
+        self.url = f'{self.base_url}/news/'
         self.page_number = 2
         self.max_pages = max_pages
+        self.last_page_reached = False
+        self.storage = DataHandler()
+        # http - статьи скачиваются параллельно без браузера, browser - по вкладке Chrome на статью.
+        # Список новостей листается через Selenium в обоих режимах: пагинация SharePoint работает на JavaScript
+        self.fetch_mode = fetch_mode
+        self.fetcher = ArticleFetcher(raw_html_dir='data/raw_html') if fetch_mode == 'http' else None
+        # Инкрементальный режим: известные статьи не скачиваются, обход останавливается на первой
+        # полностью известной странице, прерванный обход продолжается с сохранённой точки
+        self.incremental = incremental
+        self.checkpoint = CrawlCheckpoint()
         self.driver = webdriver.Chrome(options=BrowserConfig.get_chrome_options())
+        BrowserConfig.block_resources(self.driver)
         self.driver.maximize_window()
 
     def __del__(self):
@@ -42,24 +91,13 @@ class NewsParser:
                 EC.presence_of_all_elements_located((By.CLASS_NAME, "nlist-full"))
             )
             
-            soup = BeautifulSoup(self.driver.page_source, 'lxml')
-            news_items = soup.find_all('div', class_='nlist-full')
-
-            news_links = []
+            news_links = extract_news_links(self.driver.page_source, self.base_url)
             
-            if not news_items:
+            if not news_links:
                 print("Не найдено новостей на странице, что-то пошло не так")
                 self.driver.quit()
                 raise SystemExit("Программа остановлена из-за отсутствия новостей")
             
-            for item in tqdm(news_items):
-                links = item.find_all('a')
-                for link in links:
-                    relative_link = link.get('href')
-                    if relative_link and 'newsitem' in relative_link:
-                        full_link = 'https://www.csu.ru' + relative_link
-                        news_links.append(full_link)
-            
             time.sleep(1.5)
             self.go_to_news_page()
             
@@ -74,8 +112,13 @@ class NewsParser:
         if self.page_number == self.max_pages:
             print("Достигнуто максимальное количество страниц, скачивание последних новостей...")
             return False
-        pagination_click = self.driver.find_element(By.XPATH, 
-        f'/html/body/form/div[5]/div/div[7]/div/div[1]/div[3]/div/span/div[4]/div/div/table/tbody/tr/td/div/div/div[2]/div[1]/div/div/div[2]/table/tbody/tr/td/div[2]/a[{self.page_number}]')  
+        try:
+            pagination_click = self.driver.find_element(By.XPATH, 
+            f'/html/body/form/div[5]/div/div[7]/div/div[1]/div[3]/div/span/div[4]/div/div/table/tbody/tr/td/div/div/div[2]/div[1]/div/div/div[2]/table/tbody/tr/td/div[2]/a[{self.page_number}]')  
+        except NoSuchElementException:
+            # Ссылки на следующую страницу нет - архив пройден до конца
+            self.last_page_reached = True
+            return False
         pagination_click.click()
         time.sleep(1)
 
@@ -83,73 +126,59 @@ class NewsParser:
     
     def get_full_news_content(self):
         all_news_data = []
+        known_urls = self.storage.known_urls() if self.incremental else set()
+        checkpoint = self.checkpoint.load() if self.incremental else None
+        # Страницы до точки продолжения уже пройдены: список листается с первой страницы (перейти сразу
+        # на нужную пагинация не даёт), их статьи не скачиваются, а ранняя остановка на них не срабатывает
+        resume_page = checkpoint['page'] if checkpoint else 0
+        if resume_page:
+            print(f"Продолжение прерванного обхода: страницы 1-{resume_page} уже сохранены, "
+                  "список листается с первой страницы без скачивания известных новостей")
         
         while True:
+            current_page = self.page_number - 1
             news_links = self.get_news_from_page()
-            if not news_links or (self.max_pages is not None and self.page_number > self.max_pages):
+            if not news_links:
+                # Список не получен: точку продолжения не трогаем, следующий запуск продолжит с неё
+                break
+            if self.max_pages is not None and self.page_number > self.max_pages:
+                self.checkpoint.clear()
                 break
             
-            # Сохраняем handle основной вкладки
-            main_window = self.driver.current_window_handle
+            new_links = [link for link in news_links if link not in known_urls]
+            if self.incremental and not new_links and current_page > resume_page:
+                print(f"Все новости страницы {current_page} уже сохранены, обход остановлен")
+                self.checkpoint.clear()
+                break
+            if len(new_links) < len(news_links):
+                print(f"Пропущено уже сохранённых новостей: {len(news_links) - len(new_links)}")
             
-            for link in tqdm(news_links):
-                try:
-                    self.driver.execute_script("window.open('');")
-                    self.driver.switch_to.window(self.driver.window_handles[-1])
-                    self.driver.get(link)
-                    time.sleep(2)
-                    
-                    news_xpath = '//*[@id="WebPartWPQ1"]/table/tbody/tr[2]/td'
-                    
-                    wait = WebDriverWait(self.driver, 10)
-                    news_container = wait.until(
-                        EC.presence_of_element_located((By.XPATH, news_xpath))
-                    )
-                
-                    html_content = news_container.get_attribute('innerHTML')
-                    soup = BeautifulSoup(html_content, 'lxml')
-                    
-                    # Извлекаем заголовок
-                    title = soup.find('div', class_='news-rowfield news-header')
-                    title_text = title.text.strip() if title else "Заголовок не найден"
-                    # Извлекаем дату
-                    date = soup.find('div', class_='news-rowfield news-date')
-                    date_text = date.text.strip() if date else "Дата не найдена"
-                    
-                    # Извлекаем текст новости
-                    content = soup.find('div', class_='news-rowfield p-leader')
-                    content2 = soup.find('div', class_='news-rowfield p-content')
-                    content_text = content.text.strip() if content else "Текст новости не найден "
-                    content_text += content2.text.strip() if content2 else "Текст новости не найден"
-
-                    # Извлекаем ссылку на изображение
-                    relate_image = soup.find('div', class_='img-container')
-                    relate_image_text = relate_image.find('img')['src'] if relate_image and relate_image.find('img') else "Изображение не найдено"
-                    
-                    news_data = {
-                        'title': title_text,
-                        'date': date_text,
-                        'relate_image': relate_image_text,
-                        'content': content_text,
-                        'url': link 
-                    }
-                    
-                    all_news_data.append(news_data)
-                    
-                except Exception as e:
-                    print(f"Ошибка при получении текста новости: {str(e)}")
-                    continue
-                finally:
-                    self.driver.close()
-                    self.driver.switch_to.window(main_window)
-                    time.sleep(1)
+            if not new_links:
+                page_news_data = []
+            elif self.fetcher is not None:
+                page_news_data = self.fetcher.fetch_articles(new_links)
+            else:
+                page_news_data = self.get_news_with_browser(new_links)
             
-            # Сохраняем новости после обработки каждой страницы
-            if all_news_data:
-                DataHandler.save_to_json(all_news_data)
+            # Дописываем в хранилище только новости текущей страницы
+            if page_news_data:
+                self.storage.save(page_news_data)
+                known_urls.update(news['url'] for news in page_news_data)
+            all_news_data.extend(page_news_data)
+            if self.last_page_reached:
+                print("Достигнута последняя страница архива")
+                self.checkpoint.clear()
+                break
+            if self.incremental:
+                self.checkpoint.save(current_page)
         
         return all_news_data
 
+    def get_news_with_browser(self, news_links):
+        return fetch_news_with_browser(self.driver, news_links)
+
+    def close(self):
+        self.driver.quit()
 
 if __name__ == '__main__':
     print("Запуск парсера Новостей ЧелГУ")
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+from parser.browser_config import BrowserConfig
+from parser.data_handler import DataHandler
+from parser.http_fetcher import ArticleFetcher
+from parser.article_extractor import extract_news_links
+from parser.news_parser import fetch_news_with_browser
+
+# Ссылки пагинатора SharePoint - это номера страниц; ищем их по тексту, а не по абсолютному XPath
+PAGER_LINKS_XPATH = "//a[string-length(normalize-space(text())) > 0 and translate(normalize-space(text()), '0123456789', '') = '']"
+
+
+class ParallelNewsCrawler:
+    """
+    Параллельный обход архива новостей пулом headless Chrome.
+    Страницы списка делятся на непересекающиеся блоки по block_size страниц, каждый браузер берёт
+    следующий свободный блок, пока архив не закончится или не будет достигнут max_pages.
+    Результаты всех браузеров объединяются и очищаются от дублей до записи в хранилище.
+    """
+    def __init__(self, pool_size=4, max_pages=None, block_size=5, fetch_mode='http',
+                 base_url='https://www.csu.ru', incremental=True):
+        self.pool_size = pool_size
+        self.max_pages = max_pages
+        self.block_size = block_size
+        self.fetch_mode = fetch_mode
+        self.base_url = base_url.rstrip('/')
+        self.url = f'{self.base_url}/news/'
+        self.incremental = incremental
+        self.storage = DataHandler()
+        self._blocks = itertools.count()
+        self._blocks_lock = threading.Lock()
+        # Номер первой несуществующей страницы, как только кто-то из браузеров до неё дошёл
+        self._last_page = None
+
+    def parse_news(self):
+        started = time.perf_counter()
+        known_urls = self.storage.known_urls() if self.incremental else set()
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            pages = list(executor.map(self._worker, range(self.pool_size)))
+
+        # Объединяем по порядку страниц и убираем дубли: при сдвиге ленты статья может попасть на две страницы
+        links_by_page = {}
+        for worker_pages in pages:
+            links_by_page.update(worker_pages)
+        news_links = list(dict.fromkeys(
+            link for page in sorted(links_by_page) for link in links_by_page[page]
+        ))
+        new_links = [link for link in news_links if link not in known_urls]
+        print(f"Страниц: {len(links_by_page)}, ссылок: {len(news_links)}, новых: {len(new_links)}")
+
+        if self.fetch_mode == 'http':
+            news_data = ArticleFetcher(raw_html_dir='data/raw_html').fetch_articles(new_links)
+        else:
+            news_data = self._fetch_with_browsers(new_links)
+
+        news_data = list({news['url']: news for news in news_data}.values())
+        if news_data:
+            self.storage.save(news_data)
+        print(f"Параллельный обход завершён за {time.perf_counter() - started:.0f} с, новостей: {len(news_data)}")
+        return news_data
+
+    def _next_block(self):
+        with self._blocks_lock:
+            block = next(self._blocks)
+        first = block * self.block_size + 1
+        last = first + self.block_size - 1
+        if self.max_pages is not None:
+            last = min(last, self.max_pages)
+        if (self.max_pages is not None and first > self.max_pages) or \
+                (self._last_page is not None and first >= self._last_page):
+            return None
+        return first, last
+
+    def _worker(self, worker_id):
+        """Собирает ссылки со своих блоков страниц, возвращает {номер страницы: ссылки}"""
+        pages = {}
+        driver = self._create_driver()
+        # Блоки одного браузера идут по возрастанию, поэтому лента открывается один раз
+        current = None
+        try:
+            while True:
+                block = self._next_block()
+                if block is None:
+                    break
+                first, last = block
+                print(f"Браузер {worker_id}: страницы {first}-{last}")
+                if current is None:
+                    driver.get(self.url)
+                    self._wait_for_list(driver)
+                    current = 1
+                for page in range(first, last + 1):
+                    current = self._go_to_page(driver, current, page)
+                    if current is None:
+                        with self._blocks_lock:
+                            if self._last_page is None or page < self._last_page:
+                                self._last_page = page
+                        break
+                    pages[page] = extract_news_links(driver.page_source, self.base_url)
+        except Exception as e:
+            print(f"Браузер {worker_id}: ошибка при обходе страниц: {str(e)}")
+        finally:
+            driver.quit()
+        return pages
+
+    def _go_to_page(self, driver, current, target):
+        """Переходит со страницы current на target, перескакивая по номерам, видимым в пагинаторе"""
+        while current != target:
+            numbers = {}
+            for link in driver.find_elements(By.XPATH, PAGER_LINKS_XPATH):
+                numbers.setdefault(int(link.text.strip()), link)
+            reachable = [number for number in numbers if current < number <= target]
+            if not reachable:
+                return None
+            number = max(reachable)
+            first_item = driver.find_element(By.CLASS_NAME, "nlist-full")
+            numbers[number].click()
+            WebDriverWait(driver, 30).until(EC.staleness_of(first_item))
+            self._wait_for_list(driver)
+            current = number
+        return current
+
+    @staticmethod
+    def _wait_for_list(driver):
+        try:
+            WebDriverWait(driver, 30).until(EC.presence_of_all_elements_located((By.CLASS_NAME, "nlist-full")))
+        except TimeoutException:
+            raise RuntimeError("Список новостей не загрузился")
+
+    def _create_driver(self):
+        driver = webdriver.Chrome(options=BrowserConfig.get_chrome_options())
+        BrowserConfig.block_resources(driver)
+        return driver
+
+    def _fetch_with_browsers(self, news_links):
+        # Ссылки делятся между браузерами пула поровну
+        chunks = [news_links[i::self.pool_size] for i in range(self.pool_size)]
+
+        def fetch(chunk):
+            if not chunk:
+                return []
+            driver = self._create_driver()
+            try:
+                return fetch_news_with_browser(driver, chunk)
+            finally:
+                driver.quit()
+
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            return [news for chunk in executor.map(fetch, chunks) for news in chunk]
+
+    def close(self):
+        # Браузеры пула закрываются сами, как только их блоки страниц обойдены
+        pass
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import signal
+import sys
+import time
+
+from helpers.file_lock import acquire_lock_file
+from parser.news_parser import NewsParser
+from parser.parallel_crawler import ParallelNewsCrawler
+
+# Файловая блокировка: одновременно идёт только один обход, даже если API запущено в нескольких экземплярах
+LOCK_PATH = 'data/scraper.lock'
+
+
+def run_crawl(max_pages=5, fetch_mode='http', browsers=1, incremental=True):
+    """Один обход сайта: новости дописываются в журнал и полнотекстовый архив, возвращаются новые"""
+    if browsers > 1:
+        parser = ParallelNewsCrawler(pool_size=browsers, max_pages=max_pages,
+                                     fetch_mode=fetch_mode, incremental=incremental)
+    else:
+        parser = NewsParser(max_pages=max_pages, fetch_mode=fetch_mode, incremental=incremental)
+    try:
+        return parser.parse_news() or []
+    finally:
+        parser.close()
+
+
+def scrape(lock_path=LOCK_PATH, **options):
+    """Обход под файловой блокировкой, итог - словарь {'status': 'done' | 'skipped' | 'error', ...}"""
+    lock_file = acquire_lock_file(lock_path)
+    if lock_file is None:
+        return {'status': 'skipped'}
+    with lock_file:
+        started = time.perf_counter()
+        try:
+            news_data = run_crawl(**options)
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+        return {'status': 'done', 'added': len(news_data), 'seconds': round(time.perf_counter() - started, 1)}
+
+
+if __name__ == '__main__':
+    # Запускается процессом API (helpers/scraper_scheduler.py) или вручную
+    arg_parser = argparse.ArgumentParser(description='Разовый обход новостей ЧелГУ')
+    arg_parser.add_argument('--pages', type=str, default='5')
+    arg_parser.add_argument('--fetch-mode', choices=['http', 'browser'], default='http')
+    arg_parser.add_argument('--browsers', type=int, default=1)
+    arg_parser.add_argument('--full-crawl', action='store_true')
+    arg_parser.add_argument('--report', action='store_true',
+                            help='Итог одной строкой JSON в stdout, вывод парсера уходит в stderr')
+    args = arg_parser.parse_args()
+
+    report = sys.stdout
+    if args.report:
+        sys.stdout = sys.stderr
+    # terminate() от API превращаем в SystemExit, чтобы блоки finally успели закрыть браузеры
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+
+    result = scrape(
+        max_pages=None if args.pages.lower() == 'none' else int(args.pages),
+        fetch_mode=args.fetch_mode,
+        browsers=args.browsers,
+        incremental=not args.full_crawl,
+    )
+    if args.report:
+        report.write(json.dumps(result, ensure_ascii=False) + '\n')
+        report.flush()
+    else:
+        print(f"Итог обхода: {result}")
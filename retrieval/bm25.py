@@ -0,0 +1,296 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from helpers.russian_stemmer import stem_text
+
+logger = logging.getLogger(__name__)
+
+PASSAGE_WORDS = 120
+PASSAGE_OVERLAP = 30
+
+
+def split_passages(text: str, size: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP) -> List[str]:
+    """Режет текст статьи на пересекающиеся фрагменты по словам"""
+    words = text.split()
+    if len(words) <= size:
+        return [' '.join(words)] if words else []
+    step = size - overlap
+    return [' '.join(words[start:start + size]) for start in range(0, len(words) - overlap, step)]
+
+
+@dataclass
+class BM25Snapshot:
+    # Частоты терминов: строки - фрагменты, столбцы - основы слов
+    tf: sp.csr_matrix = field(default_factory=lambda: sp.csr_matrix((0, 0), dtype=np.float32))
+    # Готовые веса BM25 по столбцам: запрос суммирует несколько столбцов
+    weights: sp.csc_matrix = field(default_factory=lambda: sp.csc_matrix((0, 0), dtype=np.float32))
+    vocab: Dict[str, int] = field(default_factory=dict)
+    # Для каждого фрагмента - номер статьи и номер фрагмента внутри неё
+    passage_articles: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int32))
+    passage_numbers: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int32))
+    # Смещения статей в журнале articles.jsonl, -1 - статья ещё не сохранена на диск
+    article_offsets: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+
+
+class BM25Index:
+    """
+    Локальный поиск BM25 по новостям ЧелГУ на разреженных матрицах SciPy.
+    Статьи режутся на фрагменты, новые статьи дописываются строками в матрицу частот,
+    веса пересчитываются векторно. На диске лежат матрица частот, словарь и append-only
+    журнал статей, текст фрагментов читается из журнала только для найденных результатов.
+    """
+    def __init__(self, index_dir: str = 'data/news_index', k1: float = 1.5, b: float = 0.75,
+                 read_only: bool = False, check_interval: float = 1.0):
+        self.index_dir = index_dir
+        self.matrix_path = os.path.join(index_dir, 'bm25.npz')
+        self.meta_path = os.path.join(index_dir, 'bm25_meta.json')
+        self.articles_path = os.path.join(index_dir, 'articles.jsonl')
+        self.k1 = k1
+        self.b = b
+        self._snapshot = BM25Snapshot()
+        self._urls: List[str] = []
+        self._known = set()
+        # Статьи, добавленные после последнего сохранения
+        self._pending: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+        # Процесс только для чтения не чинит файлы и перечитывает индекс, когда его сохранил писатель
+        self.read_only = read_only
+        self.check_interval = check_interval
+        self._meta_mtime: Optional[int] = None
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._urls)
+
+    def load(self) -> bool:
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.meta_path)):
+            return False
+        started = time.perf_counter()
+        try:
+            meta_mtime = os.stat(self.meta_path).st_mtime_ns
+            with np.load(self.matrix_path) as arrays:
+                tf = sp.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape']))
+                passage_articles = arrays['passage_articles']
+                passage_numbers = arrays['passage_numbers']
+                article_offsets = arrays['article_offsets']
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Не удалось прочитать индекс BM25, он будет перестроен: {str(e)}")
+            return False
+        if len(meta['urls']) != len(article_offsets) or tf.shape[0] != len(passage_articles):
+            logger.warning("Индекс BM25 повреждён: размеры не совпадают, он будет перестроен")
+            return False
+
+        # Хвост журнала от сохранения, прерванного до записи матрицы, отрезаем
+        if not self.read_only and os.path.exists(self.articles_path) and os.path.getsize(self.articles_path) > meta['articles_size']:
+            with open(self.articles_path, 'rb+') as f:
+                f.truncate(meta['articles_size'])
+
+        vocab = {term: column for column, term in enumerate(meta['terms'])}
+        snapshot = self._build_snapshot(tf, vocab, passage_articles, passage_numbers, article_offsets)
+        with self._lock:
+            self._snapshot = snapshot
+            self._urls = meta['urls']
+            self._known = set(self._urls)
+            self._pending = {}
+            self._meta_mtime = meta_mtime
+        logger.info(
+            f"Индекс BM25 загружен за {(time.perf_counter() - started) * 1000:.0f} мс: "
+            f"{len(self._urls)} статей, {tf.shape[0]} фрагментов, {len(vocab)} основ"
+        )
+        return True
+
+    def save(self):
+        with self._lock:
+            snapshot = self._snapshot
+            pending = sorted(self._pending.items())
+            urls = list(self._urls)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+        # Новые статьи дописываем в журнал, смещения запоминаем для чтения фрагментов
+        offsets = snapshot.article_offsets.copy()
+        with open(self.articles_path, 'ab') as f:
+            for article_id, article in pending:
+                offsets[article_id] = f.tell()
+                f.write(json.dumps(article, ensure_ascii=False).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+            articles_size = f.tell()
+
+        terms = [None] * len(snapshot.vocab)
+        for term, column in snapshot.vocab.items():
+            terms[column] = term
+
+        # Матрицу и метаданные пишем во временные файлы и подменяем атомарно, метаданные - последними
+        tmp_matrix = f"{self.matrix_path}.tmp.npz"
+        np.savez(
+            tmp_matrix, data=snapshot.tf.data, indices=snapshot.tf.indices, indptr=snapshot.tf.indptr,
+            shape=np.asarray(snapshot.tf.shape), passage_articles=snapshot.passage_articles,
+            passage_numbers=snapshot.passage_numbers, article_offsets=offsets
+        )
+        os.replace(tmp_matrix, self.matrix_path)
+        tmp_meta = f"{self.meta_path}.tmp"
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump({'terms': terms, 'urls': urls[:len(offsets)], 'articles_size': articles_size}, f,
+                      ensure_ascii=False)
+        os.replace(tmp_meta, self.meta_path)
+
+        with self._lock:
+            # Пока шла запись, в индекс могли добавиться статьи - их смещения остаются -1
+            self._snapshot.article_offsets[:len(offsets)] = offsets
+            for article_id, _ in pending:
+                self._pending.pop(article_id, None)
+
+    def add(self, news_data: Iterable[dict]) -> int:
+        """Добавляет в индекс статьи, которых в нём ещё нет, и возвращает их количество"""
+        with self._lock:
+            snapshot = self._snapshot
+            vocab = dict(snapshot.vocab)
+            first_row = snapshot.tf.shape[0]
+            rows, columns, counts, passage_articles, passage_numbers = [], [], [], [], []
+            added = 0
+            for news in news_data:
+                url = news.get('url')
+                if not url or url in self._known:
+                    continue
+                article_id = len(self._urls)
+                article = {'url': url, 'title': news.get('title', ''), 'date': news.get('date'),
+                           'content': news.get('content', '')}
+                self._urls.append(url)
+                self._known.add(url)
+                self._pending[article_id] = article
+                added += 1
+
+                # Заголовок добавляется к каждому фрагменту, чтобы совпадения с ним весили больше
+                title_stems = stem_text(article['title'])
+                for number, text in enumerate(split_passages(article['content']) or [article['title']]):
+                    row = first_row + len(passage_articles)
+                    passage_articles.append(article_id)
+                    passage_numbers.append(number)
+                    for term, count in Counter(title_stems + stem_text(text)).items():
+                        rows.append(row)
+                        columns.append(vocab.setdefault(term, len(vocab)))
+                        counts.append(count)
+
+            if not added:
+                return 0
+
+            shape = (first_row + len(passage_articles), len(vocab))
+            old_tf = snapshot.tf.tocoo()
+            tf = sp.csr_matrix(
+                (np.concatenate([old_tf.data, np.asarray(counts, dtype=np.float32)]),
+                 (np.concatenate([old_tf.row, np.asarray(rows, dtype=np.int32)]),
+                  np.concatenate([old_tf.col, np.asarray(columns, dtype=np.int32)]))),
+                shape=shape, dtype=np.float32
+            )
+            self._snapshot = self._build_snapshot(
+                tf, vocab,
+                np.concatenate([snapshot.passage_articles, np.asarray(passage_articles, dtype=np.int32)]),
+                np.concatenate([snapshot.passage_numbers, np.asarray(passage_numbers, dtype=np.int32)]),
+                np.concatenate([snapshot.article_offsets, np.full(added, -1, dtype=np.int64)])
+            )
+
+        logger.info(f"В индекс BM25 добавлено статей: {added}, фрагментов: {len(passage_articles)}")
+        return added
+
+    def search(self, query: str, limit: int = 3) -> List[dict]:
+        """Лучшие фрагменты по запросу, не больше одного фрагмента на статью"""
+        snapshot = self._current()
+        columns = [snapshot.vocab[term] for term in set(stem_text(query)) if term in snapshot.vocab]
+        if not columns:
+            return []
+
+        scores = np.asarray(snapshot.weights[:, columns].sum(axis=1)).ravel()
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > limit * 4:
+            candidates = candidates[np.argpartition(-scores[candidates], limit * 4)[:limit * 4]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+
+        best = {}
+        for row in candidates:
+            article_id = int(snapshot.passage_articles[row])
+            if article_id not in best:
+                best[article_id] = row
+                if len(best) >= limit:
+                    break
+
+        results = []
+        for article_id, row in best.items():
+            article = self._read_article(snapshot, article_id)
+            if article is None:
+                continue
+            passages = split_passages(article['content']) or [article['title']]
+            results.append({
+                'url': article['url'],
+                'title': article['title'],
+                'date': article['date'],
+                'text': passages[min(int(snapshot.passage_numbers[row]), len(passages) - 1)],
+                'score': float(scores[row])
+            })
+        return results
+
+    def _current(self) -> BM25Snapshot:
+        if self.read_only:
+            now = time.monotonic()
+            if now - self._last_check >= self.check_interval:
+                self._last_check = now
+                try:
+                    mtime = os.stat(self.meta_path).st_mtime_ns
+                except FileNotFoundError:
+                    mtime = None
+                if mtime is not None and mtime != self._meta_mtime:
+                    with self._reload_lock:
+                        if mtime != self._meta_mtime:
+                            self.load()
+        return self._snapshot
+
+    def _read_article(self, snapshot: BM25Snapshot, article_id: int):
+        article = self._pending.get(article_id)
+        if article is not None:
+            return article
+        offset = int(snapshot.article_offsets[article_id])
+        if offset < 0:
+            # Статью только что сохранили, а снимок ещё старый
+            offset = int(self._snapshot.article_offsets[article_id])
+        with open(self.articles_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def _build_snapshot(self, tf: sp.csr_matrix, vocab: Dict[str, int], passage_articles: np.ndarray,
+                        passage_numbers: np.ndarray, article_offsets: np.ndarray) -> BM25Snapshot:
+        documents = tf.shape[0]
+        lengths = np.asarray(tf.sum(axis=1)).ravel()
+        avg_length = lengths.mean() if documents else 1.0
+        df = np.bincount(tf.indices, minlength=tf.shape[1])
+        idf = np.log1p((documents - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        # Веса считаются сразу для всех ненулевых элементов матрицы
+        row_of = np.repeat(np.arange(documents), np.diff(tf.indptr))
+        norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+        data = tf.data * (self.k1 + 1) / (tf.data + norm[row_of]) * idf[tf.indices]
+        weights = sp.csr_matrix((data.astype(np.float32), tf.indices, tf.indptr), shape=tf.shape).tocsc()
+        return BM25Snapshot(
+            tf=tf, weights=weights, vocab=vocab, passage_articles=passage_articles,
+            passage_numbers=passage_numbers, article_offsets=article_offsets
+        )
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "articles": len(self._urls),
+            "passages": int(snapshot.tf.shape[0]),
+            "terms": len(snapshot.vocab),
+            "nonzeros": int(snapshot.tf.nnz),
+            "unsaved": len(self._pending),
+        }
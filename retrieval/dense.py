@@ -0,0 +1,395 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from retrieval.bm25 import split_passages
+from retrieval.encoder import TextEncoder
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк матрицы переводится во float32 за один шаг точного поиска
+SCAN_CHUNK_ROWS = 65536
+ENCODE_BATCH_ARTICLES = 256
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = 20, spherical: bool = False, seed: int = 0) -> np.ndarray:
+    """Простой k-means на NumPy; spherical - центроиды нормируются, близость по косинусу"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=len(data) < k)].copy()
+    for _ in range(iterations):
+        labels = _nearest(data, centroids, spherical)
+        # Суммы по кластерам одним умножением на разреженную матрицу принадлежности
+        membership = sp.csr_matrix((np.ones(len(data), dtype=np.float32), (labels, np.arange(len(data)))),
+                                   shape=(k, len(data)))
+        sums = np.asarray(membership @ data)
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Пустые кластеры переносим на случайные точки
+        centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+        if spherical:
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True).clip(min=1e-12)
+    return centroids.astype(np.float32)
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray, spherical: bool = False) -> np.ndarray:
+    # argmin ||x - c||^2 = argmax (x·c - ||c||^2 / 2), для нормированных центроидов поправка не нужна
+    bias = 0.0 if spherical else 0.5 * (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), 16384):
+        labels[start:start + 16384] = (data[start:start + 16384] @ centroids.T - bias).argmax(axis=1)
+    return labels
+
+
+@dataclass
+class IVFState:
+    generation: int
+    centroids: np.ndarray
+    # Строки матрицы, упорядоченные по спискам, и границы списков в этом порядке
+    list_rows: np.ndarray
+    list_bounds: np.ndarray
+    # Кодовые книги PQ (подпространства x 256 x размерность подпространства) и коды строк
+    codebooks: Optional[np.ndarray] = None
+    codes: Optional[np.ndarray] = None
+
+
+@dataclass
+class DenseSnapshot:
+    count: int = 0
+    dim: int = 0
+    vectors: Optional[np.ndarray] = None
+    offsets: Optional[np.ndarray] = None
+    ivf: Optional[IVFState] = None
+
+
+class DenseIndex:
+    """
+    Семантический поиск по новостям и другим документам университета.
+    Векторы фрагментов лежат в файле float16, который отображается в память (np.memmap) только на чтение,
+    поэтому несколько рабочих процессов делят одни и те же страницы кэша ОС без собственных копий.
+    Файлы только дописываются, число валидных строк хранится в dense_meta.json: читатели видят
+    новые строки после его атомарной замены. Для больших корпусов есть режим IVF
+    (с опциональным product quantization) - сканируются только ближайшие списки.
+    """
+    def __init__(self, encoder: Optional[TextEncoder] = None, index_dir: str = 'data/news_index',
+                 ivf_lists: int = 0, ivf_probe: int = 8, pq_subspaces: int = 0, check_interval: float = 1.0):
+        self.encoder = encoder or TextEncoder()
+        self.index_dir = index_dir
+        self.meta_path = os.path.join(index_dir, 'dense_meta.json')
+        self.vectors_path = os.path.join(index_dir, 'dense_vectors.f16')
+        self.offsets_path = os.path.join(index_dir, 'dense_offsets.i64')
+        self.passages_path = os.path.join(index_dir, 'dense_passages.jsonl')
+        # 0 - точный перебор; иначе число списков IVF, обучаются, когда векторов станет в 39 раз больше
+        self.ivf_lists = ivf_lists
+        self.ivf_probe = ivf_probe
+        self.pq_subspaces = pq_subspaces
+        self.check_interval = check_interval
+        self._meta: dict = {}
+        self._meta_mtime: Optional[int] = None
+        self._last_check = 0.0
+        self._snapshot = DenseSnapshot()
+        self._urls: Optional[set] = None
+        self._write_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    def __len__(self):
+        return self._snapshot.count
+
+    def load(self) -> bool:
+        """Отображает индекс в память; вызывается и в процессах, которые только читают"""
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if meta.get('model_id') != self.encoder.model_id:
+            logger.warning(f"Индекс векторов построен моделью {meta.get('model_id')}, а не {self.encoder.model_id}, "
+                           f"он будет построен заново")
+            return False
+
+        count, dim = meta['count'], meta['dim']
+        snapshot = DenseSnapshot(count=count, dim=dim)
+        if count:
+            snapshot.vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r', shape=(count, dim))
+            snapshot.offsets = np.memmap(self.offsets_path, dtype=np.int64, mode='r', shape=(count,))
+            if meta.get('ivf'):
+                snapshot.ivf = self._load_ivf(meta['ivf'], count)
+        self._meta, self._meta_mtime, self._snapshot = meta, mtime, snapshot
+        return True
+
+    def search(self, query: str, limit: int = 3) -> List[dict]:
+        return self.search_many([query], limit)[0]
+
+    def search_many(self, queries: List[str], limit: int = 3) -> List[List[dict]]:
+        """Top-k по косинусу для нескольких запросов сразу, не больше одного фрагмента на статью"""
+        snapshot = self._current()
+        if not snapshot.count or not queries:
+            return [[] for _ in queries]
+
+        query_vectors = self.encoder.encode_queries(queries)
+        # Берём с запасом: несколько лучших фрагментов могут оказаться из одной статьи
+        candidates = limit * 4
+        if snapshot.ivf is not None:
+            top = [self._search_ivf(snapshot, vector, candidates) for vector in query_vectors]
+        else:
+            top = self._search_exact(snapshot, query_vectors, candidates)
+
+        results = []
+        with open(self.passages_path, 'rb') as f:
+            for rows, scores in top:
+                found, seen = [], set()
+                for row, score in zip(rows, scores):
+                    f.seek(int(snapshot.offsets[row]))
+                    passage = json.loads(f.readline())
+                    if passage['url'] in seen:
+                        continue
+                    seen.add(passage['url'])
+                    found.append({**passage, 'score': float(score)})
+                    if len(found) >= limit:
+                        break
+                results.append(found)
+        return results
+
+    def _search_exact(self, snapshot: DenseSnapshot, query_vectors: np.ndarray, candidates: int):
+        best_rows = np.zeros((len(query_vectors), 0), dtype=np.int64)
+        best_scores = np.zeros((len(query_vectors), 0), dtype=np.float32)
+        for start in range(0, snapshot.count, SCAN_CHUNK_ROWS):
+            block = np.asarray(snapshot.vectors[start:start + SCAN_CHUNK_ROWS], dtype=np.float32)
+            scores = query_vectors @ block.T
+            rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            if best_scores.shape[1] > candidates:
+                keep = np.argpartition(-best_scores, candidates, axis=1)[:, :candidates]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        return [
+            (best_rows[i, order[i]], best_scores[i, order[i]])
+            for i in range(len(query_vectors))
+        ]
+
+    def _search_ivf(self, snapshot: DenseSnapshot, vector: np.ndarray, candidates: int):
+        ivf = snapshot.ivf
+        probe = np.argsort(-(ivf.centroids @ vector))[:self.ivf_probe]
+        rows = np.concatenate([ivf.list_rows[ivf.list_bounds[i]:ivf.list_bounds[i + 1]] for i in probe])
+        if not len(rows):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        # Отсортированные номера строк - последовательное чтение из отображённого файла
+        rows = np.sort(rows)
+        if ivf.codes is not None and len(rows) > candidates * 8:
+            # Грубая оценка по кодам PQ, точные векторы читаем только для лучших кандидатов
+            subspaces, _, sub_dim = ivf.codebooks.shape
+            table = np.einsum('mkd,md->mk', ivf.codebooks, vector[:subspaces * sub_dim].reshape(subspaces, sub_dim))
+            approx = table[np.arange(subspaces), np.asarray(ivf.codes[rows])].sum(axis=1)
+            rows = np.sort(rows[np.argpartition(-approx, candidates * 8)[:candidates * 8]])
+
+        scores = np.asarray(snapshot.vectors[rows], dtype=np.float32) @ vector
+        top = np.argsort(-scores)[:candidates]
+        return rows[top], scores[top]
+
+    def add(self, news_data: Iterable[dict]) -> int:
+        """
+        Кодирует и дописывает в индекс статьи, которых в нём ещё нет. Подходят любые документы
+        с полями url, title и content. Запись пачками: после каждой пачки индекс уже доступен читателям.
+        """
+        with self._write_lock:
+            self._ensure_writable()
+            batch, added = [], 0
+            for news in news_data:
+                url = news.get('url')
+                if not url or url in self._urls:
+                    continue
+                self._urls.add(url)
+                batch.append(news)
+                if len(batch) >= ENCODE_BATCH_ARTICLES:
+                    added += self._append(batch)
+                    batch = []
+            if batch:
+                added += self._append(batch)
+            if added:
+                self._maybe_train_ivf()
+        if added:
+            logger.info(f"В индекс векторов добавлено статей: {added}, фрагментов всего: {self._snapshot.count}")
+        return added
+
+    def _append(self, articles: List[dict]) -> int:
+        passages = []
+        for news in articles:
+            title = news.get('title', '')
+            for text in split_passages(news.get('content', '')) or [title]:
+                passages.append({'url': news['url'], 'title': title, 'date': news.get('date'), 'text': text})
+        vectors = self.encoder.encode_passages([f"{p['title']}. {p['text']}" for p in passages])
+        meta = dict(self._meta) if self._meta else {'model_id': self.encoder.model_id, 'dim': vectors.shape[1],
+                                                     'count': 0, 'passages_size': 0}
+
+        offsets = np.zeros(len(passages), dtype=np.int64)
+        with open(self.passages_path, 'ab') as f:
+            for i, passage in enumerate(passages):
+                offsets[i] = f.tell()
+                f.write(json.dumps(passage, ensure_ascii=False).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+            meta['passages_size'] = f.tell()
+        self._append_raw(self.vectors_path, vectors.astype(np.float16))
+        self._append_raw(self.offsets_path, offsets)
+
+        ivf = self._snapshot.ivf
+        if ivf is not None:
+            generation = meta['ivf']['generation']
+            self._append_raw(self._ivf_path('assign', generation), _nearest(vectors, ivf.centroids, True).astype(np.int32))
+            if ivf.codebooks is not None:
+                self._append_raw(self._ivf_path('codes', generation), self._pq_encode(vectors, ivf.codebooks))
+
+        meta['count'] += len(passages)
+        self._write_meta(meta)
+        return len(articles)
+
+    def _maybe_train_ivf(self):
+        count = self._meta.get('count', 0)
+        trained = self._meta.get('ivf', {}).get('trained_count', 0)
+        if not self.ivf_lists or count < self.ivf_lists * 39 or (trained and count < trained * 2):
+            return
+        started = time.perf_counter()
+        vectors = self._snapshot.vectors
+        rng = np.random.default_rng(0)
+        sample = np.asarray(vectors[np.sort(rng.choice(count, size=min(count, self.ivf_lists * 256), replace=False))],
+                            dtype=np.float32)
+        centroids = _kmeans(sample, self.ivf_lists, spherical=True)
+        codebooks = None
+        if self.pq_subspaces:
+            sub_dim = sample.shape[1] // self.pq_subspaces
+            codebooks = np.stack([
+                _kmeans(sample[:, j * sub_dim:(j + 1) * sub_dim], 256)
+                for j in range(self.pq_subspaces)
+            ])
+
+        generation = self._meta.get('ivf', {}).get('generation', 0) + 1
+        np.savez(self._ivf_path('model', generation), centroids=centroids,
+                 **({'codebooks': codebooks} if codebooks is not None else {}))
+        for start in range(0, count, SCAN_CHUNK_ROWS):
+            block = np.asarray(vectors[start:start + SCAN_CHUNK_ROWS], dtype=np.float32)
+            self._append_raw(self._ivf_path('assign', generation), _nearest(block, centroids, True).astype(np.int32))
+            if codebooks is not None:
+                self._append_raw(self._ivf_path('codes', generation), self._pq_encode(block, codebooks))
+
+        meta = dict(self._meta)
+        meta['ivf'] = {'generation': generation, 'trained_count': count, 'pq': codebooks is not None}
+        self._write_meta(meta)
+        # Файлы прошлого поколения удаляем: открытые отображения у читателей остаются валидными до перезагрузки
+        for path in glob.glob(os.path.join(self.index_dir, 'dense_ivf_*')):
+            if not os.path.basename(path).endswith((f'_{generation}.npz', f'_{generation}.i32', f'_{generation}.u8')):
+                os.remove(path)
+        logger.info(f"IVF обучен за {time.perf_counter() - started:.1f} с: {self.ivf_lists} списков, "
+                    f"PQ {self.pq_subspaces or 'выключен'}, векторов {count}")
+
+    @staticmethod
+    def _pq_encode(vectors: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+        subspaces, _, sub_dim = codebooks.shape
+        return np.stack([
+            _nearest(vectors[:, j * sub_dim:(j + 1) * sub_dim], codebooks[j])
+            for j in range(subspaces)
+        ], axis=1).astype(np.uint8)
+
+    def _load_ivf(self, ivf_meta: dict, count: int) -> IVFState:
+        generation = ivf_meta['generation']
+        with np.load(self._ivf_path('model', generation)) as arrays:
+            centroids = arrays['centroids']
+            codebooks = arrays['codebooks'] if 'codebooks' in arrays else None
+        assign = np.memmap(self._ivf_path('assign', generation), dtype=np.int32, mode='r', shape=(count,))
+        list_rows = np.argsort(assign, kind='stable')
+        list_bounds = np.searchsorted(assign[list_rows], np.arange(len(centroids) + 1))
+        codes = None
+        if codebooks is not None:
+            codes = np.memmap(self._ivf_path('codes', generation), dtype=np.uint8, mode='r',
+                              shape=(count, codebooks.shape[0]))
+        return IVFState(generation, centroids, list_rows, list_bounds, codebooks, codes)
+
+    def _ivf_path(self, kind: str, generation: int) -> str:
+        extension = {'model': 'npz', 'assign': 'i32', 'codes': 'u8'}[kind]
+        return os.path.join(self.index_dir, f'dense_ivf_{kind}_{generation}.{extension}')
+
+    def _current(self) -> DenseSnapshot:
+        """Перечитывает метаданные, если индекс дописал другой процесс"""
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            try:
+                mtime = os.stat(self.meta_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime is not None and mtime != self._meta_mtime:
+                with self._reload_lock:
+                    if mtime != self._meta_mtime:
+                        self.load()
+        return self._snapshot
+
+    def _ensure_writable(self):
+        """Загружает индекс и отрезает хвосты файлов от записи, прерванной до обновления метаданных"""
+        if self._urls is not None:
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+        if not self.load():
+            for path in glob.glob(os.path.join(self.index_dir, 'dense_*')):
+                os.remove(path)
+            self._meta, self._snapshot = {}, DenseSnapshot()
+            self._urls = set()
+            return
+
+        count, dim = self._meta['count'], self._meta['dim']
+        sizes = {
+            self.vectors_path: count * dim * 2,
+            self.offsets_path: count * 8,
+            self.passages_path: self._meta['passages_size'],
+        }
+        if self._meta.get('ivf'):
+            generation = self._meta['ivf']['generation']
+            sizes[self._ivf_path('assign', generation)] = count * 4
+            if self._meta['ivf'].get('pq'):
+                sizes[self._ivf_path('codes', generation)] = count * self.pq_subspaces
+        for path, size in sizes.items():
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, 'rb+') as f:
+                    f.truncate(size)
+
+        self._urls = set()
+        with open(self.passages_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                self._urls.add(json.loads(line)['url'])
+
+    @staticmethod
+    def _append_raw(path: str, array: np.ndarray):
+        with open(path, 'ab') as f:
+            f.write(np.ascontiguousarray(array).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_meta(self, meta: dict):
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+        # Свой процесс видит новые строки сразу, не дожидаясь проверки mtime
+        self.load()
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "passages": snapshot.count,
+            "dim": snapshot.dim,
+            "mode": ("ivf-pq" if snapshot.ivf.codes is not None else "ivf") if snapshot.ivf else "exact",
+            "model_id": self.encoder.model_id,
+        }
@@ -0,0 +1,67 @@
+import logging
+import threading
+from typing import List, Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from transformers import AutoModel, AutoTokenizer
+
+logger = logging.getLogger(__name__)
+
+
+class TextEncoder:
+    """
+    Небольшой многоязычный энкодер предложений для CPU (по умолчанию multilingual-e5-small, 384 измерения).
+    Модель загружается при первом обращении, векторы нормированы, поэтому скалярное произведение равно косинусу.
+    """
+    def __init__(self, model_id: str = "intfloat/multilingual-e5-small", batch_size: int = 32,
+                 max_length: int = 256, num_threads: Optional[int] = None):
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.num_threads = num_threads
+        self.dim: Optional[int] = None
+        self._model = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._model is not None:
+            return
+        with self._lock:
+            if self._model is not None:
+                return
+            if self.num_threads:
+                torch.set_num_threads(self.num_threads)
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_id)
+            model = AutoModel.from_pretrained(self.model_id, torch_dtype=torch.float32)
+            model.eval()
+            self.dim = model.config.hidden_size
+            self._model = model
+            logger.info(f"Энкодер {self.model_id} загружен, размерность {self.dim}")
+
+    def encode_queries(self, texts: List[str]) -> np.ndarray:
+        # Модели семейства e5 обучены с префиксами "query: " и "passage: "
+        return self.encode([f"query: {text}" for text in texts])
+
+    def encode_passages(self, texts: List[str]) -> np.ndarray:
+        return self.encode([f"passage: {text}" for text in texts])
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        self._ensure_loaded()
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = self._tokenizer(
+                texts[start:start + self.batch_size], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="pt"
+            )
+            with torch.inference_mode():
+                hidden = self._model(**batch).last_hidden_state
+            # Усреднение по токенам без паддинга
+            mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            vectors.append(F.normalize(pooled, dim=-1).numpy())
+        if not vectors:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.concatenate(vectors).astype(np.float32)
@@ -1,33 +1,94 @@
+const NEWS_PAGE_SIZE = 20;
+let newsOffset = 0;
+let newsTotal = null;
+let newsLoading = false;
+
+function renderNewsItem(item) {
+    const listItem = document.createElement('li');
+    listItem.classList.add('news-item');
+
+    const image = document.createElement('img');
+    image.src = item.relate_image_link;
+    image.alt = 'News Image';
+    image.loading = 'lazy';
+    image.classList.add('news-image');
+
+    const title = document.createElement('p');
+    title.classList.add('news-title');
+    title.textContent = item.title;
+
+    const text = document.createElement('div');
+    text.classList.add('news-text');
+    text.textContent = item.description;
+
+    // В ленте приходит краткое описание, полный текст подгружаем по клику
+    if (item.id && item.description.endsWith('…')) {
+        const more = document.createElement('button');
+        more.classList.add('news-more');
+        more.textContent = 'Читать полностью';
+        more.addEventListener('click', async () => {
+            more.disabled = true;
+            try {
+                const response = await fetch(`/api/news/${encodeURIComponent(item.id)}`);
+                if (!response.ok) {
+                    throw new Error('Ошибка сети');
+                }
+                const fullItem = await response.json();
+                text.textContent = fullItem.description;
+                more.remove();
+            } catch (error) {
+                console.error('Error fetching news item:', error);
+                more.disabled = false;
+            }
+        });
+        text.appendChild(document.createElement('br'));
+        text.appendChild(more);
+    }
+
+    listItem.appendChild(title); // Затем заголовок
+    listItem.appendChild(image);  // Картинка сверху
+    listItem.appendChild(text);  // Затем описание
+    return listItem;
+}
+
+async function loadMoreNews() {
+    if (newsLoading || (newsTotal !== null && newsOffset >= newsTotal)) {
+        return;
+    }
+    newsLoading = true;
+    try {
+        const response = await fetch(`/api/news?limit=${NEWS_PAGE_SIZE}&offset=${newsOffset}`);
+        if (!response.ok) {
+            throw new Error('Ошибка сети');
+        }
+        newsTotal = parseInt(response.headers.get('X-Total-Count') || '0', 10);
+        const news = await response.json();
+        const newsList = document.querySelector('.news-list');
+        news.forEach(item => newsList.appendChild(renderNewsItem(item)));
+        newsOffset += news.length;
+        if (news.length === 0) {
+            newsTotal = newsOffset;
+        }
+    } catch (error) {
+        console.error('Error fetching news:', error);
+    } finally {
+        newsLoading = false;
+    }
+}
+
 document.addEventListener('DOMContentLoaded', function() {
-    fetch('/api/news')
-        .then(response => response.json())
-        .then(news => {
-            const newsList = document.querySelector('.news-list');
-            news.forEach(item => {
-             const listItem = document.createElement('li');
-                    listItem.classList.add('news-item');
-
-                    const image = document.createElement('img');
-                    image.src = item.relate_image_link;
-                    image.alt = 'News Image';
-                    image.classList.add('news-image');
-
-                    const title = document.createElement('p');
-                    title.classList.add('news-title');
-                    title.textContent = item.title;
-
-                    const text = document.createElement('div');
-                    text.classList.add('news-text');
-                    text.textContent = item.description;
-
-                    listItem.appendChild(title); // Затем заголовок
-                    listItem.appendChild(image);  // Картинка сверху
-                    listItem.appendChild(text);  // Затем описание
-
-                    newsList.appendChild(listItem);
-            });
-        })
-        .catch(error => console.error('Error fetching news:', error));
+    const newsContainer = document.querySelector('.news-container');
+    const sentinel = document.createElement('div');
+    sentinel.classList.add('news-sentinel');
+    newsContainer.appendChild(sentinel);
+
+    // Следующая страница грузится, когда пользователь докрутил ленту до конца
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadMoreNews();
+        }
+    }, { root: newsContainer, rootMargin: '300px' });
+    observer.observe(sentinel);
 })
 
 
@@ -47,32 +108,42 @@ sendButton.addEventListener('click', async () => {
         // Блокируем кнопку
         sendButton.disabled = true;
         
-        // Отправляем запрос на сервер (заглушка)
-        // Здесь будет асинхронный вызов к вашему FastAPI endpoint для чата
-        // Например, fetch('/chat', { method: 'POST', body: JSON.stringify({ message: message }) })
+        // Ответ приходит потоком Server-Sent Events и дорисовывается по мере генерации
+        let botMessage = null;
+        let botText = '';
         try {
-            const response = await fetch('/chat', {
+            const url = currentSessionId
+                ? `/chat/stream?session_id=${encodeURIComponent(currentSessionId)}`
+                : '/chat/stream';
+            const response = await fetch(url, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream',
                 },
                 body: JSON.stringify({
-                    text: message,
-                    session_id: currentSessionId
+                    text: message
                 })
             });
-            
-        // // Задержка для имитации ответа от сервера
-        // setTimeout(() => {
-        //     // Добавляем ответ от бота в историю чата (заглушка)
-        //     addMessage('bot', `Ответ от бота: Вы сказали "${message}"`);
-            if (!response.ok) {
+
+            if (!response.ok || !response.body) {
                 throw new Error('Ошибка сети');
             }
 
-            const data = await response.json();
-            currentSessionId = data.session_id;
-            addMessage('bot', data.response);
+            await readEventStream(response, (event, data) => {
+                if (event === 'session') {
+                    currentSessionId = data.session_id;
+                } else if (event === 'token') {
+                    botText += data.text;
+                    if (!botMessage) {
+                        botMessage = addMessage('bot', botText);
+                    } else {
+                        updateMessage(botMessage, 'bot', botText);
+                    }
+                } else if (event === 'error') {
+                    throw new Error(data.detail);
+                }
+            });
         } catch (error) {
             console.error('Ошибка при отправке сообщения:', error);
             addMessage('system', 'Произошла ошибка при отправке сообщения');
@@ -82,12 +153,41 @@ sendButton.addEventListener('click', async () => {
     }
 });
 
-function addMessage(sender, message) {
-    const messageElement = document.createElement('div');
-    if (sender === 'system') {
-        return;
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        // События разделяются пустой строкой
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            if (data) {
+                onEvent(event, JSON.parse(data));
+            }
+        }
     }
+}
 
+function formatMessage(sender, message) {
     // Определяем, кто отправил сообщение
     let ownerMessage = "Вы: ";
     if (sender === 'bot') {
@@ -95,16 +195,29 @@ function addMessage(sender, message) {
     }
 
     // Заменяем символы новой строки на <br>
-    const formattedMessage = message.replace(/\n/g, '<br>');
+    return ownerMessage + message.replace(/\n/g, '<br>');
+}
+
+function updateMessage(messageElement, sender, message) {
+    messageElement.innerHTML = formatMessage(sender, message);
+    chatHistory.scrollTop = chatHistory.scrollHeight;
+}
+
+function addMessage(sender, message) {
+    const messageElement = document.createElement('div');
+    if (sender === 'system') {
+        return null;
+    }
 
     // Добавляем сообщение в элемент
-    messageElement.innerHTML = ownerMessage + formattedMessage;
+    messageElement.innerHTML = formatMessage(sender, message);
     messageElement.className = `message ${sender}-message`;
     chatHistory.appendChild(messageElement);
     chatHistory.scrollTop = chatHistory.scrollHeight;
 
     // Очищаем текстовое поле после отправки
     document.getElementById('chat-text-area').value = '';
+    return messageElement;
 }
 
 
@@ -0,0 +1,54 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from helpers import answer_cache
+from helpers.answer_cache import AnswerCache, normalize_question
+
+
+class FixedEncoder:
+    """Энкодер с заранее заданными единичными векторами вопросов"""
+    def __init__(self, vectors):
+        self.vectors = {question: np.asarray(vector, dtype=np.float32) / np.linalg.norm(vector)
+                        for question, vector in vectors.items()}
+
+    def encode_queries(self, questions):
+        return np.stack([self.vectors[question] for question in questions])
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Когда приём документов?", "Где приём документов?"),
+    ("Нужно ли общежитие?", "Не нужно общежитие"),
+])
+def test_different_questions_do_not_share_key(first, second):
+    assert normalize_question(first) != normalize_question(second)
+
+    cache = AnswerCache()
+    cache.put(asyncio.run(cache.get(first)), "Ответ на первый вопрос")
+    lookup = asyncio.run(cache.get(second))
+    assert lookup.answer is None
+    # Регистр и пунктуация на ключ не влияют
+    assert asyncio.run(cache.get(first.upper().rstrip("?"))).answer == "Ответ на первый вопрос"
+
+
+def test_expired_best_match_does_not_hide_live_one(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: clock[0])
+    encoder = FixedEncoder({
+        "Сколько стоит обучение?": [1.0, 0.0],
+        "Какая стоимость обучения?": [1.0, 0.05],
+        "Сколько стоит учёба?": [1.0, -0.3],
+    })
+    cache = AnswerCache(encoder=encoder, ttl_seconds=10, min_similarity=0.95)
+
+    cache.put(asyncio.run(cache.get("Какая стоимость обучения?")), "Устаревший ответ")
+    clock[0] += 8
+    cache.put(asyncio.run(cache.get("Сколько стоит учёба?")), "Свежий ответ")
+    clock[0] += 4
+
+    # Ближайшая запись просрочена, но вторая жива и выше порога
+    lookup = asyncio.run(cache.get("Сколько стоит обучение?"))
+    assert lookup.answer == "Свежий ответ"
+    assert lookup.similarity >= 0.95
+    assert cache.stats()["semantic_hits"] == 1
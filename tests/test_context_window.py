@@ -0,0 +1,86 @@
+from models.context_window import ChatContextWindow
+from models.local_ml import MLModel
+from models.message import ChatMessage
+
+
+class CountingTokenizer:
+    """Обёртка над токенизатором, считающая вызовы шаблона и кодирования"""
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.template_calls = 0
+        self.encoded = []
+
+    def apply_chat_template(self, *args, **kwargs):
+        self.template_calls += 1
+        return self.tokenizer.apply_chat_template(*args, **kwargs)
+
+    def encode(self, text, **kwargs):
+        self.encoded.append(text)
+        return self.tokenizer.encode(text, **kwargs)
+
+    def decode(self, *args, **kwargs):
+        return self.tokenizer.decode(*args, **kwargs)
+
+
+def dialog(turns: int) -> list:
+    messages = []
+    for i in range(turns):
+        messages.append(ChatMessage(role="user", content=f"Вопрос {i}: какие документы нужны для поступления в ЧелГУ?"))
+        messages.append(ChatMessage(role="assistant", content=f"Ответ {i}: паспорт, аттестат и заявление о приёме"))
+    messages.append(ChatMessage(role="user", content="А для магистратуры?"))
+    return messages
+
+
+def build(window, messages, context="Приём документов до 20 июля"):
+    return window.build(messages, MLModel._system_prompt(), context, MLModel._question_prompt, session_id="s1")
+
+
+def test_template_applied_once_and_history_counted_once(tokenizer):
+    counting = CountingTokenizer(tokenizer)
+    window = ChatContextWindow(counting, budget=600)
+    messages = dialog(10)
+
+    counting.template_calls = 0
+    inputs, report = build(window, messages)
+    assert counting.template_calls == 1
+    assert inputs.shape[1] <= 600
+    assert report.dropped_messages > 0
+
+    # Следующий ход: кодируются только новые реплики, шаблон снова применяется один раз
+    messages = messages + [ChatMessage(role="assistant", content="Диплом бакалавра"),
+                           ChatMessage(role="user", content="Сроки те же?")]
+    counting.template_calls = 0
+    counting.encoded = []
+    inputs, _ = build(window, messages)
+    assert counting.template_calls == 1
+    assert inputs.shape[1] <= 600
+    history = {message.content for message in messages[:-2]}
+    assert not history & set(counting.encoded)
+
+
+def test_estimate_matches_template(tokenizer):
+    window = ChatContextWindow(tokenizer, budget=4096)
+    messages = dialog(5)
+    inputs, report = build(window, messages)
+    assert report.dropped_messages == 0
+
+    # При любом бюджете от «только вопрос» до «вся история» промпт укладывается в него без повторных проходов шаблона
+    for budget in range(300, inputs.shape[1] + 1, 7):
+        window = ChatContextWindow(tokenizer, budget=budget)
+        inputs, _ = build(window, messages)
+        assert inputs.shape[1] <= budget
+        assert window.stats()["estimate_misses"] == 0
+
+
+def test_underestimate_is_corrected_in_one_pass(tokenizer):
+    counting = CountingTokenizer(tokenizer)
+    window = ChatContextWindow(counting, budget=600)
+    # Шаблон, который на каждой реплике добавляет больше служебных токенов, чем показала проба
+    window._role_overheads = {role: 0 for role in window._role_overheads}
+
+    counting.template_calls = 0
+    inputs, report = build(window, dialog(10))
+    assert counting.template_calls == 2
+    assert inputs.shape[1] <= 600
+    assert report.kept_messages > 1
+    assert window.stats()["estimate_misses"] == 1
@@ -0,0 +1,61 @@
+import json
+
+from parser.data_handler import DataHandler
+
+
+def news(i):
+    return {"url": f"https://www.csu.ru/news/{i}", "title": f"Новость {i}"}
+
+
+def test_reader_skips_partial_tail_without_touching_file(tmp_path):
+    writer = DataHandler(data_dir=str(tmp_path))
+    writer.save([news(1), news(2)])
+    # Парсер в другом процессе дописывает строку прямо сейчас
+    with open(writer.path, "a", encoding="utf-8") as f:
+        f.write('{"url": "https://www.csu.ru/news/3", "ti')
+    size = (tmp_path / "news_data.jsonl").stat().st_size
+
+    reader = DataHandler(data_dir=str(tmp_path))
+    assert [item["url"] for item in reader.load()] == [news(1)["url"], news(2)["url"]]
+    assert reader.known_urls() == {news(1)["url"], news(2)["url"]}
+    assert (tmp_path / "news_data.jsonl").stat().st_size == size
+
+    # Дописанная строка появляется у читателя при следующем чтении
+    with open(writer.path, "a", encoding="utf-8") as f:
+        f.write('tle": "Новость 3"}\n')
+    assert news(3)["url"] in reader.known_urls()
+
+
+def test_writer_repairs_tail_and_sees_other_writers(tmp_path):
+    first = DataHandler(data_dir=str(tmp_path))
+    second = DataHandler(data_dir=str(tmp_path))
+    first.save([news(1)])
+    second.save([news(2)])
+    with open(first.path, "a", encoding="utf-8") as f:
+        f.write('{"url": "оборвано')
+
+    # Первый писатель знает о записи второго и не дублирует её, а обрывок строки отрезается
+    assert first.save([news(2), news(3)]) == 1
+    with open(first.path, encoding="utf-8") as f:
+        assert [json.loads(line)["url"] for line in f] == [news(i)["url"] for i in (1, 2, 3)]
+
+
+def test_duplicates_are_compacted_by_writer(tmp_path):
+    handler = DataHandler(data_dir=str(tmp_path))
+    with open(handler.path, "w", encoding="utf-8") as f:
+        for item in (news(1), news(2), news(1)):
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    # Читатель журнал не переписывает
+    assert len(DataHandler(data_dir=str(tmp_path)).load()) == 3
+    handler.save([news(3)])
+    assert [item["url"] for item in handler.load()] == [news(i)["url"] for i in (1, 2, 3)]
+
+
+def test_legacy_archive_is_migrated_once(tmp_path):
+    with open(tmp_path / "news_data.json", "w", encoding="utf-8") as f:
+        json.dump([news(1), news(1), news(2)], f, ensure_ascii=False)
+
+    reader = DataHandler(data_dir=str(tmp_path))
+    assert [item["url"] for item in reader.load()] == [news(1)["url"], news(2)["url"]]
+    assert DataHandler(data_dir=str(tmp_path)).save([news(2), news(3)]) == 1
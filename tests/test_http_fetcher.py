@@ -0,0 +1,130 @@
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from parser.article_extractor import (
+    extract_news_fields, extract_news_fields_bs4, extract_news_links, extract_news_links_bs4, reprocess_raw_html,
+)
+from parser.http_fetcher import ArticleFetcher
+
+ARTICLE = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>Новости ЧелГУ</title>
+<script>var g_config = {"a": 1};</script></head><body><form>
+<div class="news-rowfield news-header">Заголовок в шапке сайта</div>
+<div id="WebPartWPQ1"><table><tr><td>
+<div class="news-rowfield news-header">  Новость номер {i}  </div>
+<div class="news-rowfield news-date">12.12.2024</div>
+<div class="img-container"><span><img src="/PublishingImages/news{i}.jpg"/></span></div>
+<div class="news-rowfield p-leader"><p>Лид новости {i}.</p></div>
+<div class="news-rowfield p-content"><p>Текст новости {i}.</p></div>
+</td></tr></table></div></form></body></html>"""
+
+LIST_PAGE = """<html><body>
+<div class="nlist-full"><a href="/news/Pages/newsitem1.aspx"><img src="/i1.jpg"/></a><a href="/tags/t1">тег</a></div>
+<div class="nlist-full"><a href="/news/Pages/newsitem2.aspx">Новость 2</a></div>
+<div class="nlist-img"><a href="/news/Pages/newsitem3.aspx">Не из списка</a></div>
+</body></html>"""
+
+
+def article(i: int) -> str:
+    return ARTICLE.replace("{i}", str(i))
+
+
+def expected(i: int, url: str) -> dict:
+    return {
+        "title": f"Новость номер {i}",
+        "date": "12.12.2024",
+        "relate_image": f"/PublishingImages/news{i}.jpg",
+        "content": f"Лид новости {i}.Текст новости {i}.",
+        "url": url,
+    }
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    """Локальное зеркало сохранённых страниц: python -m http.server в отдельном потоке"""
+    pages = tmp_path / "saved_pages"
+    pages.mkdir()
+    for i in (1, 2):
+        (pages / f"newsitem{i}.aspx").write_text(article(i), encoding="utf-8")
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(pages))
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_list_page_links():
+    links = extract_news_links(LIST_PAGE, "https://www.csu.ru")
+    assert links == ["https://www.csu.ru/news/Pages/newsitem1.aspx", "https://www.csu.ru/news/Pages/newsitem2.aspx"]
+    assert links == extract_news_links_bs4(LIST_PAGE, "https://www.csu.ru")
+
+
+def test_fetches_and_parses_saved_pages(mirror, tmp_path):
+    raw_dir = tmp_path / "raw_html"
+    links = [f"{mirror}/newsitem1.aspx", f"{mirror}/missing.aspx", f"{mirror}/newsitem2.aspx"]
+    fetcher = ArticleFetcher(per_host_interval=0, retries=0, raw_html_dir=str(raw_dir))
+
+    news = fetcher.fetch_articles(links)
+
+    # Порядок как у ссылок, 404 пропускается
+    assert news == [expected(1, links[0]), expected(2, links[2])]
+    # Сохранённые страницы разбираются заново без сети с тем же результатом
+    assert sorted(reprocess_raw_html(str(raw_dir), workers=1), key=lambda item: item["url"]) == news
+
+
+def test_fragment_from_browser_matches_full_page():
+    full = extract_news_fields(article(7), "https://www.csu.ru/news/Pages/newsitem7.aspx")
+    fragment = article(7).split('<div id="WebPartWPQ1">', 1)[1].rsplit("</div></form>", 1)[0]
+    assert extract_news_fields(fragment, full["url"]) == full
+    assert extract_news_fields_bs4(article(7), full["url"]) == full
+
+
+class FlakyTransport:
+    """Обработчик для httpx.MockTransport: отдаёт ответы из сценария по ссылкам"""
+    def __init__(self, script):
+        self.script = {url: list(responses) for url, responses in script.items()}
+        self.calls = {url: 0 for url in script}
+
+    def __call__(self, request):
+        url = str(request.url)
+        self.calls[url] += 1
+        response = self.script[url].pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_retries_timeouts_and_server_errors():
+    ok, flaky, missing, down = (f"https://www.csu.ru/news/Pages/newsitem{i}.aspx" for i in range(1, 5))
+    handler = FlakyTransport({
+        ok: [httpx.Response(200, text=article(1))],
+        # Таймаут и 503 временные: после них страница отдаётся
+        flaky: [httpx.ReadTimeout("timed out"), httpx.Response(503), httpx.Response(200, text=article(2))],
+        # 404 окончательный, повторять бесполезно
+        missing: [httpx.Response(404)],
+        down: [httpx.ConnectTimeout("timed out")] * 3,
+    })
+    fetcher = ArticleFetcher(per_host_interval=0, retries=2, transport=httpx.MockTransport(handler))
+
+    news = fetcher.fetch_articles([ok, flaky, missing, down])
+
+    assert news == [expected(1, ok), expected(2, flaky)]
+    assert handler.calls == {ok: 1, flaky: 3, missing: 1, down: 3}
+
+
+def test_client_timeout_is_applied():
+    timeouts = []
+
+    def handler(request):
+        timeouts.append(request.extensions["timeout"])
+        return httpx.Response(200, text=article(1))
+
+    fetcher = ArticleFetcher(per_host_interval=0, timeout=2.5, transport=httpx.MockTransport(handler))
+    fetcher.fetch_articles(["https://www.csu.ru/news/Pages/newsitem1.aspx"])
+    assert timeouts == [{"connect": 2.5, "read": 2.5, "write": 2.5, "pool": 2.5}]
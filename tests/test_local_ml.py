@@ -0,0 +1,172 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+import torch
+from fastapi.testclient import TestClient
+
+import main
+from helpers.session_store import MemorySessionStore
+from models.context_window import ChatContextWindow
+from models.local_ml import MLModel, ModelConfig
+from models.message import ChatMessage
+
+SEARCH_CONTEXT = "Источник: https://www.csu.ru/news"
+
+
+class FailingModel:
+    """Модель, у которой генерация падает после нескольких токенов, как при нехватке памяти CUDA"""
+    device = torch.device("cpu")
+
+    def __init__(self, tokenizer):
+        self.generation_config = SimpleNamespace(eos_token_id=tokenizer.eos_token_id)
+        self.partial_ids = tokenizer.encode("Челябинский", add_special_tokens=False)
+
+    def generate(self, inputs, streamer=None, **kwargs):
+        if streamer is not None:
+            streamer.put(inputs.cpu())
+            streamer.put(torch.tensor(self.partial_ids))
+        raise RuntimeError("CUDA out of memory")
+
+    def forward(self, input_ids=None, **kwargs):
+        raise RuntimeError("CUDA out of memory")
+
+    __call__ = forward
+
+
+class ScriptedModel:
+    """Модель, которая всегда отвечает заданным текстом (пустая строка - ни одного нового токена)"""
+    device = torch.device("cpu")
+
+    def __init__(self, tokenizer, text: str):
+        self.generation_config = SimpleNamespace(eos_token_id=tokenizer.eos_token_id)
+        self.reply_ids = tokenizer.encode(text, add_special_tokens=False)
+
+    def generate(self, inputs, streamer=None, **kwargs):
+        reply = torch.tensor([self.reply_ids], dtype=inputs.dtype)
+        if streamer is not None:
+            streamer.put(inputs.cpu())
+            if self.reply_ids:
+                streamer.put(reply[0])
+            streamer.end()
+        return SimpleNamespace(sequences=torch.cat([inputs, reply], dim=-1), past_key_values=None)
+
+
+def make_ml_model(tokenizer, model, batching: bool, answer_cache_size: int = 0) -> MLModel:
+    ml_model = MLModel(ModelConfig(batching_enabled=batching, kv_cache_max_mb=0, answer_cache_size=answer_cache_size))
+    ml_model.tokenizer = tokenizer
+    ml_model.model = model
+    ml_model.context_window = ChatContextWindow(tokenizer, budget=1024)
+    ml_model._start_scheduler()
+    ml_model._is_initialized = True
+
+    async def search_context(user_message: str) -> str:
+        return SEARCH_CONTEXT
+
+    ml_model.get_search_context = search_context
+    return ml_model
+
+
+async def collect(stream) -> list:
+    return [chunk async for chunk in stream]
+
+
+@pytest.mark.parametrize("batching", [False, True])
+def test_stream_reraises_generation_error(tokenizer, batching):
+    ml_model = make_ml_model(tokenizer, FailingModel(tokenizer), batching)
+    chunks = []
+
+    async def run():
+        async for chunk in ml_model.stream_response([ChatMessage(role="user", content="Привет")]):
+            chunks.append(chunk)
+
+    try:
+        with pytest.raises(RuntimeError, match="CUDA out of memory"):
+            asyncio.run(run())
+        # Ссылки из контекста идут только после успешной генерации
+        assert SEARCH_CONTEXT not in "".join(chunks)
+    finally:
+        ml_model.cleanup()
+
+
+@pytest.mark.parametrize("batching", [False, True])
+def test_generate_reraises_generation_error(tokenizer, batching):
+    ml_model = make_ml_model(tokenizer, FailingModel(tokenizer), batching)
+    try:
+        with pytest.raises(RuntimeError, match="CUDA out of memory"):
+            asyncio.run(ml_model.generate_response([ChatMessage(role="user", content="Привет")]))
+    finally:
+        ml_model.cleanup()
+
+
+def test_chat_stream_sends_error_and_skips_history(tokenizer, monkeypatch):
+    ml_model = make_ml_model(tokenizer, FailingModel(tokenizer), batching=False)
+    store = MemorySessionStore()
+    monkeypatch.setattr(main, "ml_model", ml_model)
+    monkeypatch.setattr(main, "session_store", store)
+
+    response = TestClient(main.app).post("/chat/stream", params={"session_id": "s1"}, json={"text": "Привет"})
+
+    events = [block.split("\n")[0].removeprefix("event: ") for block in response.text.strip().split("\n\n")]
+    assert events[0] == "session"
+    assert events[-1] == "error"
+    assert "done" not in events
+    last = json.loads(response.text.strip().split("\n\n")[-1].split("data: ", 1)[1])
+    assert "CUDA out of memory" in last["detail"]
+    assert store.get("s1").messages == []
+
+
+def test_failed_stream_is_not_cached(tokenizer):
+    ml_model = make_ml_model(tokenizer, FailingModel(tokenizer), batching=False, answer_cache_size=16)
+    question = [ChatMessage(role="user", content="Какие документы нужны для поступления?")]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect(ml_model.stream_response(question)))
+    assert len(ml_model.answer_cache) == 0
+
+    # Следующий такой же вопрос снова идёт в модель, а не получает пустой ответ из кэша
+    ml_model.model = ScriptedModel(tokenizer, "Паспорт и аттестат")
+    chunks = asyncio.run(collect(ml_model.stream_response(question)))
+    assert "".join(chunks) == f"Паспорт и аттестат\n{SEARCH_CONTEXT}"
+    assert len(ml_model.answer_cache) == 1
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_empty_answer_is_not_cached(tokenizer, streaming):
+    ml_model = make_ml_model(tokenizer, ScriptedModel(tokenizer, ""), batching=False, answer_cache_size=16)
+    question = [ChatMessage(role="user", content="Есть ли общежитие?")]
+
+    if streaming:
+        asyncio.run(collect(ml_model.stream_response(question)))
+    else:
+        asyncio.run(ml_model.generate_response(question))
+    assert len(ml_model.answer_cache) == 0
+    assert ml_model.answer_cache.stats()["misses"] == 1
+
+
+@pytest.mark.parametrize("batching", [False, True])
+def test_second_turn_reuses_system_prompt_and_history(tokenizer, tiny_model, batching):
+    ml_model = MLModel(ModelConfig(batching_enabled=batching, max_tokens=8, answer_cache_size=0))
+    ml_model.tokenizer = tokenizer
+    ml_model.model = tiny_model
+    ml_model.context_window = ChatContextWindow(tokenizer, budget=1024)
+    ml_model._start_scheduler()
+    question = ChatMessage(role="user", content="Какие документы нужны для поступления?")
+
+    async def dialog():
+        answer = await ml_model.generate_reply([question], "Приём документов до 20 июля", session_id="s1")
+        history = [question, ChatMessage(role="assistant", content=answer), ChatMessage(role="user", content="А в магистратуру?")]
+        await ml_model.generate_reply(history, "Магистратура: вступительные испытания", session_id="s1")
+
+    try:
+        asyncio.run(dialog())
+        system_only = tokenizer.apply_chat_template([ChatMessage(role="system", content=ml_model._system_prompt())])
+        question_tokens = len(tokenizer.encode(question.content, add_special_tokens=False))
+        stats = ml_model.kv_cache.stats()
+        # Контекст поиска меняется от хода к ходу, но стоит в последнем вопросе: системный промпт
+        # и первый вопрос на втором ходу берутся из кэша
+        assert stats["hits"] == 1
+        assert stats["reused_tokens"] >= len(system_only) + question_tokens
+    finally:
+        ml_model.cleanup()
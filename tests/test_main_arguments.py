@@ -0,0 +1,22 @@
+import sys
+
+import pytest
+
+import main
+
+
+def parse(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["main.py", *argv])
+    return main.parse_arguments()
+
+
+def test_workers_require_inference_socket(monkeypatch, capsys):
+    with pytest.raises(SystemExit):
+        parse(monkeypatch, "--workers", "4")
+    assert "--inference-socket" in capsys.readouterr().err
+
+
+def test_workers_with_inference_socket(monkeypatch):
+    args = parse(monkeypatch, "--workers", "4", "--inference-socket", "/tmp/inference.sock")
+    assert args.workers == 4
+    assert parse(monkeypatch).workers == 1
@@ -0,0 +1,43 @@
+import asyncio
+
+from models.query_rewriter import QueryRewriter
+
+# Вопрос без темы из TOPIC_STEMS: правилами не разбирается и уходит в LLM
+QUESTION = "Что там с этим мероприятием в субботу?"
+
+
+class FlakyLLM:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    async def __call__(self, user_message: str) -> str:
+        self.calls += 1
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+def test_llm_failure_falls_back_without_caching():
+    llm = FlakyLLM([RuntimeError("CUDA out of memory"), "ЧелГУ мероприятие суббота"])
+    rewriter = QueryRewriter(llm)
+
+    assert asyncio.run(rewriter.rewrite(QUESTION)) == QueryRewriter.fallback_query(QUESTION)
+    assert len(rewriter.cache) == 0
+
+    # Сбой был временным: следующий такой же вопрос снова идёт в LLM, и уже её ответ попадает в кэш
+    assert asyncio.run(rewriter.rewrite(QUESTION)) == "ЧелГУ мероприятие суббота"
+    assert asyncio.run(rewriter.rewrite(QUESTION)) == "ЧелГУ мероприятие суббота"
+    assert llm.calls == 2
+    assert rewriter.stats()["llm_errors"] == 1
+    assert rewriter.stats()["cache_hits"] == 1
+
+
+def test_empty_llm_reply_is_not_cached():
+    llm = FlakyLLM(["  ", "ЧелГУ мероприятие"])
+    rewriter = QueryRewriter(llm)
+
+    assert asyncio.run(rewriter.rewrite(QUESTION)) == QueryRewriter.fallback_query(QUESTION)
+    assert asyncio.run(rewriter.rewrite(QUESTION)) == "ЧелГУ мероприятие"
+    assert llm.calls == 2
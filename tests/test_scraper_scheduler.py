@@ -0,0 +1,30 @@
+import asyncio
+
+from helpers import scraper_scheduler
+from helpers.scraper_scheduler import ScraperConfig, ScraperScheduler
+
+
+def test_spawn_failure_is_logged_and_retried(monkeypatch, caplog):
+    calls = []
+
+    async def failing_exec(*command, **kwargs):
+        calls.append(command)
+        raise OSError("No such file or directory: 'python'")
+
+    monkeypatch.setattr(scraper_scheduler.asyncio, "create_subprocess_exec", failing_exec)
+    scheduler = ScraperScheduler(ScraperConfig(enabled=True, interval_minutes=0.0002))
+
+    async def run():
+        task = asyncio.create_task(scheduler.run_forever())
+        while len(calls) < 2 and not task.done():
+            await asyncio.sleep(0.005)
+        # Задача пережила сбой запуска и ушла на следующий круг
+        assert not task.done()
+        task.cancel()
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert scheduler.last_result["status"] == "error"
+    assert "No such file or directory" in scheduler.last_result["error"]
+    assert scheduler.stats()["running"] is False
+    assert "Не удалось запустить парсер новостей" in caplog.text
@@ -0,0 +1,41 @@
+import json
+import threading
+import time
+
+from helpers.search_cache import SearchCache
+
+
+def make_cache(path, worker: int) -> SearchCache:
+    cache = SearchCache(client=None, persist_path=str(path))
+    for i in range(200):
+        cache._entries[f"запрос {worker} {i}"] = ([{"url": f"https://www.csu.ru/{worker}/{i}"}], time.time())
+    return cache
+
+
+def test_concurrent_saves_leave_valid_file(tmp_path):
+    path = tmp_path / "search_cache.json"
+    # Как при --workers: несколько процессов сохраняют кэш в один файл одновременно
+    caches = [make_cache(path, worker) for worker in range(4)]
+    errors = []
+
+    def save_many(cache):
+        try:
+            for _ in range(20):
+                cache.save()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save_many, args=(cache,)) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with open(path, encoding="utf-8") as f:
+        assert len(json.load(f)) == 200
+    assert [p.name for p in tmp_path.iterdir()] == ["search_cache.json"]
+
+    loaded = SearchCache(client=None, persist_path=str(path))
+    loaded.load()
+    assert len(loaded._entries) == 200
@@ -0,0 +1,114 @@
+import asyncio
+
+import httpx
+import pytest
+
+from helpers.search_client import SearchError, YandexSearchClient
+
+SEARCH_XML = """<?xml version="1.0" encoding="utf-8"?>
+<yandexsearch version="1.0"><response><results><grouping>
+<group><doc><url>https://www.csu.ru/abiturient</url><title>Приём в <hlword>ЧелГУ</hlword></title>
+<headline>Документы для поступления</headline></doc></group>
+<group><doc><url>https://www.csu.ru/news</url><title>Новости</title></doc></group>
+</grouping></results></response></yandexsearch>"""
+
+
+def make_client(handler, **kwargs) -> YandexSearchClient:
+    return YandexSearchClient(base_url="https://yandex.test/search/xml", params={"lr": "56"},
+                              transport=httpx.MockTransport(handler), **kwargs)
+
+
+def test_search_parses_response_and_reuses_pool():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, text=SEARCH_XML)
+
+    client = make_client(handler)
+
+    async def run():
+        first = await client.search("поступление")
+        pool = client._client
+        second = await client.search("общежитие", limit=1)
+        assert client._client is pool
+        await client.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == [
+        {"headline": "Документы для поступления", "url": "https://www.csu.ru/abiturient", "title": "Приём в ЧелГУ"},
+        {"headline": None, "url": "https://www.csu.ru/news", "title": "Новости"},
+    ]
+    assert [item["url"] for item in second] == ["https://www.csu.ru/abiturient"]
+    assert [request.url.params["query"] for request in requests] == ["поступление", "общежитие"]
+    assert all(request.url.params["lr"] == "56" for request in requests)
+
+
+def test_timeouts_default_and_per_request():
+    timeouts = []
+
+    def handler(request):
+        timeouts.append(request.extensions["timeout"])
+        return httpx.Response(200, text=SEARCH_XML)
+
+    client = make_client(handler, timeout=5.0)
+
+    async def run():
+        await client.search("поступление")
+        await client.search("поступление", timeout=1.5)
+        await client.close()
+
+    asyncio.run(run())
+    assert timeouts[0] == {"connect": 3.0, "read": 5.0, "write": 5.0, "pool": 5.0}
+    assert timeouts[1] == {"connect": 1.5, "read": 1.5, "write": 1.5, "pool": 1.5}
+
+
+@pytest.mark.parametrize("failure", [
+    httpx.ReadTimeout("timed out"),
+    httpx.ConnectError("connection refused"),
+    httpx.Response(503, text="Service Unavailable"),
+])
+def test_failures_raise_search_error_without_retry(failure):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if isinstance(failure, Exception):
+            raise failure
+        return failure
+
+    client = make_client(handler)
+
+    async def run():
+        try:
+            # Повторов нет: ошибка сразу уходит вызывающему коду, он не ждёт лишние таймауты
+            with pytest.raises(SearchError):
+                await client.search("поступление")
+        finally:
+            await client.close()
+
+    asyncio.run(run())
+    assert len(calls) == 1
+
+
+def test_concurrency_is_limited():
+    active = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return httpx.Response(200, text=SEARCH_XML)
+
+    client = make_client(handler, max_concurrency=2)
+
+    async def run():
+        await asyncio.gather(*(client.search(f"запрос {i}") for i in range(8)))
+        await client.close()
+
+    asyncio.run(run())
+    assert peak == 2
@@ -0,0 +1,71 @@
+import sqlite3
+from datetime import timedelta
+
+import pytest
+
+from helpers.session_store import SessionStore, SQLiteSessionStore
+from models.message import ChatMessage
+
+
+def turn(question: str, answer: str):
+    return ChatMessage(role="user", content=question), ChatMessage(role="assistant", content=answer)
+
+
+def scanned_totals(path: str):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*), COALESCE(SUM(chars), 0) FROM sessions").fetchone()
+
+
+def test_base_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_sqlite_totals_follow_writes_from_all_processes(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    first = SQLiteSessionStore(path=path, max_history_length=4)
+    # Второй экземпляр на той же базе - как другой рабочий процесс uvicorn
+    second = SQLiteSessionStore(path=path, max_history_length=4)
+
+    history = first.get_or_create("a")
+    first.append(history, *turn("вопрос", "ответ"))
+    other = second.get_or_create("b")
+    second.append(other, *turn("привет", "здравствуйте"))
+    # Обрезка истории до max_history_length уменьшает объём текста
+    for i in range(3):
+        first.append(history, *turn(f"вопрос {i}", f"ответ {i}"))
+    first.get_or_create("a")
+
+    assert first.stats()["sessions"] == second.stats()["sessions"] == 2
+    assert (len(first), first.stats()["total_chars"]) == scanned_totals(path)
+    first.close()
+    second.close()
+
+
+def test_sqlite_eviction_and_sweep_keep_totals(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SQLiteSessionStore(path=path, max_sessions=3)
+    for i in range(5):
+        store.append(store.get_or_create(f"s{i}"), *turn(f"вопрос {i}", "ответ"))
+    assert len(store) == 3
+    assert store.evicted == 2
+    assert (len(store), store.stats()["total_chars"]) == scanned_totals(path)
+
+    store.max_age = timedelta(seconds=-1)
+    assert store.sweep() == 3
+    assert (len(store), store.stats()["total_chars"]) == (0, 0) == scanned_totals(path)
+    store.close()
+
+
+def test_sqlite_totals_backfilled_for_existing_database(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SQLiteSessionStore(path=path)
+    store.append(store.get_or_create("a"), *turn("вопрос", "ответ"))
+    store.close()
+    # База от прошлой версии: счётчиков ещё нет
+    with sqlite3.connect(path) as conn:
+        conn.execute("DROP TABLE session_totals")
+
+    reopened = SQLiteSessionStore(path=path)
+    assert (len(reopened), reopened.stats()["total_chars"]) == (1, len("вопрос") + len("ответ"))
+    reopened.close()